@@ -17,8 +17,8 @@ import threading
 class PhoneTrackerApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.config = Config()
         self.storage = Storage()
+        self.config = Config(self.storage)
         self.running = False
         
         # Services
@@ -142,8 +142,9 @@ class PhoneTrackerApp(App):
         
         # Send device info immediately and periodically
         self.device_service.send_device_info()
+        # Off the main thread: uploads may wait to retry
         Clock.schedule_interval(
-            lambda dt: self.device_service.send_device_info(),
+            lambda dt: threading.Thread(target=self.device_service.send_device_info, daemon=True).start(),
             300  # Every 5 minutes
         )
         
@@ -1,6 +1,7 @@
 # android_app/services/device_service.py
 from kivy.utils import platform
 import requests
+from utils.http import post_json
 
 if platform == 'android':
     from jnius import autoclass, cast
@@ -137,14 +138,9 @@ class DeviceService:
                 return
             
             url = f"{self.config.get_server_url()}/device"
-            response = requests.post(
-                url,
-                json=device_info,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
+            response = post_json(self.config, url, device_info)
             
-            if response.status_code == 201:
+            if response.status_code in (201, 202):
                 self.log('Device info sent successfully')
             else:
                 self.log(f'Device info send failed: {response.status_code}')
@@ -1,8 +1,11 @@
 # android_app/services/location_service.py
 from kivy.utils import platform
-from kivy.clock import Clock
+from collections import deque
 import requests
-import json
+import threading
+import time
+from utils import location_codec
+from utils.http import post, post_json, retry_after
 
 if platform == 'android':
     from plyer import gps
@@ -13,6 +16,15 @@ class LocationService:
         self.log = log_callback
         self.running = False
         self.last_location = None
+        # Fixes waiting for the upload thread. Kept while the server is
+        # unreachable; past max_pending the oldest are dropped
+        self.max_pending = 1000
+        self.pending = deque(maxlen=self.max_pending)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        # No batch is sent before this time (monotonic) after a failure
+        self.retry_at = 0
         
     def start(self):
         if platform != 'android':
@@ -21,8 +33,12 @@ class LocationService:
         
         self.running = True
         try:
+            # Uploads run on their own thread: GPS callbacks come in on the
+            # main thread, which must not wait for the network
+            self.thread = threading.Thread(target=self._upload_loop, daemon=True)
+            self.thread.start()
             gps.configure(on_location=self.on_location)
-            gps.start(minTime=500, minDistance=10)  # Update every 5s or 10m
+            gps.start(minTime=5000, minDistance=10)  # Update every 5s or 10m
             self.log('Location tracking started')
         except Exception as e:
             self.log(f'Error starting location: {str(e)}')
@@ -32,6 +48,10 @@ class LocationService:
             try:
                 gps.stop()
                 self.running = False
+                # The upload thread makes a last attempt at what is pending
+                self.wakeup.set()
+                if self.thread:
+                    self.thread.join(timeout=2)
                 self.log('Location tracking stopped')
             except Exception as e:
                 self.log(f'Error stopping location: {str(e)}')
@@ -48,26 +68,51 @@ class LocationService:
                 'altitude': kwargs.get('altitude'),
                 'accuracy': kwargs.get('accuracy'),
                 'speed': kwargs.get('speed'),
-                'bearing': kwargs.get('bearing')
+                'bearing': kwargs.get('bearing'),
+                'timestamp': int(time.time() * 1000),
+                'client_seq': self.config.next_client_seq()
             }
             
             self.last_location = location_data
-            self.send_location(location_data)
+            with self.lock:
+                self.pending.append(location_data)
+                ready = (self.config.upload_format != 'binary'
+                         or len(self.pending) >= self.config.batch_size)
+            if ready:
+                self.wakeup.set()
             
         except Exception as e:
             self.log(f'Location error: {str(e)}')
     
+    def _upload_loop(self):
+        """Send pending fixes: each one as it comes in 'json' mode, batches
+        every batch_interval seconds (or batch_size fixes) in 'binary' mode"""
+        while True:
+            self.wakeup.wait(self.config.batch_interval)
+            self.wakeup.clear()
+            stopping = not self.running
+            try:
+                if self.config.upload_format == 'binary':
+                    if stopping or time.monotonic() >= self.retry_at:
+                        self.flush()
+                else:
+                    while True:
+                        with self.lock:
+                            if not self.pending:
+                                break
+                            location_data = self.pending.popleft()
+                        self.send_location(location_data)
+            except Exception as e:
+                self.log(f'Error uploading locations: {str(e)}')
+            if stopping:
+                return
+    
     def send_location(self, location_data):
         try:
             url = f"{self.config.get_server_url()}/location"
-            response = requests.post(
-                url,
-                json=location_data,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
+            response = post_json(self.config, url, location_data)
             
-            if response.status_code == 201:
+            if response.status_code in (201, 202):
                 self.log(f'Location sent: {location_data["latitude"]:.4f}, {location_data["longitude"]:.4f}')
             else:
                 self.log(f'Location send failed: {response.status_code}')
@@ -75,4 +120,54 @@ class LocationService:
         except requests.exceptions.RequestException as e:
             self.log(f'Network error sending location: {str(e)}')
         except Exception as e:
-            self.log(f'Error sending location: {str(e)}')
\ No newline at end of file
+            self.log(f'Error sending location: {str(e)}')
+    
+    def flush(self):
+        """Send buffered fixes as binary batches of up to batch_size (on the
+        upload thread); the server charges a token per fix and refuses
+        batches bigger than a device's bucket.
+        
+        A failed batch, and everything after it, goes back to the front of
+        the queue for the next flush, which is its only retry; after a
+        429/503 the next flush waits for the server's Retry-After.
+        """
+        with self.lock:
+            fixes = list(self.pending)
+            self.pending.clear()
+        size = max(1, self.config.batch_size)
+        for start in range(0, len(fixes), size):
+            if not self.send_location_batch(fixes[start:start + size]):
+                with self.lock:
+                    newer = list(self.pending)
+                    self.pending.clear()
+                    self.pending.extend(fixes[start:] + newer)
+                return
+    
+    def send_location_batch(self, batch):
+        """Returns False if the batch should be kept and retried"""
+        try:
+            url = f"{self.config.get_server_url()}/locations/batch"
+            response = post(
+                self.config,
+                url,
+                location_codec.encode(self.config.get_device_id(), batch),
+                location_codec.CONTENT_TYPE,
+                retries=0
+            )
+            
+            delay = retry_after(response)
+            if delay is not None:
+                self.retry_at = time.monotonic() + min(delay, self.config.retry_after_max)
+            if response.status_code in (201, 202):
+                self.log(f'Sent {len(batch)} locations')
+                return True
+            self.log(f'Location batch failed: {response.status_code}')
+            # Only server-side failures and rate limiting are worth retrying;
+            # a rejected batch would be rejected again
+            return response.status_code < 500 and response.status_code != 429
+        except requests.exceptions.RequestException as e:
+            self.log(f'Network error sending locations: {str(e)}')
+            return False
+        except Exception as e:
+            self.log(f'Error sending locations: {str(e)}')
+            return True
\ No newline at end of file
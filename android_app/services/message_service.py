@@ -3,6 +3,7 @@ from kivy.utils import platform
 import requests
 import threading
 import time
+from utils.http import post_json
 
 if platform == 'android':
     from jnius import autoclass, cast
@@ -75,6 +76,7 @@ class MessageService:
                 count = 0
                 while count < 50:  # Get last 50 messages
                     try:
+                        id_idx = cursor.getColumnIndex('_id')
                         address_idx = cursor.getColumnIndex('address')
                         body_idx = cursor.getColumnIndex('body')
                         date_idx = cursor.getColumnIndex('date')
@@ -86,6 +88,9 @@ class MessageService:
                         date = cursor.getLong(date_idx) if date_idx >= 0 else 0
                         msg_type = cursor.getInt(type_idx) if type_idx >= 0 else 0
                         read = cursor.getInt(read_idx) if read_idx >= 0 else 0
+                        # The SMS row id keeps re-reads and retries of the
+                        # same message from being stored twice
+                        sms_id = cursor.getLong(id_idx) if id_idx >= 0 else None
                         
                         # Type 1 = received, 2 = sent
                         message_type = 'received' if msg_type == 1 else 'sent'
@@ -97,7 +102,8 @@ class MessageService:
                             'message_body': body,
                             'message_type': message_type,
                             'timestamp': date,
-                            'read_status': read == 1
+                            'read_status': read == 1,
+                            'client_seq': sms_id
                         })
                         
                     except Exception as e:
@@ -119,14 +125,9 @@ class MessageService:
     def send_message(self, message_data):
         try:
             url = f"{self.config.get_server_url()}/message"
-            response = requests.post(
-                url,
-                json=message_data,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
+            response = post_json(self.config, url, message_data)
             
-            if response.status_code == 201:
+            if response.status_code in (201, 202):
                 sender = message_data.get('sender', 'Unknown')
                 self.log(f'Message sent: from {sender}')
             else:
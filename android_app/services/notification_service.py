@@ -3,6 +3,7 @@ from kivy.utils import platform
 import requests
 import threading
 import time
+from utils.http import post_json
 
 if platform == 'android':
     from jnius import autoclass, PythonJavaClass, java_method
@@ -38,6 +39,7 @@ class NotificationService:
     
     def add_notification(self, notification_data):
         """Called when a new notification is received"""
+        notification_data.setdefault('client_seq', self.config.next_client_seq())
         self.notification_queue.append(notification_data)
     
     def _process_notifications(self):
@@ -57,14 +59,9 @@ class NotificationService:
     def send_notification(self, notification_data):
         try:
             url = f"{self.config.get_server_url()}/notification"
-            response = requests.post(
-                url,
-                json=notification_data,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
+            response = post_json(self.config, url, notification_data)
             
-            if response.status_code == 201:
+            if response.status_code in (201, 202):
                 app_name = notification_data.get('app_name', 'Unknown')
                 self.log(f'Notification sent: {app_name}')
             else:
@@ -1,4 +1,5 @@
 # android_app/utils/config.py
+import threading
 import uuid
 from kivy.utils import platform
 
@@ -8,9 +9,30 @@ if platform == 'android':
     PythonActivity = autoclass('org.kivy.android.PythonActivity')
 
 class Config:
-    def __init__(self):
+    def __init__(self, storage):
+        self.storage = storage
         self.server_url = ''
         self.device_id = self._get_or_create_device_id()
+        # 'json' posts every fix; 'binary' batches fixes in the compact
+        # location_codec format
+        self.upload_format = 'json'
+        self.batch_size = 20
+        self.batch_interval = 30
+        # gzip request bodies of at least compress_min_size bytes
+        # (responses are decompressed by requests automatically)
+        self.compress_uploads = False
+        self.compress_min_size = 512
+        # Uploads carry a client_seq so the server stores retried ones once;
+        # failed posts (network errors, 5xx, 429) are retried with backoff,
+        # waiting for the server's Retry-After up to retry_after_max seconds
+        self.upload_retries = 3
+        self.retry_backoff = 1.0
+        self.retry_after_max = 60
+        # Sequence numbers are reserved from storage this many at a time
+        self.client_seq_block = 1000
+        self._next_client_seq = 0
+        self._client_seq_end = 0
+        self._seq_lock = threading.Lock()
         
     def _get_or_create_device_id(self):
         """Get unique device ID"""
@@ -41,4 +63,27 @@ class Config:
         self.server_url = url.rstrip('/')
     
     def get_server_url(self):
-        return self.server_url
\ No newline at end of file
+        return self.server_url
+    
+    def next_client_seq(self):
+        """Increasing upload sequence number for this device.
+        
+        Numbers come from blocks reserved in storage, so they are never
+        reused after a restart, whatever the clock does. A crash only skips
+        the rest of the current block.
+        """
+        with self._seq_lock:
+            if self._next_client_seq >= self._client_seq_end:
+                self._next_client_seq = self.storage.reserve_client_seqs(self.client_seq_block)
+                self._client_seq_end = self._next_client_seq + self.client_seq_block
+            client_seq = self._next_client_seq
+            self._next_client_seq += 1
+            return client_seq
+    
+    def set_upload_format(self, upload_format):
+        if upload_format not in ('json', 'binary'):
+            raise ValueError(f'Unknown upload format: {upload_format}')
+        self.upload_format = upload_format
+    
+    def get_upload_format(self):
+        return self.upload_format
\ No newline at end of file
@@ -0,0 +1,56 @@
+# android_app/utils/http.py
+import gzip
+import json
+import random
+import time
+import requests
+
+
+def retry_after(response):
+    """Seconds from a Retry-After header, None if absent or not a number"""
+    try:
+        return max(0.0, float(response.headers['Retry-After']))
+    except (KeyError, ValueError):
+        return None
+
+
+def post(config, url, body, content_type, timeout=10, retries=None):
+    """POST raw bytes, gzip-compressed when the config enables it.
+    
+    Network errors, 5xx and 429 responses are retried up to ``retries``
+    times (default ``config.upload_retries``) with jittered exponential
+    backoff, or after the server's Retry-After (at most
+    ``config.retry_after_max`` seconds) when it sends one. That is only
+    safe because uploads carry a client_seq: a request that reached the
+    server but whose response was lost is not stored twice.
+    
+    Retries sleep in the calling thread, so never call this from the UI
+    thread.
+    """
+    if retries is None:
+        retries = config.upload_retries
+    headers = {'Content-Type': content_type}
+    if config.compress_uploads and len(body) >= config.compress_min_size:
+        body = gzip.compress(body, compresslevel=6)
+        headers['Content-Encoding'] = 'gzip'
+    attempt = 0
+    while True:
+        try:
+            response = requests.post(url, data=body, timeout=timeout, headers=headers)
+            retryable = response.status_code >= 500 or response.status_code == 429
+            if not retryable or attempt >= retries:
+                return response
+            delay = retry_after(response)
+        except requests.exceptions.RequestException:
+            if attempt >= retries:
+                raise
+            delay = None
+        if delay is None:
+            delay = config.retry_backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        time.sleep(min(delay, config.retry_after_max))
+        attempt += 1
+
+
+def post_json(config, url, payload, timeout=10):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return post(config, url, body, 'application/json', timeout)
@@ -1,6 +1,7 @@
 # android_app/utils/storage.py
 import json
 import os
+import time
 from kivy.app import App
 
 class Storage:
@@ -36,8 +37,13 @@ class Storage:
         try:
             settings_path = self._get_settings_path()
             os.makedirs(os.path.dirname(settings_path), exist_ok=True)
-            with open(settings_path, 'w') as f:
+            # Write a temporary file and rename it, so a crash mid-write
+            # cannot leave truncated settings behind
+            with open(settings_path + '.tmp', 'w') as f:
                 json.dump(self.settings, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(settings_path + '.tmp', settings_path)
         except Exception as e:
             print(f'Error saving settings: {e}')
     
@@ -46,4 +52,16 @@ class Storage:
         self._save_settings()
     
     def get_server_url(self):
-        return self.settings.get('server_url')
\ No newline at end of file
+        return self.settings.get('server_url')
+    
+    def reserve_client_seqs(self, count):
+        """Reserve ``count`` upload sequence numbers and return the first.
+        
+        The end of the block is saved before any number in it is handed
+        out. The very first block starts at the clock in milliseconds, above
+        the numbers earlier versions derived from the clock.
+        """
+        start = self.settings.get('next_client_seq') or int(time.time() * 1000)
+        self.settings['next_client_seq'] = start + count
+        self._save_settings()
+        return start
@@ -1,132 +1,710 @@
 # server/app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
+import base64
+import json
+import math
 import os
-from dotenv import load_dotenv
+from config import db_config, pool_config, partition_policies, replica_configs, replica_options, shard_configs
 from database import Database
-from models import LocationModel, DeviceModel, MessageModel, NotificationModel
-
-load_dotenv()
+from migrations import MigrationRunner
+from partitions import PartitionManager
+from sharding import open_database, members
+from pool import PoolTimeoutError
+from ingest import WriteBehindBuffer, BufferFullError
+from cache import LatestPositionCache, ReadThroughCache, DeviceFingerprints, RecentUploads
+from pubsub import LocationBroker
+from ratelimit import IngestLimiter, RateLimitedError, UploadTooLargeError
+import geo
+import numpy as np
+from simplify import douglas_peucker
+import export
+import location_codec
+from compression import init_compression
+import metrics
+import traceback
+import atexit
+import threading
+import time
+from models import LocationModel, DeviceModel, MessageModel, NotificationModel, ValidationError
 
 app = Flask(__name__)
 CORS(app)
 
-# Database configuration
-db_config = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'database': os.getenv('DB_NAME', 'phone_tracker')
+# Per-route counts, latency and payload size histograms at /api/metrics;
+# registered before compression so response sizes are the compressed ones
+metrics.init_metrics(app)
+
+# gzip/zstd Content-Encoding for request and response bodies
+init_compression(
+    app,
+    min_size=int(os.getenv('COMPRESS_MIN_SIZE', 1024)),
+    max_decompressed_size=int(os.getenv('MAX_DECOMPRESSED_SIZE', 10 * 1024 * 1024)),
+    gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', 6)),
+    zstd_level=int(os.getenv('COMPRESS_ZSTD_LEVEL', 3))
+)
+
+db = open_database(db_config, pool_config, shard_configs, replica_configs, replica_options)
+
+@app.before_request
+def route_reads():
+    # Clients that must see their own just-written rows opt out of replicas
+    db.read_from_primary(request.headers.get('X-Read-Your-Writes', '').lower() in ('1', 'true'))
+
+# Maximum number of fixes accepted by POST /api/locations/batch
+LOCATION_BATCH_MAX = int(os.getenv('LOCATION_BATCH_MAX', 1000))
+
+# Largest page GET /api/locations/<device_id> will return
+LOCATION_PAGE_MAX = int(os.getenv('LOCATION_PAGE_MAX', 1000))
+
+# Most device ids accepted by GET /api/locations/latest
+LATEST_QUERY_MAX = int(os.getenv('LATEST_QUERY_MAX', 1000))
+
+# Simplified tracks: most raw fixes loaded per track, and how long
+# simplified tracks of closed (past) windows stay cached
+SIMPLIFY_MAX_POINTS = int(os.getenv('SIMPLIFY_MAX_POINTS', 200000))
+SIMPLIFY_CACHE_TTL = float(os.getenv('SIMPLIFY_CACHE_TTL', 600))
+SIMPLIFY_CACHE_SIZE = int(os.getenv('SIMPLIFY_CACHE_SIZE', 256))
+
+# Rows fetched from the server per chunk of a streamed export
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+# Telemetry history: most rows per response and the default window
+# per resolution when no ``since`` is given
+TELEMETRY_ROWS_MAX = int(os.getenv('TELEMETRY_ROWS_MAX', 5000))
+TELEMETRY_DEFAULT_WINDOW = {
+    'raw': timedelta(days=1),
+    'hour': timedelta(days=7),
+    'day': timedelta(days=90),
 }
 
-db = Database(db_config)
+# Spatial queries: largest radius and most geohash cells scanned per query
+SPATIAL_RADIUS_MAX = float(os.getenv('SPATIAL_RADIUS_MAX', 500000))
+SPATIAL_MAX_CELLS = int(os.getenv('SPATIAL_MAX_CELLS', 32))
+
+# Fingerprints of stored device rows, so periodic device reports only write
+# the columns that changed (or just last_seen when nothing did)
+device_fingerprints = DeviceFingerprints(
+    Database.DEVICE_COLUMNS,
+    max_devices=int(os.getenv('DEVICE_FINGERPRINT_SIZE', 100000))
+)
+
+def write_devices(devices):
+    """Change-detecting replacement for Database.insert_devices"""
+    writes = [device_fingerprints.plan(device) for device in devices]
+    results = db.sync_devices(writes)
+    for (device, columns, _), (_, row_version, kind) in zip(writes, results):
+        device_fingerprints.record(device, columns, row_version, kind)
+    return [row_id for row_id, _, _ in results]
+
+# Last known fix per device, answered from memory by /api/locations/latest
+latest_positions = LatestPositionCache(int(os.getenv('LATEST_CACHE_SIZE', 100000)))
+
+def warm_latest_positions():
+    try:
+        latest_positions.warm(db.get_latest_locations(latest_positions.max_devices))
+    except Exception as e:
+        print(f"Could not warm latest position cache: {e}")
+
+def purge_ingest_keys(retention, interval):
+    """Drop upload keys older than ``retention`` every ``interval`` seconds"""
+    while True:
+        try:
+            purged = db.purge_ingest_keys(datetime.now() - retention)
+            if purged:
+                print(f"Purged {purged} upload keys")
+        except Exception as e:
+            print(f"Upload key purge failed: {e}")
+        time.sleep(interval)
+
+# Fixes pushed to /api/stream/locations subscribers as they are stored.
+# In-process: each worker only streams the fixes it received itself
+STREAM_KEEPALIVE = float(os.getenv('STREAM_KEEPALIVE', 15))
+location_broker = LocationBroker(
+    history_size=int(os.getenv('STREAM_HISTORY_SIZE', 10000)),
+    max_pending=int(os.getenv('STREAM_MAX_PENDING', 1000)),
+    max_subscribers=int(os.getenv('STREAM_MAX_SUBSCRIBERS', 1000))
+)
+
+def record_fixes(fixes):
+    """Update the latest position cache and notify stream subscribers of
+    newly stored ``(location, location_id)`` pairs"""
+    for location, location_id in fixes:
+        row = latest_positions.update(location, location_id)
+        if row is not None:
+            location_broker.publish(row)
+
+# Uploads carrying a client_seq are stored at most once (see
+# Database._insert_keyed); recently stored ones are answered from memory
+recent_uploads = RecentUploads(int(os.getenv('INGEST_KEY_CACHE_SIZE', 100000)))
+
+def deduplicated(kind, insert_many, on_insert=None):
+    """Wrap a Database.insert_* batch writer with the recent_uploads lookup.
+    
+    ``on_insert`` gets the ``(item, id)`` pairs this write actually stored,
+    leaving out replays of earlier uploads.
+    """
+    def write(items):
+        ids = recent_uploads.get_many(kind, items)
+        missing = [index for index, row_id in enumerate(ids) if row_id is None]
+        if missing:
+            items = [items[index] for index in missing]
+            stored = insert_many(items, report_inserted=True)
+            recent_uploads.put_many(kind, items, [row_id for row_id, _ in stored])
+            for index, (row_id, _) in zip(missing, stored):
+                ids[index] = row_id
+            if on_insert is not None:
+                on_insert([(item, row_id) for item, (row_id, inserted) in zip(items, stored) if inserted])
+        return ids
+    return write
+
+write_locations = deduplicated('locations', db.insert_locations, on_insert=record_fixes)
+write_messages = deduplicated('messages', db.insert_messages)
+write_notifications = deduplicated('notifications', db.insert_notifications)
+
+# Optional write-behind mode: POST handlers buffer rows and a background
+# thread group-commits them per table
+write_buffer = None
+if os.getenv('WRITE_BEHIND', '0') == '1':
+    write_buffer = WriteBehindBuffer(
+        writers={
+            'locations': write_locations,
+            'devices': write_devices,
+            'messages': write_messages,
+            'notifications': write_notifications
+        },
+        max_items=int(os.getenv('WRITE_BEHIND_MAX_ITEMS', 10000)),
+        flush_size=int(os.getenv('WRITE_BEHIND_FLUSH_SIZE', 500)),
+        flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL_MS', 200)) / 1000,
+        durability=os.getenv('WRITE_BEHIND_DURABILITY', 'none'),
+        put_timeout=float(os.getenv('WRITE_BEHIND_PUT_TIMEOUT_MS', 0)) / 1000,
+        coalesce={'devices': lambda device: device.device_id}
+    )
+    atexit.register(write_buffer.close)
+
+def ingest_load():
+    """Share of database connections (or write-behind slots) in use"""
+    pool = db.pool_stats()
+    load = pool['checked_out'] / max(1, pool['size'] + pool['max_overflow'])
+    if write_buffer is not None:
+        load = max(load, write_buffer.stats()['pending'] / max(1, write_buffer.max_items))
+    return load
+
+# Per-device and global token buckets for uploads, tightened as the pool
+# saturates; over-limit uploads get 429 with Retry-After
+ingest_limiter = IngestLimiter(
+    rate=float(os.getenv('INGEST_DEVICE_RATE', 5)),
+    burst=int(os.getenv('INGEST_DEVICE_BURST', 60)),
+    global_rate=float(os.getenv('INGEST_GLOBAL_RATE', 2000)),
+    global_burst=int(os.getenv('INGEST_GLOBAL_BURST', 4000)),
+    max_devices=int(os.getenv('INGEST_LIMITER_DEVICES', 100000)),
+    load=ingest_load,
+    saturation=float(os.getenv('INGEST_SATURATION', 0.8)),
+    min_factor=float(os.getenv('INGEST_MIN_RATE_FACTOR', 0.1))
+)
+
+def limit_uploads(models):
+    """Charge each upload's device one token per row"""
+    costs = {}
+    for model in models:
+        costs[model.device_id] = costs.get(model.device_id, 0) + 1
+    if costs:
+        ingest_limiter.acquire(costs)
+
+if os.getenv('LATEST_CACHE_WARM', '1') == '1':
+    threading.Thread(target=warm_latest_positions, daemon=True).start()
+
+# Read-through cache for GET /api/device/<device_id>, validated against
+# devices.row_version so writes from other workers are seen
+device_cache = ReadThroughCache(
+    load=db.get_device_info,
+    version=db.get_device_version,
+    ttl=float(os.getenv('DEVICE_CACHE_TTL', 300)),
+    max_size=int(os.getenv('DEVICE_CACHE_SIZE', 10000)),
+    revalidate_after=float(os.getenv('DEVICE_CACHE_REVALIDATE_AFTER', 0))
+)
+
+metrics.REGISTRY.stats('db_pool', 'Connection pool', db.pool_stats)
+if db.replicas is not None:
+    metrics.REGISTRY.stats('db_replicas', 'Read replica routing', db.replica_stats)
+metrics.REGISTRY.stats('latest_positions', 'Latest position cache', latest_positions.stats)
+metrics.REGISTRY.stats('device_cache', 'Device info cache', device_cache.stats)
+metrics.REGISTRY.stats('device_writes', 'Change-detecting device writes', device_fingerprints.stats)
+metrics.REGISTRY.stats('recent_uploads', 'Recently stored upload keys', recent_uploads.stats)
+metrics.REGISTRY.stats('ingest_limiter', 'Upload rate limiting', ingest_limiter.stats)
+metrics.REGISTRY.stats('location_stream', 'Live location stream', location_broker.stats)
+if write_buffer is not None:
+    metrics.REGISTRY.stats('write_behind', 'Write-behind buffer', write_buffer.stats)
+
+def error_response(e):
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    metrics.app_errors.inc((route, type(e).__name__))
+    if isinstance(e, ValidationError):
+        return jsonify({'success': False, 'error': str(e), 'field': e.field}), 400
+    if isinstance(e, UploadTooLargeError):
+        return jsonify({'success': False, 'error': str(e)}), 413
+    if isinstance(e, RateLimitedError):
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+        return response, 429
+    if isinstance(e, (PoolTimeoutError, BufferFullError)):
+        response = jsonify({'success': False, 'error': 'Server busy, try again later'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    print(f"Error handling {request.method} {request.path}: {e!r}")
+    traceback.print_exc()
+    return jsonify({'success': False, 'error': str(e)}), 500
+
+def store(table, model, insert_many):
+    """Write one model synchronously, or hand it to the write-behind buffer.
+    
+    Returns ``(id, status)``; the id is None while the row is only queued.
+    """
+    if write_buffer is None:
+        return insert_many([model])[0], 201
+    result = write_buffer.submit(table, model)
+    return result, 201 if write_buffer.durability == 'commit' else 202
+
+def stored_response(row_id, status):
+    if status == 202:
+        return jsonify({'success': True, 'queued': True}), 202
+    return jsonify({'success': True, 'id': row_id}), status
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    stats = {
+        'pool': db.pool_stats(),
+        'latest_positions': latest_positions.stats(),
+        'device_cache': device_cache.stats(),
+        'device_writes': device_fingerprints.stats(),
+        'recent_uploads': recent_uploads.stats(),
+        'ingest_limiter': ingest_limiter.stats(),
+        'location_stream': location_broker.stats(),
+        'track_cache': track_cache.stats()
+    }
+    if write_buffer is not None:
+        stats['write_behind'] = write_buffer.stats()
+    if db.replicas is not None:
+        stats['replicas'] = dict(db.replica_stats(), members=db.replicas.details())
+    return jsonify({'success': True, 'data': stats}), 200
+
 @app.route('/api/location', methods=['POST'])
 def save_location():
     try:
-        data = request.json
-        location = LocationModel(
-            device_id=data.get('device_id'),
-            latitude=data.get('latitude'),
-            longitude=data.get('longitude'),
-            altitude=data.get('altitude'),
-            accuracy=data.get('accuracy'),
-            speed=data.get('speed'),
-            bearing=data.get('bearing')
-        )
+        location = LocationModel.decode(request.get_json(silent=True))
+        limit_uploads([location])
         
-        result = db.insert_location(location)
-        return jsonify({'success': True, 'id': result}), 201
+        location_id, status = store('locations', location, write_locations)
+        return stored_response(location_id, status)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/locations/batch', methods=['POST'])
+def save_locations_batch():
+    try:
+        if request.mimetype == location_codec.CONTENT_TYPE:
+            try:
+                _, fixes = location_codec.decode(request.get_data())
+            except location_codec.CodecError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+        else:
+            data = request.get_json(silent=True)
+            fixes = data.get('locations') if isinstance(data, dict) else data
+        if not isinstance(fixes, list) or not fixes:
+            return jsonify({'success': False, 'error': 'Expected a non-empty array of locations'}), 400
+        if len(fixes) > LOCATION_BATCH_MAX:
+            return jsonify({'success': False, 'error': f'At most {LOCATION_BATCH_MAX} locations per batch'}), 413
+
+        results = [None] * len(fixes)
+        valid, errors = LocationModel.decode_many(fixes)
+        for index, error in errors:
+            results[index] = {'index': index, 'error': str(error), 'field': error.field}
+
+        locations = [location for _, location in valid]
+        limit_uploads(locations)
+        if write_buffer is None:
+            ids = write_locations(locations)
+        else:
+            ids = write_buffer.submit_many('locations', locations)
+        for (index, _), location_id in zip(valid, ids):
+            results[index] = {'index': index, 'id': location_id}
+
+        if not valid:
+            status = 400
+        elif write_buffer is not None and write_buffer.durability == 'none':
+            status = 202
+        else:
+            status = 201
+        return jsonify({
+            'success': bool(valid),
+            'inserted': len(valid),
+            'failed': len(fixes) - len(valid),
+            'results': results
+        }), status
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/device', methods=['POST'])
 def save_device():
     try:
-        data = request.json
-        device = DeviceModel(
-            device_id=data.get('device_id'),
-            model=data.get('model'),
-            manufacturer=data.get('manufacturer'),
-            android_version=data.get('android_version'),
-            sdk_version=data.get('sdk_version'),
-            battery_level=data.get('battery_level'),
-            battery_status=data.get('battery_status'),
-            storage_total=data.get('storage_total'),
-            storage_available=data.get('storage_available'),
-            ram_total=data.get('ram_total'),
-            ram_available=data.get('ram_available'),
-            screen_width=data.get('screen_width'),
-            screen_height=data.get('screen_height'),
-            imei=data.get('imei'),
-            sim_serial=data.get('sim_serial'),
-            phone_number=data.get('phone_number')
-        )
+        device = DeviceModel.decode(request.get_json(silent=True))
+        limit_uploads([device])
         
-        result = db.insert_device(device)
-        return jsonify({'success': True, 'id': result}), 201
+        response = stored_response(*store('devices', device, write_devices))
+        device_cache.invalidate(device.device_id)
+        return response
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/message', methods=['POST'])
 def save_message():
     try:
-        data = request.json
-        message = MessageModel(
-            device_id=data.get('device_id'),
-            sender=data.get('sender'),
-            recipient=data.get('recipient'),
-            message_body=data.get('message_body'),
-            message_type=data.get('message_type'),
-            timestamp=data.get('timestamp'),
-            read_status=data.get('read_status')
-        )
+        message = MessageModel.decode(request.get_json(silent=True))
+        limit_uploads([message])
         
-        result = db.insert_message(message)
-        return jsonify({'success': True, 'id': result}), 201
+        return stored_response(*store('messages', message, write_messages))
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/notification', methods=['POST'])
 def save_notification():
     try:
-        data = request.json
-        notification = NotificationModel(
-            device_id=data.get('device_id'),
-            app_name=data.get('app_name'),
-            title=data.get('title'),
-            text=data.get('text'),
-            package_name=data.get('package_name'),
-            timestamp=data.get('timestamp')
-        )
+        notification = NotificationModel.decode(request.get_json(silent=True))
+        limit_uploads([notification])
         
-        result = db.insert_notification(notification)
-        return jsonify({'success': True, 'id': result}), 201
+        return stored_response(*store('notifications', notification, write_notifications))
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return error_response(e)
+
+def parse_time(value):
+    """Parse an ISO 8601 string or epoch seconds into a naive local datetime"""
+    if value is None or value == '':
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+    try:
+        if seconds is not None:
+            return datetime.fromtimestamp(seconds)
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        return parsed
+    except (OverflowError, OSError) as e:
+        # Out of the platform's time range (inf, huge epochs, year 1 with
+        # an offset)
+        raise ValueError(f'Time out of range: {value}') from e
+
+def encode_cursor(row):
+    key = json.dumps([row['created_at'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, location_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(location_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+@app.route('/api/locations/latest', methods=['GET'])
+def get_latest_locations():
+    device_ids = request.args.get('device_ids')
+    if device_ids is None:
+        return jsonify({'success': True, 'data': latest_positions.get_many(), 'missing': []}), 200
+
+    device_ids = [device_id for device_id in device_ids.split(',') if device_id]
+    if len(device_ids) > LATEST_QUERY_MAX:
+        return jsonify({'success': False, 'error': f'At most {LATEST_QUERY_MAX} device_ids per request'}), 400
+    positions = latest_positions.get_many(device_ids)
+    missing = [device_id for device_id in device_ids if device_id not in positions]
+    return jsonify({'success': True, 'data': positions, 'missing': missing}), 200
+
+def sse_event(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {app.json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/api/stream/locations', methods=['GET'])
+def stream_locations():
+    """Server-sent events: a ``location`` event per stored fix.
+
+    Without Last-Event-ID the stream opens with a ``snapshot`` of the
+    latest known positions; with one, the missed fixes are replayed, or a
+    ``reset`` is sent when they are no longer available.
+    """
+    device_ids = request.args.get('device_ids')
+    if device_ids is not None:
+        device_ids = [device_id for device_id in device_ids.split(',') if device_id]
+        if not device_ids:
+            return jsonify({'success': False, 'error': 'device_ids must name at least one device'}), 400
+        if len(device_ids) > LATEST_QUERY_MAX:
+            return jsonify({'success': False, 'error': f'At most {LATEST_QUERY_MAX} device_ids per request'}), 400
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        subscription = location_broker.subscribe(device_ids, last_event_id)
+    except OverflowError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    def generate():
+        try:
+            yield 'retry: 2000\n\n'
+            if subscription.gap:
+                yield sse_event('reset', {'reason': 'Missed events are no longer available'})
+            if subscription.gap or not last_event_id:
+                yield sse_event('snapshot', latest_positions.get_many(device_ids))
+            while True:
+                events = subscription.get(STREAM_KEEPALIVE)
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+                yield ''.join(sse_event('location', row, event_id) for event_id, row in events)
+        finally:
+            subscription.close()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def find_in_area(min_lat, min_lon, max_lat, max_lon):
+    """Fixes inside a bounding box: latest per device from memory, or from
+    the geohash index when the request has a since/until window.
+    
+    Returns ``(rows, truncated)``.
+    """
+    since = parse_time(request.args.get('since'))
+    until = parse_time(request.args.get('until'))
+    if since is None and until is None:
+        rows = latest_positions.within_box(min_lat, min_lon, max_lat, max_lon, SPATIAL_MAX_CELLS)
+        return rows, False
+
+    limit = request.args.get('limit', 1000, type=int)
+    limit = max(1, min(limit, LOCATION_PAGE_MAX))
+    rows = []
+    truncated = False
+    for box in geo.split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+        cells = geo.best_cover(*box, range(1, 9), SPATIAL_MAX_CELLS)
+        candidates = db.get_locations_in_cells(sorted(cells), since, until, limit)
+        truncated = truncated or len(candidates) == limit
+        rows.extend(
+            row for row in candidates
+            if box[0] <= row['latitude'] <= box[2] and box[1] <= row['longitude'] <= box[3]
+        )
+    return rows, truncated
+
+@app.route('/api/locations/within', methods=['GET'])
+def get_locations_within():
+    try:
+        try:
+            lat = float(request.args['lat'])
+            lon = float(request.args['lon'])
+            radius = float(request.args['radius'])
+        except (KeyError, ValueError):
+            return jsonify({'success': False, 'error': 'lat, lon and radius (meters) are required'}), 400
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius <= SPATIAL_RADIUS_MAX):
+            return jsonify({'success': False, 'error': 'lat, lon or radius out of range'}), 400
+
+        rows, truncated = find_in_area(*geo.radius_bbox(lat, lon, radius))
+        matches = []
+        for row in rows:
+            distance = geo.distance_m(lat, lon, row['latitude'], row['longitude'])
+            if distance <= radius:
+                matches.append(dict(row, distance_m=round(distance, 1)))
+        matches.sort(key=lambda row: row['distance_m'])
+        return jsonify({'success': True, 'data': matches, 'truncated': truncated}), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/locations/bbox', methods=['GET'])
+def get_locations_bbox():
+    try:
+        try:
+            box = [float(request.args[name]) for name in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        except (KeyError, ValueError):
+            return jsonify({'success': False, 'error': 'min_lat, min_lon, max_lat and max_lon are required'}), 400
+        min_lat, min_lon, max_lat, max_lon = box
+        if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            return jsonify({'success': False, 'error': 'Invalid bounding box'}), 400
+        if min_lon > max_lon:
+            # Box crosses the antimeridian
+            min_lon -= 360
+
+        rows, truncated = find_in_area(min_lat, min_lon, max_lat, max_lon)
+        return jsonify({'success': True, 'data': rows, 'truncated': truncated}), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return error_response(e)
+
+def simplify_track(key):
+    """Douglas-Peucker simplified track for (device_id, since, until, tolerance)"""
+    device_id, since, until, tolerance = key
+    rows = db.get_track(device_id, since, until, SIMPLIFY_MAX_POINTS)
+    count = len(rows)
+    latitudes = np.fromiter((row[2] for row in rows), dtype=np.float64, count=count)
+    longitudes = np.fromiter((row[3] for row in rows), dtype=np.float64, count=count)
+    columns = Database.LOCATION_COLUMNS.split(', ')
+    kept = douglas_peucker(latitudes, longitudes, tolerance)
+    return {
+        'data': [dict(zip(columns, rows[index])) for index in kept],
+        'points': count,
+        'truncated': count == SIMPLIFY_MAX_POINTS
+    }
+
+track_cache = ReadThroughCache(load=simplify_track, ttl=SIMPLIFY_CACHE_TTL, max_size=SIMPLIFY_CACHE_SIZE)
+metrics.REGISTRY.stats('track_cache', 'Simplified track cache', track_cache.stats)
+
+def get_simplified_locations(device_id, tolerance, since, until):
+    if since is None:
+        since = (until or datetime.now()) - timedelta(days=1)
+    key = (device_id, since, until, tolerance)
+    # Open or still-running windows keep changing, so only closed ones are cached
+    if until is not None and until <= datetime.now():
+        track = track_cache.get(key)
+    else:
+        track = simplify_track(key)
+    return jsonify({
+        'success': True,
+        'data': track['data'],
+        'raw_points': track['points'],
+        'truncated': track['truncated']
+    }), 200
+
+def parse_tolerance(value):
+    """A positive, finite float from a query string value, else None"""
+    try:
+        tolerance = float(value)
+    except ValueError:
+        return None
+    return tolerance if math.isfinite(tolerance) and tolerance > 0 else None
 
 @app.route('/api/locations/<device_id>', methods=['GET'])
 def get_locations(device_id):
     try:
         limit = request.args.get('limit', 100, type=int)
-        locations = db.get_locations(device_id, limit)
-        return jsonify({'success': True, 'data': locations}), 200
+        if not 1 <= limit <= LOCATION_PAGE_MAX:
+            return jsonify({'success': False, 'error': f'limit must be between 1 and {LOCATION_PAGE_MAX}'}), 400
+        try:
+            since = parse_time(request.args.get('since'))
+            until = parse_time(request.args.get('until'))
+            cursor = request.args.get('cursor')
+            before = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        simplify = request.args.get('simplify')
+        if simplify is not None:
+            simplify = parse_tolerance(simplify)
+            if simplify is None:
+                return jsonify({'success': False, 'error': 'simplify must be a positive tolerance in meters'}), 400
+            return get_simplified_locations(device_id, simplify, since, until)
+
+        # Fetch one extra row to learn whether another page exists
+        locations = db.get_locations(device_id, limit + 1, since=since, until=until, before=before)
+        next_cursor = None
+        if len(locations) > limit:
+            locations = locations[:limit]
+            next_cursor = encode_cursor(locations[-1])
+        return jsonify({'success': True, 'data': locations, 'next_cursor': next_cursor}), 200
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return error_response(e)
+
+EXPORT_FORMATS = {
+    'ndjson': (export.ndjson_chunks, 'application/x-ndjson'),
+    'csv': (export.csv_chunks, 'text/csv'),
+    'arrow': (export.arrow_chunks, 'application/vnd.apache.arrow.file')
+}
+
+@app.route('/api/locations/<device_id>/export', methods=['GET'])
+def export_locations(device_id):
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'success': False, 'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+        try:
+            since = parse_time(request.args.get('since'))
+            until = parse_time(request.args.get('until'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        if export_format == 'arrow' and export.pa is None:
+            return jsonify({'success': False, 'error': 'Arrow export requires pyarrow on the server'}), 501
+
+        serialize, mimetype = EXPORT_FORMATS[export_format]
+        columns = Database.LOCATION_COLUMNS.split(', ')
+        batches = db.iter_locations(device_id, since, until, EXPORT_BATCH_SIZE)
+        # No Content-Length, so the response goes out with chunked encoding
+        response = Response(stream_with_context(serialize(columns, batches)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{device_id}.{export_format}"'
+        return response
+    except Exception as e:
+        return error_response(e)
 
 @app.route('/api/device/<device_id>', methods=['GET'])
 def get_device(device_id):
     try:
-        device = db.get_device_info(device_id)
+        device = device_cache.get(device_id)
         return jsonify({'success': True, 'data': device}), 200
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return error_response(e)
+
+@app.route('/api/device/<device_id>/telemetry', methods=['GET'])
+def get_device_telemetry(device_id):
+    """Battery/storage/RAM history, from the rollups unless resolution=raw"""
+    try:
+        resolution = request.args.get('resolution', 'hour')
+        if resolution not in TELEMETRY_DEFAULT_WINDOW:
+            return jsonify({'success': False, 'error': 'resolution must be raw, hour or day'}), 400
+        try:
+            until = parse_time(request.args.get('until'))
+            since = parse_time(request.args.get('since'))
+            limit = int(request.args.get('limit', TELEMETRY_ROWS_MAX))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if limit < 1:
+            return jsonify({'success': False, 'error': 'limit must be positive'}), 400
+        limit = min(limit, TELEMETRY_ROWS_MAX)
+        if since is None:
+            since = (until or datetime.now()) - TELEMETRY_DEFAULT_WINDOW[resolution]
+
+        rows = db.get_telemetry(device_id, resolution, since, until, limit)
+        return jsonify({'success': True, 'resolution': resolution, 'data': rows}), 200
+    except Exception as e:
+        return error_response(e)
 
 if __name__ == '__main__':
-    db.initialize_database()
+    for _, shard in members(db):
+        migrations = MigrationRunner(shard)
+        if os.getenv('DB_AUTO_MIGRATE', '0') == '1':
+            migrations.migrate()
+        else:
+            migrations.verify()
+    interval = int(os.getenv('PARTITION_MAINTENANCE_INTERVAL', 3600))
+    if partition_policies and interval > 0:
+        if db.backend.supports_partitioning:
+            for _, shard in members(db):
+                PartitionManager(shard, partition_policies).start_background(interval)
+        else:
+            print(f"PARTITION_TABLES ignored: not supported on the {db.backend.name} backend")
+    retention = float(os.getenv('INGEST_KEY_RETENTION_HOURS', 72))
+    if retention > 0:
+        threading.Thread(
+            target=purge_ingest_keys,
+            args=(timedelta(hours=retention), int(os.getenv('INGEST_KEY_PURGE_INTERVAL', 3600))),
+            name='ingest-key-purge',
+            daemon=True
+        ).start()
     app.run(host='0.0.0.0', port=8000, debug=False)
\ No newline at end of file
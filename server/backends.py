@@ -0,0 +1,323 @@
+# server/backends.py
+import fcntl
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+import mysql.connector
+from mysql.connector.constants import ClientFlag
+import geo
+
+
+class MySQLBackend:
+    """Connections to a MySQL server through mysql.connector"""
+
+    name = 'mysql'
+    Error = mysql.connector.Error
+    # Errors meaning the server is unreachable rather than the query wrong
+    DisconnectErrors = (mysql.connector.errors.InterfaceError, mysql.connector.errors.OperationalError)
+    supports_partitioning = True
+
+    def __init__(self, config):
+        self.config = config
+        # Gap between the ids of one multi-row INSERT, or 0 when they may
+        # not follow a fixed step (see insert_rows); read on first connect
+        self.id_step = None
+
+    def connect(self):
+        # FOUND_ROWS: UPDATE rowcount counts matched rather than changed
+        # rows, so a guarded write that changes nothing still reports 1
+        conn = mysql.connector.connect(client_flags=[ClientFlag.FOUND_ROWS], **self.config)
+        if self.id_step is None:
+            self._check_auto_increment(conn)
+        return conn
+
+    def _check_auto_increment(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('SELECT @@auto_increment_increment, @@innodb_autoinc_lock_mode')
+        increment, lock_mode = cursor.fetchone()
+        cursor.close()
+        # Lock modes 0 and 1 reserve a multi-row INSERT's ids as one block;
+        # mode 2 (interleaved) may spread them among concurrent inserts
+        if int(lock_mode) in (0, 1):
+            self.id_step = int(increment)
+        else:
+            self.id_step = 0
+            print("innodb_autoinc_lock_mode=2: batch inserts fetch ids row by row "
+                  "(set it to 1 for one multi-row INSERT per batch)")
+
+    def ping(self, conn):
+        conn.ping(reconnect=False)
+
+    def is_disconnect(self, error):
+        return isinstance(error, self.DisconnectErrors)
+
+    def insert_rows(self, cursor, query, rows):
+        """Run an INSERT for every row; returns the generated ids in order.
+
+        With lock modes 0/1, InnoDB gives a multi-row insert whose row count
+        is known up front one block of AUTO_INCREMENT values, spaced by
+        auto_increment_increment, and lastrowid is the first of them. So
+        one executemany is enough. Otherwise each row is inserted on its own
+        and its lastrowid is read.
+        """
+        if self.id_step:
+            cursor.executemany(query, rows)
+            return list(range(cursor.lastrowid, cursor.lastrowid + len(rows) * self.id_step, self.id_step))
+        ids = []
+        for row in rows:
+            cursor.execute(query, row)
+            ids.append(cursor.lastrowid)
+        return ids
+
+    def replication_lag(self, conn):
+        """Seconds this server is behind its replication source, or None
+        when it is not replicating (or replication is broken)"""
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except mysql.connector.errors.ProgrammingError:
+            cursor.execute('SHOW SLAVE STATUS')  # before MySQL 8.0.22
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+
+    @contextmanager
+    def lock(self, cursor, name, wait):
+        """Server-wide named lock; yields False if it was not acquired in time"""
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (name, wait))
+        if cursor.fetchone()[0] != 1:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+            cursor.fetchone()
+
+
+def _adapt_datetime(value):
+    return value.isoformat(' ')
+
+
+def _convert_datetime(value):
+    return datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+
+
+def _least(*values):
+    return None if any(value is None for value in values) else min(values)
+
+
+def _greatest(*values):
+    return None if any(value is None for value in values) else max(values)
+
+
+def _geohash(longitude, latitude, precision):
+    return geo.encode(latitude, longitude, precision)
+
+
+def _now():
+    return datetime.now().replace(microsecond=0).isoformat(' ')
+
+
+# Conflict target of each table written with ON DUPLICATE KEY UPDATE
+UPSERT_KEYS = {
+    'devices': 'device_id',
+    'device_telemetry_rollups': 'device_id, resolution, bucket',
+}
+
+
+@lru_cache(maxsize=512)
+def translate(query):
+    """Rewrite a MySQL-flavoured statement for SQLite.
+
+    Only what Database and the migrations use: ``%s`` placeholders,
+    ``INSERT IGNORE`` and ``ON DUPLICATE KEY UPDATE ... VALUES(col)``
+    upserts. Functions such as
+    NOW(), LEAST() and ST_GeoHash() are registered on each connection
+    instead. Results are cached, so a given statement is only rewritten
+    once and then hits SQLite's per-connection statement cache.
+    """
+    head, duplicate, updates = query.partition('ON DUPLICATE KEY UPDATE')
+    if duplicate:
+        table = re.search(r'INSERT\s+INTO\s+(\w+)', head, re.IGNORECASE).group(1)
+        updates = re.sub(r'\bVALUES\((\w+)\)', r'excluded.\1', updates)
+        query = f'{head}ON CONFLICT ({UPSERT_KEYS[table]}) DO UPDATE SET{updates}'
+    query = re.sub(r'^(\s*)INSERT\s+IGNORE\b', r'\1INSERT OR IGNORE', query, flags=re.IGNORECASE)
+    return query.replace('%s', '?')
+
+
+class SQLiteCursor:
+    """DB-API cursor that accepts the MySQL-style statements Database uses"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, params=()):
+        self._cursor.execute(translate(query), params)
+        self.lastrowid = self._cursor.lastrowid
+        return self
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(translate(query), rows)
+        # sqlite3 leaves lastrowid alone after executemany
+        self.lastrowid = self._cursor.connection.execute('SELECT last_insert_rowid()').fetchone()[0]
+        return self
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, dictionary=False, buffered=None):
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteBackend:
+    """Embedded SQLite database file in WAL mode.
+
+    WAL lets readers run alongside the single writer; writes take the lock
+    up front (BEGIN IMMEDIATE) and wait up to ``busy_timeout`` seconds for
+    it, so pooled connections serialise cleanly instead of failing with
+    "database is locked" half way through a transaction.
+    """
+
+    name = 'sqlite'
+    Error = sqlite3.Error
+    supports_partitioning = False
+    # Result codes meaning the database file is gone or unreadable rather
+    # than busy: SQLITE_IOERR, SQLITE_CORRUPT, SQLITE_CANTOPEN, SQLITE_NOTADB
+    DISCONNECT_CODES = (10, 11, 14, 26)
+    DISCONNECT_MESSAGES = ('disk i/o error', 'malformed', 'unable to open', 'not a database')
+
+    def __init__(self, path, busy_timeout=5.0, synchronous='NORMAL'):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level='IMMEDIATE',
+            check_same_thread=False,
+            cached_statements=256
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        # Lets prefix LIKE (geohash cells) use the index
+        conn.execute('PRAGMA case_sensitive_like=ON')
+        conn.create_function('NOW', 0, _now, deterministic=False)
+        conn.create_function('LEAST', -1, _least, deterministic=True)
+        conn.create_function('GREATEST', -1, _greatest, deterministic=True)
+        conn.create_function('ST_GeoHash', 3, _geohash, deterministic=True)
+        return SQLiteConnection(conn)
+
+    def ping(self, conn):
+        conn.cursor().execute('SELECT 1')
+
+    def is_disconnect(self, error):
+        """True when the file cannot be read; lock contention ("database is
+        locked", also an OperationalError) is not a disconnect"""
+        if not isinstance(error, sqlite3.OperationalError):
+            return False
+        code = getattr(error, 'sqlite_errorcode', None)
+        if code is not None:
+            # Extended codes carry the primary code in the low byte
+            return code & 0xff in self.DISCONNECT_CODES
+        message = str(error).lower()
+        return any(text in message for text in self.DISCONNECT_MESSAGES)
+
+    def replication_lag(self, conn):
+        # A replica here is a copy of the file kept current by an outside
+        # tool (e.g. Litestream); SQLite itself cannot tell how far behind
+        return 0
+
+    def insert_rows(self, cursor, query, rows):
+        # The write lock is held for the whole transaction, so the rows of
+        # one executemany get consecutive rowids ending at last_insert_rowid
+        cursor.executemany(query, rows)
+        return list(range(cursor.lastrowid - len(rows) + 1, cursor.lastrowid + 1))
+
+    @contextmanager
+    def lock(self, cursor, name, wait):
+        """Named lock shared by every process using this database file"""
+        with open(f'{self.path}.{name}.lock', 'w') as f:
+            deadline = time.monotonic() + wait
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        yield False
+                        return
+                    time.sleep(0.1)
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def create_backend(config):
+    """Backend for ``db_config``: its 'backend' key picks mysql or sqlite"""
+    config = dict(config)
+    kind = config.pop('backend', 'mysql')
+    path = config.pop('path', None)
+    busy_timeout = config.pop('busy_timeout', 5.0)
+    synchronous = config.pop('synchronous', 'NORMAL')
+    if kind == 'mysql':
+        return MySQLBackend(config)
+    if kind == 'sqlite':
+        return SQLiteBackend(path or 'phone_tracker.db', busy_timeout, synchronous)
+    raise ValueError(f'Unknown database backend: {kind}')
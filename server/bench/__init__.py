@@ -0,0 +1,3 @@
+# server/bench/__init__.py
+"""Load generation and benchmarks; run the modules from the server directory,
+e.g. ``python -m bench.fleet --serve`` or ``python -m bench.db``."""
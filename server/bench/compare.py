@@ -0,0 +1,71 @@
+# server/bench/compare.py
+import argparse
+import json
+import sys
+
+# metric path -> True if higher is better
+METRICS = {
+    'fleet': {
+        ('throughput_per_s',): True,
+        ('latency_ms', 'p50'): False,
+        ('latency_ms', 'p95'): False,
+        ('latency_ms', 'p99'): False,
+        ('errors',): False,
+    },
+    'db': {
+        ('rows_per_s',): True,
+        ('latency_ms', 'p50'): False,
+        ('latency_ms', 'p95'): False,
+        ('latency_ms', 'p99'): False,
+    },
+}
+
+
+def _get(stats, path):
+    for key in path:
+        stats = stats.get(key) if isinstance(stats, dict) else None
+    return stats
+
+
+def compare(baseline, candidate, threshold):
+    """Rows of (name, metric, before, after, change %, regressed)"""
+    if baseline['kind'] != candidate['kind']:
+        raise ValueError(f"Cannot compare a {baseline['kind']} report with a {candidate['kind']} report")
+    rows = []
+    for name in sorted(set(baseline['results']) & set(candidate['results'])):
+        for path, higher_is_better in METRICS[baseline['kind']].items():
+            before = _get(baseline['results'][name], path)
+            after = _get(candidate['results'][name], path)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else (0.0 if after == before else float('inf'))
+            worse = -change if higher_is_better else change
+            rows.append((name, '.'.join(path), before, after, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='Percent change counted as a regression')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline.get('commit') or '?'} -> {candidate.get('commit') or '?'} ({baseline['kind']})")
+    regressions = 0
+    for name, metric, before, after, change, regressed in compare(baseline, candidate, args.threshold):
+        regressions += regressed
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:28} {metric:18} {before:12.2f} {after:12.2f} {change:+8.1f}%{flag}")
+    if regressions:
+        print(f"{regressions} metric(s) regressed by more than {args.threshold:g}%")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# server/bench/db.py
+import argparse
+import os
+import random
+import tempfile
+import time
+from bench.report import percentiles, write_report
+from models import LocationModel, DeviceModel, MessageModel, NotificationModel
+
+
+def _location(rng, device_id):
+    return LocationModel(
+        device_id=device_id,
+        latitude=rng.uniform(-6.4, -6.0),
+        longitude=rng.uniform(106.6, 107.0),
+        altitude=rng.uniform(0, 50),
+        accuracy=rng.uniform(3, 25),
+        speed=rng.uniform(0, 15),
+        bearing=rng.uniform(0, 360),
+        timestamp=int(time.time() * 1000)
+    )
+
+
+def _device(rng, device_id):
+    return DeviceModel(
+        device_id=device_id, model='Bench Phone', manufacturer='Bench',
+        android_version='13', sdk_version=33, battery_level=rng.randint(1, 100),
+        battery_status='not_charging', storage_total=128000000000,
+        storage_available=rng.randint(10 ** 9, 10 ** 11), ram_total=8000000000,
+        ram_available=rng.randint(10 ** 9, 4 * 10 ** 9), screen_width=1080, screen_height=2400
+    )
+
+
+def _message(rng, device_id):
+    return MessageModel(
+        device_id=device_id, sender='+620000000000', message_body='x' * rng.randint(10, 160),
+        message_type='received', timestamp=int(time.time() * 1000), read_status=False
+    )
+
+
+def _notification(rng, device_id):
+    return NotificationModel(
+        device_id=device_id, app_name='Bench', title='Bench', text='y' * rng.randint(10, 200),
+        package_name='com.example.bench', timestamp=int(time.time() * 1000)
+    )
+
+
+def cases(db, batch_size):
+    """name -> (call(models), model factory, rows per call)"""
+    return {
+        'insert_location': (db.insert_location, _location, 1),
+        f'insert_locations[{batch_size}]': (db.insert_locations, _location, batch_size),
+        'insert_device': (db.insert_device, _device, 1),
+        f'insert_devices[{batch_size}]': (db.insert_devices, _device, batch_size),
+        f'sync_devices[{batch_size}]': (
+            lambda devices: db.sync_devices([(device, None, None) for device in devices]),
+            _device, batch_size
+        ),
+        'insert_message': (db.insert_message, _message, 1),
+        f'insert_messages[{batch_size}]': (db.insert_messages, _message, batch_size),
+        'insert_notification': (db.insert_notification, _notification, 1),
+        f'insert_notifications[{batch_size}]': (db.insert_notifications, _notification, batch_size),
+    }
+
+
+def run_case(call, make, rows, iterations, devices, rng):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        models = [make(rng, f'bench-{rng.randrange(devices):06d}') for _ in range(rows)]
+        began = time.perf_counter()
+        call(models if rows > 1 else models[0])
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+    return {
+        'calls': iterations,
+        'rows': iterations * rows,
+        'calls_per_s': iterations / sum(latencies),
+        'rows_per_s': iterations * rows / sum(latencies),
+        'wall_s': elapsed,
+        'latency_ms': percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark the Database insert paths')
+    parser.add_argument('--backend', choices=['sqlite', 'configured'], default='sqlite',
+                        help='A fresh temporary SQLite file, or the database from .env')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--only', help='Run only cases whose name contains this')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report', default='bench-db.json')
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+    from config import db_config, pool_config
+    from database import Database
+    from migrations import MigrationRunner
+
+    db = Database(db_config, pool_config)
+    MigrationRunner(db).migrate()
+    rng = random.Random(args.seed)
+
+    results = {}
+    for name, (call, make, rows) in cases(db, args.batch_size).items():
+        if args.only and args.only not in name:
+            continue
+        iterations = args.iterations if rows == 1 else max(1, args.iterations // 10)
+        results[name] = stats = run_case(call, make, rows, iterations, args.devices, rng)
+        latency = stats['latency_ms']
+        print(f"{name:28} {stats['rows_per_s']:10.0f} rows/s "
+              f"p50 {latency['p50']:7.2f}ms p95 {latency['p95']:7.2f}ms p99 {latency['p99']:7.2f}ms")
+    db.close()
+
+    settings = dict(vars(args), backend=db.backend.name)
+    write_report(args.report, 'db', results, settings)
+    print(f"Report written to {args.report}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+# server/bench/fleet.py
+import argparse
+import heapq
+import itertools
+import logging
+import math
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+import requests
+from bench.report import LatencyRecorder, write_report
+
+METERS_PER_DEGREE = 111320.0
+
+
+class VirtualDevice:
+    """One simulated phone moving around a city.
+
+    Positions follow a random walk with slowly drifting heading and speed;
+    reported fixes add GPS noise scaled to the reported accuracy, the way a
+    real receiver's fixes scatter around the true track.
+    """
+
+    def __init__(self, index, rng, center=(-6.2, 106.8), spread_m=20000):
+        self.device_id = f'bench-{index:06d}'
+        self.rng = rng
+        self.latitude = center[0] + rng.gauss(0, spread_m) / METERS_PER_DEGREE
+        self.longitude = center[1] + rng.gauss(0, spread_m) / (METERS_PER_DEGREE * math.cos(math.radians(center[0])))
+        self.heading = rng.uniform(0, 360)
+        self.speed = rng.choice([0.0, 1.4, 1.4, 8.0, 14.0])  # parked, walking, driving
+        self.battery = rng.randint(20, 100)
+        self.moved_at = time.monotonic()
+
+    def location(self):
+        now = time.monotonic()
+        elapsed = now - self.moved_at
+        self.moved_at = now
+        self.heading = (self.heading + self.rng.gauss(0, 15)) % 360
+        self.speed = max(0.0, self.speed + self.rng.gauss(0, 0.5))
+        distance = self.speed * elapsed
+        self.latitude += distance * math.cos(math.radians(self.heading)) / METERS_PER_DEGREE
+        self.longitude += distance * math.sin(math.radians(self.heading)) / (
+            METERS_PER_DEGREE * math.cos(math.radians(self.latitude))
+        )
+        accuracy = self.rng.uniform(3, 25)
+        jitter = self.rng.gauss(0, accuracy / 2)
+        angle = self.rng.uniform(0, 2 * math.pi)
+        return {
+            'device_id': self.device_id,
+            'latitude': self.latitude + jitter * math.cos(angle) / METERS_PER_DEGREE,
+            'longitude': self.longitude + jitter * math.sin(angle) / METERS_PER_DEGREE,
+            'altitude': self.rng.uniform(0, 50),
+            'accuracy': accuracy,
+            'speed': self.speed,
+            'bearing': self.heading,
+            'timestamp': int(time.time() * 1000),
+        }
+
+    def device_info(self):
+        if self.rng.random() < 0.1:
+            self.battery = max(1, self.battery - 1)
+        return {
+            'device_id': self.device_id,
+            'model': 'Bench Phone',
+            'manufacturer': 'Bench',
+            'android_version': '13',
+            'sdk_version': 33,
+            'battery_level': self.battery,
+            'battery_status': 'not_charging',
+            'storage_total': 128000000000,
+            'storage_available': 64000000000 - self.rng.randint(0, 1000000),
+            'ram_total': 8000000000,
+            'ram_available': self.rng.randint(1000000000, 4000000000),
+            'screen_width': 1080,
+            'screen_height': 2400,
+        }
+
+    def message(self):
+        return {
+            'device_id': self.device_id,
+            'sender': f'+62{self.rng.randint(10 ** 9, 10 ** 10)}',
+            'recipient': None,
+            'message_body': 'x' * self.rng.randint(10, 160),
+            'message_type': 'received',
+            'timestamp': int(time.time() * 1000),
+            'read_status': False,
+        }
+
+    def notification(self):
+        return {
+            'device_id': self.device_id,
+            'app_name': self.rng.choice(['WhatsApp', 'Gmail', 'Maps', 'Calendar']),
+            'title': 'Bench notification',
+            'text': 'y' * self.rng.randint(10, 200),
+            'package_name': 'com.example.bench',
+            'timestamp': int(time.time() * 1000),
+        }
+
+
+# kind -> (route, payload method)
+ROUTES = {
+    'location': ('/location', VirtualDevice.location),
+    'device': ('/device', VirtualDevice.device_info),
+    'message': ('/message', VirtualDevice.message),
+    'notification': ('/notification', VirtualDevice.notification),
+}
+
+
+class Fleet:
+    """Open-loop load generator for a fleet of virtual devices.
+
+    Requests are issued on schedule whether or not earlier ones have
+    returned, so a slow server shows up as latency and schedule lag rather
+    than as a politely reduced request rate.
+    """
+
+    def __init__(self, base_url, devices, intervals, workers=32, seed=1,
+                 burst_every=0, burst_fraction=0.1, burst_size=20, storm_at=None):
+        self.base_url = base_url.rstrip('/')
+        self.intervals = intervals
+        self.workers = workers
+        self.burst_every = burst_every
+        self.burst_fraction = burst_fraction
+        self.burst_size = burst_size
+        self.storm_at = storm_at
+        self.rng = random.Random(seed)
+        self.devices = [VirtualDevice(i, random.Random(seed * 1000003 + i)) for i in range(devices)]
+        self.recorder = LatencyRecorder()
+        self._jobs = queue.Queue()
+        self._session_generation = 0
+
+    def _interval(self, kind):
+        # Exponential gaps for event-like traffic, jittered fixed ones for
+        # periodic reporting
+        mean = self.intervals[kind]
+        if kind in ('message', 'notification'):
+            return self.rng.expovariate(1 / mean)
+        return mean * self.rng.uniform(0.9, 1.1)
+
+    def _worker(self):
+        session = requests.Session()
+        generation = self._session_generation
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            due, route, payload = job
+            if generation != self._session_generation:
+                # Reconnect storm: drop keep-alive connections like phones
+                # coming back from a network outage
+                session.close()
+                session = requests.Session()
+                generation = self._session_generation
+            start = time.monotonic()
+            try:
+                response = session.post(self.base_url + route, json=payload, timeout=30)
+                status, error = response.status_code, response.status_code >= 400
+            except requests.RequestException:
+                status, error = 'network', True
+            self.recorder.record(f'POST /api{route}', time.monotonic() - start,
+                                 status, error, lag=max(0.0, start - due))
+
+    def _enqueue(self, due, device, kind):
+        # Payloads are built here, on the scheduling thread, so a device's
+        # state is never touched by two workers at once
+        route, payload = ROUTES[kind]
+        self._jobs.put((due, route, payload(device)))
+
+    def _storm(self, now):
+        self._session_generation += 1
+        for device in self.devices:
+            self._enqueue(now, device, 'device')
+            self._enqueue(now, device, 'location')
+
+    def _burst(self, now):
+        count = max(1, int(len(self.devices) * self.burst_fraction))
+        for device in self.rng.sample(self.devices, count):
+            for _ in range(self.burst_size):
+                self._enqueue(now, device, 'location')
+
+    def run(self, duration):
+        start = time.monotonic()
+        schedule = []
+        sequence = itertools.count()
+        for device in self.devices:
+            for kind, interval in self.intervals.items():
+                if interval > 0:
+                    # Spread first reports so devices do not start in lockstep
+                    due = start + self.rng.uniform(0, interval)
+                    heapq.heappush(schedule, (due, next(sequence), device, kind))
+        if self.burst_every:
+            heapq.heappush(schedule, (start + self.burst_every, next(sequence), None, 'burst'))
+        if self.storm_at is not None:
+            heapq.heappush(schedule, (start + self.storm_at, next(sequence), None, 'storm'))
+
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        end = start + duration
+        while schedule:
+            due, _, device, kind = schedule[0]
+            if due >= end:
+                break
+            now = time.monotonic()
+            if due > now:
+                time.sleep(min(due - now, 0.05))
+                continue
+            heapq.heappop(schedule)
+            if kind == 'burst':
+                self._burst(now)
+                heapq.heappush(schedule, (due + self.burst_every, next(sequence), None, 'burst'))
+            elif kind == 'storm':
+                self._storm(now)
+            else:
+                self._enqueue(due, device, kind)
+                heapq.heappush(schedule, (due + self._interval(kind), next(sequence), device, kind))
+
+        # Let queued requests finish; their latency is part of the run
+        for _ in threads:
+            self._jobs.put(None)
+        for thread in threads:
+            thread.join()
+        return self.recorder.summary(time.monotonic() - start)
+
+
+def serve_local(db_path):
+    """Start the API in-process on an empty SQLite database; returns its URL"""
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_PATH'] = db_path
+    os.environ['LATEST_CACHE_WARM'] = '0'
+    from werkzeug.serving import make_server
+    from migrations import MigrationRunner
+    import app as server
+
+    MigrationRunner(server.db).migrate()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{httpd.server_port}/api'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive the API with a simulated device fleet')
+    parser.add_argument('--url', default='http://127.0.0.1:8000/api',
+                        help='API base URL (ignored with --serve)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run the server in-process on a temporary SQLite database')
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds')
+    parser.add_argument('--workers', type=int, default=32, help='Concurrent connections')
+    parser.add_argument('--location-interval', type=float, default=5)
+    parser.add_argument('--device-interval', type=float, default=300)
+    parser.add_argument('--message-interval', type=float, default=120,
+                        help='Mean seconds between messages per device (0 disables)')
+    parser.add_argument('--notification-interval', type=float, default=60,
+                        help='Mean seconds between notifications per device (0 disables)')
+    parser.add_argument('--burst-every', type=float, default=0,
+                        help='Every N seconds a share of devices uploads a backlog at once')
+    parser.add_argument('--burst-fraction', type=float, default=0.1)
+    parser.add_argument('--burst-size', type=int, default=20)
+    parser.add_argument('--storm-at', type=float, default=None,
+                        help='Seconds into the run when every device reconnects at once')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report', default='bench-fleet.json')
+    args = parser.parse_args()
+
+    url = args.url
+    if args.serve:
+        url = serve_local(os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db'))
+
+    intervals = {
+        'location': args.location_interval,
+        'device': args.device_interval,
+        'message': args.message_interval,
+        'notification': args.notification_interval,
+    }
+    fleet = Fleet(url, args.devices, intervals, args.workers, args.seed,
+                  args.burst_every, args.burst_fraction, args.burst_size, args.storm_at)
+    print(f"Simulating {args.devices} devices against {url} for {args.duration:.0f}s")
+    results = fleet.run(args.duration)
+
+    settings = dict(vars(args), url=url)
+    write_report(args.report, 'fleet', results, settings)
+    for route, stats in results.items():
+        latency = stats['latency_ms']
+        print(f"{route:28} {stats['requests']:8d} req {stats['throughput_per_s']:9.1f}/s "
+              f"p50 {latency['p50']:7.1f}ms p95 {latency['p95']:7.1f}ms "
+              f"p99 {latency['p99']:7.1f}ms errors {stats['errors']}")
+    print(f"Report written to {args.report}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# server/bench/report.py
+import json
+import math
+import platform
+import subprocess
+import threading
+from datetime import datetime
+
+
+class LatencyRecorder:
+    """Thread-safe per-route request outcomes and latencies"""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, status=None, error=False, lag=0.0):
+        """One request; ``lag`` is how late it started against its schedule"""
+        with self._lock:
+            entry = self._routes.setdefault(route, {
+                'latencies': [], 'lags': [], 'statuses': {}, 'errors': 0
+            })
+            entry['latencies'].append(seconds)
+            entry['lags'].append(lag)
+            if status is not None:
+                entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+            if error:
+                entry['errors'] += 1
+
+    def summary(self, elapsed):
+        with self._lock:
+            return {
+                route: {
+                    'requests': len(entry['latencies']),
+                    'errors': entry['errors'],
+                    'statuses': dict(entry['statuses']),
+                    'throughput_per_s': len(entry['latencies']) / elapsed if elapsed else 0.0,
+                    'latency_ms': percentiles(entry['latencies']),
+                    'schedule_lag_ms': percentiles(entry['lags']),
+                }
+                for route, entry in sorted(self._routes.items())
+            }
+
+
+def percentiles(samples):
+    """p50/p95/p99/max/mean in milliseconds (nearest-rank)"""
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000
+
+    return {
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'max': ordered[-1] * 1000,
+        'mean': sum(ordered) / len(ordered) * 1000,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(path, kind, results, settings):
+    """Write a JSON report that bench.compare can diff against another run"""
+    report = {
+        'kind': kind,
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'settings': settings,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return report
+
@@ -0,0 +1,338 @@
+# server/cache.py
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+import geo
+
+# Geohash precisions of the in-memory spatial index (about 1250km down to 1.2km cells)
+INDEX_PRECISIONS = (2, 3, 4, 5, 6)
+
+
+class LatestPositionCache:
+    """Last known fix per device, kept in memory.
+
+    Devices are ordered by when they last reported, so once ``max_devices``
+    is reached the device that has been idle the longest is evicted. Reads
+    do not change that order.
+
+    Positions are also indexed by geohash cell at ``INDEX_PRECISIONS`` so
+    area queries only look at devices in the covering cells.
+    """
+
+    def __init__(self, max_devices=100000):
+        self.max_devices = max_devices
+        self._positions = OrderedDict()
+        self._cells = {precision: {} for precision in INDEX_PRECISIONS}
+        self._lock = threading.Lock()
+        self._stats = {'updates': 0, 'stale': 0, 'evictions': 0, 'hits': 0, 'misses': 0}
+
+    def _index(self, device_id, row, add):
+        cell = geo.encode(row['latitude'], row['longitude'], INDEX_PRECISIONS[-1])
+        for precision, cells in self._cells.items():
+            prefix = cell[:precision]
+            if add:
+                cells.setdefault(prefix, set()).add(device_id)
+            else:
+                members = cells.get(prefix)
+                if members is not None:
+                    members.discard(device_id)
+                    if not members:
+                        del cells[prefix]
+
+    @staticmethod
+    def _older(row, current):
+        """Whether ``row`` is an older fix than ``current``: by device fix
+        time when both have one, else by row id (storage order)"""
+        if row['timestamp'] is not None and current['timestamp'] is not None:
+            return row['timestamp'] < current['timestamp']
+        if row['id'] is not None and current['id'] is not None:
+            return row['id'] < current['id']
+        return row['created_at'] < current['created_at']
+
+    def _put(self, row):
+        device_id = row['device_id']
+        current = self._positions.get(device_id)
+        if current is not None:
+            if self._older(row, current):
+                self._stats['stale'] += 1
+                return False
+            self._index(device_id, current, add=False)
+        self._positions[device_id] = row
+        self._positions.move_to_end(device_id)
+        self._index(device_id, row, add=True)
+        if len(self._positions) > self.max_devices:
+            evicted_id, evicted = self._positions.popitem(last=False)
+            self._index(evicted_id, evicted, add=False)
+            self._stats['evictions'] += 1
+        return True
+
+    def update(self, location, location_id=None, created_at=None):
+        """Record a fix that has just been stored; returns the row, or None
+        when the device's cached fix is newer and was kept"""
+        row = {
+            'id': location_id,
+            'device_id': location.device_id,
+            'latitude': location.latitude,
+            'longitude': location.longitude,
+            'altitude': location.altitude,
+            'accuracy': location.accuracy,
+            'speed': location.speed,
+            'bearing': location.bearing,
+            'created_at': created_at or datetime.now(),
+            'timestamp': location.timestamp
+        }
+        with self._lock:
+            if not self._put(row):
+                return None
+            self._stats['updates'] += 1
+        return row
+
+    def warm(self, rows):
+        """Load rows as returned by Database.get_latest_locations"""
+        with self._lock:
+            for row in sorted(rows, key=lambda r: r['created_at']):
+                self._put(dict(row))
+
+    def get_many(self, device_ids=None):
+        with self._lock:
+            if device_ids is None:
+                return dict(self._positions)
+            found = {}
+            for device_id in device_ids:
+                row = self._positions.get(device_id)
+                if row is not None:
+                    found[device_id] = row
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(device_ids) - len(found)
+            return found
+
+    def within_box(self, min_lat, min_lon, max_lat, max_lon, max_cells=32):
+        """Latest positions inside a bounding box (longitudes may wrap)"""
+        found = []
+        with self._lock:
+            for box in geo.split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+                cells = geo.best_cover(*box, INDEX_PRECISIONS, max_cells)
+                precision = len(next(iter(cells)))
+                index = self._cells[precision]
+                for cell in cells:
+                    for device_id in index.get(cell, ()):
+                        row = self._positions[device_id]
+                        if (box[0] <= row['latitude'] <= box[2]
+                                and box[1] <= row['longitude'] <= box[3]):
+                            found.append(row)
+        return found
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['devices'] = len(self._positions)
+            stats['max_devices'] = self.max_devices
+        return stats
+
+
+_MISSING = object()
+
+
+class ReadThroughCache:
+    """TTL + LRU cache in front of a loader function.
+
+    Entries live for at most ``ttl`` seconds. When ``version`` is given,
+    an entry older than ``revalidate_after`` seconds is checked against the
+    version stamp stored in the database (``version_key`` of the cached
+    row) before it is served; a cheap
+    version lookup keeps every worker process consistent with writes made
+    by the others. ``revalidate_after=0`` checks on every read.
+    """
+
+    def __init__(self, load, version=None, version_key='row_version', ttl=300,
+                 max_size=10000, revalidate_after=0):
+        self.load = load
+        self.version = version
+        self.version_key = version_key
+        self.ttl = ttl
+        self.max_size = max_size
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()  # key -> [value, version, fetched_at, checked_at]
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stale': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def _version_of(self, value):
+        return value.get(self.version_key) if isinstance(value, dict) else None
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now - entry[2] > self.ttl:
+                    del self._entries[key]
+                    self._stats['expired'] += 1
+                    entry = None
+
+        if entry is not None:
+            value, version, _, checked_at = entry
+            if self.version is None or now - checked_at < self.revalidate_after:
+                self._count('hits')
+                return value
+            if self.version(key) == version:
+                entry[3] = now
+                self._count('hits')
+                self._count('revalidated')
+                return value
+            self._count('stale')
+        else:
+            self._count('misses')
+
+        value = self.load(key)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = [value, self._version_of(value), now, now]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self._stats['invalidations'] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['max_size'] = self.max_size
+        return stats
+
+
+class DeviceFingerprints:
+    """Compact per-column hashes of each device's last stored state.
+
+    ``plan`` compares an incoming device against the fingerprint to decide
+    what ``Database.sync_devices`` has to write: the full upsert for devices
+    this process has not seen, only the changed columns, or just a
+    heartbeat. Each fingerprint is one CRC32 per column plus the row_version
+    it was stored under, so stale fingerprints (another worker wrote the
+    row) are caught by the version guard rather than trusted.
+    """
+
+    def __init__(self, columns, max_devices=100000):
+        self.columns = columns
+        self.max_devices = max_devices
+        self._states = OrderedDict()  # device_id -> (row_version, hashes)
+        self._lock = threading.Lock()
+        self._stats = {
+            'upserts': 0,
+            'updates': 0,
+            'heartbeats': 0,
+            'conflicts': 0,
+            'columns_written': 0,
+            'columns_skipped': 0,
+        }
+
+    def _hashes(self, device):
+        return tuple(zlib.crc32(repr(getattr(device, column)).encode()) for column in self.columns)
+
+    def plan(self, device):
+        """``(device, columns, row_version)`` as taken by Database.sync_devices"""
+        with self._lock:
+            state = self._states.get(device.device_id)
+        if state is None or state[0] is None:
+            return device, None, None
+        row_version, hashes = state
+        changed = tuple(
+            column for column, old, new in zip(self.columns, hashes, self._hashes(device))
+            if old != new
+        )
+        return device, changed, row_version
+
+    def record(self, device, columns, row_version, kind):
+        """Remember what a planned write of ``columns`` stored for ``device``"""
+        with self._lock:
+            self._states[device.device_id] = (row_version, self._hashes(device))
+            self._states.move_to_end(device.device_id)
+            while len(self._states) > self.max_devices:
+                self._states.popitem(last=False)
+
+            if kind == 'conflict':
+                self._stats['conflicts'] += 1
+                kind = 'upsert'
+            self._stats[kind + 's'] += 1
+            written = len(self.columns) if kind == 'upsert' else len(columns)
+            self._stats['columns_written'] += written
+            self._stats['columns_skipped'] += len(self.columns) - written
+
+    def forget(self, device_id):
+        with self._lock:
+            self._states.pop(device_id, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['devices'] = len(self._states)
+            stats['max_devices'] = self.max_devices
+        return stats
+
+
+class RecentUploads:
+    """Row ids of recently stored uploads by ``(kind, device_id, client_seq)``.
+
+    Lets a client's retry of an upload that already succeeded be answered
+    from memory. It is only a shortcut: ingest_keys stays authoritative for
+    keys evicted here or stored by another worker.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get_many(self, kind, items):
+        """Stored row id per item, None for unknown or unkeyed items"""
+        ids = []
+        with self._lock:
+            for item in items:
+                row_id = None
+                if item.client_seq is not None:
+                    row_id = self._ids.get((kind, item.device_id, item.client_seq))
+                    self._stats['hits' if row_id is not None else 'misses'] += 1
+                ids.append(row_id)
+        return ids
+
+    def put_many(self, kind, items, ids):
+        with self._lock:
+            for item, row_id in zip(items, ids):
+                if item.client_seq is None or row_id is None:
+                    continue
+                key = (kind, item.device_id, item.client_seq)
+                self._ids[key] = row_id
+                self._ids.move_to_end(key)
+            while len(self._ids) > self.max_keys:
+                self._ids.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._ids)
+            stats['max_keys'] = self.max_keys
+        return stats
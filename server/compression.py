@@ -0,0 +1,108 @@
+# server/compression.py
+import gzip
+import io
+import zlib
+from flask import request, jsonify
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class DecompressionError(ValueError):
+    """Raised for request bodies that cannot be decompressed"""
+
+
+class BodyTooLargeError(DecompressionError):
+    """Raised when a body inflates past the configured limit"""
+
+
+def supported_encodings():
+    """Content codings this server can read and write, best first"""
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def decompress(data, encoding, max_size):
+    """Inflate ``data``, never producing more than ``max_size`` bytes"""
+    if encoding == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(data, max_size + 1)
+        except zlib.error as e:
+            raise DecompressionError(f'Invalid gzip body: {e}') from e
+        if len(body) > max_size or inflater.unconsumed_tail:
+            raise BodyTooLargeError(f'Decompressed body exceeds {max_size} bytes')
+        if not inflater.eof:
+            raise DecompressionError('Truncated gzip body')
+        return body
+    if encoding == 'zstd' and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+        try:
+            body = reader.read(max_size + 1)
+        except zstandard.ZstdError as e:
+            raise DecompressionError(f'Invalid zstd body: {e}') from e
+        if len(body) > max_size:
+            raise BodyTooLargeError(f'Decompressed body exceeds {max_size} bytes')
+        return body
+    raise DecompressionError(f'Unsupported Content-Encoding: {encoding}')
+
+
+def compress(data, encoding, level):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def init_compression(app, min_size=1024, max_decompressed_size=10 * 1024 * 1024,
+                     gzip_level=6, zstd_level=3):
+    """Transparent Content-Encoding support for requests and responses.
+
+    Compressed request bodies are inflated before any handler reads
+    ``request.json``, up to ``max_decompressed_size`` bytes (413 above
+    that, so a small zip bomb cannot expand in memory). Responses of at
+    least ``min_size`` bytes are compressed with the best coding the client
+    lists in Accept-Encoding. Streamed responses (exports) are left alone.
+    """
+
+    @app.before_request
+    def decompress_request():
+        encoding = request.headers.get('Content-Encoding', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return None
+        if encoding not in supported_encodings():
+            return jsonify({'success': False, 'error': f'Unsupported Content-Encoding: {encoding}'}), 415
+        # Compressed bodies never need to be larger than what they inflate to
+        if request.content_length is not None and request.content_length > max_decompressed_size:
+            return jsonify({'success': False, 'error': 'Request body too large'}), 413
+        try:
+            body = decompress(request.stream.read(max_decompressed_size + 1), encoding, max_decompressed_size)
+        except BodyTooLargeError as e:
+            return jsonify({'success': False, 'error': str(e)}), 413
+        except DecompressionError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        # Hand the inflated body to Werkzeug as if it had been sent plain
+        environ = request.environ
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ.pop('HTTP_CONTENT_ENCODING', None)
+        request.__dict__.pop('stream', None)
+        return None
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+        encoding = request.accept_encodings.best_match(supported_encodings())
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress(data, encoding, zstd_level if encoding == 'zstd' else gzip_level))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,80 @@
+# server/config.py
+import os
+from dotenv import load_dotenv
+from partitions import PartitionPolicy
+
+load_dotenv()
+
+# Database configuration; DB_BACKEND=sqlite uses the embedded database
+# file at DB_PATH instead of a MySQL server
+db_config = {
+    'backend': os.getenv('DB_BACKEND', 'mysql'),
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'user': os.getenv('DB_USER', 'root'),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'database': os.getenv('DB_NAME', 'phone_tracker'),
+    'path': os.getenv('DB_PATH', 'phone_tracker.db'),
+    'busy_timeout': float(os.getenv('DB_BUSY_TIMEOUT', 5)),
+    'synchronous': os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+}
+
+def _replica_config(spec):
+    """Primary settings with the replica's ``host[:port]`` (MySQL) or
+    database file (SQLite) swapped in"""
+    if db_config['backend'] == 'sqlite':
+        return dict(db_config, path=spec)
+    host, _, port = spec.partition(':')
+    config = dict(db_config, host=host)
+    if port:
+        config['port'] = int(port)
+    return config
+
+# Read replicas for history, spatial and telemetry queries, e.g.
+# "replica1,replica2:3307"
+replica_configs = [
+    _replica_config(spec.strip())
+    for spec in os.getenv('DB_REPLICAS', '').split(',') if spec.strip()
+]
+
+def _shard_config(spec):
+    """Primary settings with the shard's ``host[:port][/database]`` (MySQL)
+    or database file (SQLite) swapped in"""
+    if db_config['backend'] == 'sqlite':
+        return dict(db_config, path=spec)
+    address, _, database = spec.partition('/')
+    config = _replica_config(address)
+    if database:
+        config['database'] = database
+    return config
+
+# Device-id shards as "name=target,..." e.g. "s1=db1/phone_tracker,s2=db2";
+# names place shards on the hash ring, so keep them stable
+shard_configs = {
+    name.strip(): _shard_config(target.strip())
+    for name, _, target in (
+        spec.partition('=') for spec in os.getenv('DB_SHARDS', '').split(',') if spec.strip()
+    )
+}
+
+replica_options = {
+    'strategy': os.getenv('DB_REPLICA_STRATEGY', 'round_robin'),
+    'max_lag': float(os.getenv('DB_REPLICA_MAX_LAG', 5)),
+    'check_interval': float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5)),
+    'retry_after': float(os.getenv('DB_REPLICA_RETRY_AFTER', 30))
+}
+
+# Connection pool configuration
+pool_config = {
+    'size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 10)),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+    'recycle': int(os.getenv('DB_POOL_RECYCLE', 3600)),
+    'pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1'
+}
+
+# Time-partitioned tables, e.g. "locations:day:90,messages:month:365"
+# (table:granularity:retention_days, retention 0 keeps everything)
+partition_policies = [
+    PartitionPolicy.parse(spec, premake=int(os.getenv('PARTITION_PREMAKE', 7)))
+    for spec in os.getenv('PARTITION_TABLES', '').split(',') if spec.strip()
+]
@@ -1,215 +1,677 @@
 # server/database.py
-import mysql.connector
-from mysql.connector import Error
+import threading
 from contextlib import contextmanager
+from datetime import datetime
+from backends import create_backend
+from metrics import InstrumentedConnection
+from pool import ConnectionPool
+from replicas import ReplicaSet
+import geo
 
 class Database:
-    def __init__(self, config):
+    def __init__(self, config, pool_config=None, replicas=None, replica_options=None):
         self.config = config
+        self.backend = create_backend(config)
+        self.pool = ConnectionPool(
+            connect=lambda: InstrumentedConnection(self.backend.connect()),
+            ping=self.backend.ping,
+            **(pool_config or {})
+        )
+        # History and spatial reads go to replicas when configured
+        self.replicas = None
+        if replicas:
+            self.replicas = ReplicaSet(replicas, pool_config, **(replica_options or {}))
+        self._local = threading.local()
     
     @contextmanager
-    def get_connection(self):
-        conn = None
+    def get_connection(self, discard_on_error=False):
         try:
-            conn = mysql.connector.connect(**self.config)
-            yield conn
-        except Error as e:
+            with self.pool.connection(discard_on_error=discard_on_error) as conn:
+                yield conn
+        except self.backend.Error as e:
             print(f"Database error: {e}")
             raise
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
     
-    def initialize_database(self):
-        """Create tables if not exists"""
+    @contextmanager
+    def read_connection(self, discard_on_error=False):
+        """Connection for a read that tolerates replication lag.
+        
+        Uses a replica when one is usable, otherwise the primary. A replica
+        that cannot hand out a connection is taken out of rotation and the
+        read falls back to the primary; one that drops mid-query is taken
+        out of rotation and the error propagates.
+        """
+        replica = None
+        if self.replicas is not None and not getattr(self._local, 'primary_reads', False):
+            replica = self.replicas.choose()
+        if replica is not None:
+            acquired = False
+            try:
+                with replica.pool.connection(discard_on_error=discard_on_error) as conn:
+                    acquired = True
+                    yield conn
+                return
+            except Exception as e:
+                if acquired and not replica.backend.is_disconnect(e):
+                    raise
+                self.replicas.failed(replica, e)
+                if acquired:
+                    raise
+        with self.get_connection(discard_on_error) as conn:
+            yield conn
+    
+    def read_from_primary(self, enabled=True):
+        """Send the calling thread's reads to the primary (read-your-writes)"""
+        self._local.primary_reads = enabled
+    
+    def pool_stats(self):
+        return self.pool.stats()
+    
+    def replica_stats(self):
+        return self.replicas.stats() if self.replicas is not None else {}
+    
+    def close(self):
+        self.pool.dispose()
+        if self.replicas is not None:
+            self.replicas.dispose()
+    
+    INSERT_LOCATION_QUERY = """
+        INSERT INTO locations 
+        (device_id, latitude, longitude, altitude, accuracy, speed, bearing, timestamp, geohash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    
+    INSERT_DEVICE_QUERY = """
+        INSERT INTO devices 
+        (device_id, model, manufacturer, android_version, sdk_version, 
+         battery_level, battery_status, storage_total, storage_available,
+         ram_total, ram_available, screen_width, screen_height,
+         imei, sim_serial, phone_number, last_seen)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE
+            model=VALUES(model),
+            manufacturer=VALUES(manufacturer),
+            android_version=VALUES(android_version),
+            sdk_version=VALUES(sdk_version),
+            battery_level=VALUES(battery_level),
+            battery_status=VALUES(battery_status),
+            storage_total=VALUES(storage_total),
+            storage_available=VALUES(storage_available),
+            ram_total=VALUES(ram_total),
+            ram_available=VALUES(ram_available),
+            screen_width=VALUES(screen_width),
+            screen_height=VALUES(screen_height),
+            imei=VALUES(imei),
+            sim_serial=VALUES(sim_serial),
+            phone_number=VALUES(phone_number),
+            last_seen=VALUES(last_seen),
+            row_version=row_version + 1
+    """
+    
+    # Columns of DeviceModel written by INSERT_DEVICE_QUERY, in order
+    DEVICE_COLUMNS = (
+        'model', 'manufacturer', 'android_version', 'sdk_version',
+        'battery_level', 'battery_status', 'storage_total', 'storage_available',
+        'ram_total', 'ram_available', 'screen_width', 'screen_height',
+        'imei', 'sim_serial', 'phone_number'
+    )
+    
+    # Heartbeat: only last_seen changes; last_updated=last_updated stops the
+    # ON UPDATE CURRENT_TIMESTAMP and row_version is left alone
+    TOUCH_DEVICE_QUERY = """
+        UPDATE devices SET last_seen = NOW(), last_updated = last_updated
+        WHERE device_id = %s AND row_version = %s
+    """
+    
+    # DeviceModel fields sampled into device_telemetry on every report
+    TELEMETRY_METRICS = ('battery_level', 'storage_available', 'ram_available')
+    
+    TELEMETRY_RESOLUTIONS = ('hour', 'day')
+    
+    INSERT_TELEMETRY_QUERY = f"""
+        INSERT INTO device_telemetry (device_id, {', '.join(TELEMETRY_METRICS)}, created_at)
+        VALUES (%s, {', '.join(['%s'] * len(TELEMETRY_METRICS))}, %s)
+    """
+    
+    # One sample folded into a rollup bucket. LEAST/GREATEST return NULL if
+    # either side is NULL, hence the COALESCEs for metrics a device omits.
+    UPSERT_ROLLUP_QUERY = f"""
+        INSERT INTO device_telemetry_rollups
+        (device_id, resolution, bucket, samples,
+         {', '.join(f'{m}_min, {m}_max, {m}_sum, {m}_count' for m in TELEMETRY_METRICS)})
+        VALUES (%s, %s, %s, 1, {', '.join(['%s'] * 4 * len(TELEMETRY_METRICS))})
+        ON DUPLICATE KEY UPDATE
+            samples = samples + 1,
+            {', '.join(
+                f'{m}_min = LEAST(COALESCE({m}_min, VALUES({m}_min)), COALESCE(VALUES({m}_min), {m}_min)), '
+                f'{m}_max = GREATEST(COALESCE({m}_max, VALUES({m}_max)), COALESCE(VALUES({m}_max), {m}_max)), '
+                f'{m}_sum = {m}_sum + VALUES({m}_sum), '
+                f'{m}_count = {m}_count + VALUES({m}_count)'
+                for m in TELEMETRY_METRICS
+            )}
+    """
+    
+    INSERT_MESSAGE_QUERY = """
+        INSERT INTO messages 
+        (device_id, sender, recipient, message_body, message_type, timestamp, read_status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+    
+    INSERT_NOTIFICATION_QUERY = """
+        INSERT INTO notifications 
+        (device_id, app_name, title, text, package_name, timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    
+    # Client sequence numbers of stored uploads. A key is claimed with
+    # INSERT IGNORE in the same transaction as its row, then pointed at it.
+    CLAIM_INGEST_KEY_QUERY = """
+        INSERT IGNORE INTO ingest_keys (device_id, kind, client_seq) VALUES (%s, %s, %s)
+    """
+    
+    SET_INGEST_ROW_QUERY = """
+        UPDATE ingest_keys SET row_id = %s WHERE device_id = %s AND kind = %s AND client_seq = %s
+    """
+    
+    @staticmethod
+    def _ingest_key(item):
+        return None if item.client_seq is None else (item.device_id, item.client_seq)
+    
+    @staticmethod
+    def _location_values(location):
+        return (
+            location.device_id,
+            location.latitude,
+            location.longitude,
+            location.altitude,
+            location.accuracy,
+            location.speed,
+            location.bearing,
+            location.timestamp,
+            geo.encode(location.latitude, location.longitude)
+        )
+    
+    @staticmethod
+    def _device_values(device):
+        return (
+            device.device_id, device.model, device.manufacturer,
+            device.android_version, device.sdk_version, device.battery_level,
+            device.battery_status, device.storage_total, device.storage_available,
+            device.ram_total, device.ram_available, device.screen_width,
+            device.screen_height, device.imei, device.sim_serial, device.phone_number
+        )
+    
+    @staticmethod
+    def _message_values(message):
+        return (
+            message.device_id, message.sender, message.recipient,
+            message.message_body, message.message_type, message.timestamp,
+            message.read_status
+        )
+    
+    @staticmethod
+    def _notification_values(notification):
+        return (
+            notification.device_id, notification.app_name, notification.title,
+            notification.text, notification.package_name, notification.timestamp
+        )
+    
+    def _insert(self, query, values, kind=None, key=None):
+        if key is not None:
+            return self._insert_keyed(kind, query, [values], [key])[0][0]
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Locations table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS locations (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) NOT NULL,
-                    latitude DOUBLE NOT NULL,
-                    longitude DOUBLE NOT NULL,
-                    altitude DOUBLE,
-                    accuracy FLOAT,
-                    speed FLOAT,
-                    bearing FLOAT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_device_id (device_id),
-                    INDEX idx_created_at (created_at)
-                )
-            """)
-            
-            # Devices table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS devices (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) UNIQUE NOT NULL,
-                    model VARCHAR(255),
-                    manufacturer VARCHAR(255),
-                    android_version VARCHAR(50),
-                    sdk_version INT,
-                    battery_level INT,
-                    battery_status VARCHAR(50),
-                    storage_total BIGINT,
-                    storage_available BIGINT,
-                    ram_total BIGINT,
-                    ram_available BIGINT,
-                    screen_width INT,
-                    screen_height INT,
-                    imei VARCHAR(255),
-                    sim_serial VARCHAR(255),
-                    phone_number VARCHAR(50),
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Messages table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) NOT NULL,
-                    sender VARCHAR(255),
-                    recipient VARCHAR(255),
-                    message_body TEXT,
-                    message_type VARCHAR(20),
-                    timestamp BIGINT,
-                    read_status BOOLEAN,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_device_id (device_id),
-                    INDEX idx_timestamp (timestamp)
-                )
-            """)
-            
-            # Notifications table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS notifications (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) NOT NULL,
-                    app_name VARCHAR(255),
-                    title VARCHAR(500),
-                    text TEXT,
-                    package_name VARCHAR(255),
-                    timestamp BIGINT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_device_id (device_id),
-                    INDEX idx_timestamp (timestamp)
-                )
-            """)
-            
+            cursor.execute(query, values)
             conn.commit()
-            print("Database tables initialized successfully")
+            return cursor.lastrowid
     
-    def insert_location(self, location):
+    def _insert_many(self, query, rows, kind=None, keys=None, report_inserted=False):
+        """Insert rows with one multi-row INSERT in one transaction.
+        
+        Returns the generated ids in input order (see the backend's
+        ``insert_rows`` for when they can be derived rather than read back).
+        Rows with a key in ``keys`` are deduplicated, see ``_insert_keyed``.
+        With ``report_inserted`` each id comes as ``(id, inserted)``, where
+        inserted is False for a row that had already been stored.
+        """
+        if not rows:
+            return []
+        if keys is not None and any(key is not None for key in keys):
+            ids, inserted = self._insert_keyed(kind, query, rows, keys)
+        else:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                ids = self.backend.insert_rows(cursor, query, rows)
+                conn.commit()
+            inserted = [True] * len(rows)
+        return list(zip(ids, inserted)) if report_inserted else ids
+    
+    def _insert_keyed(self, kind, query, rows, keys):
+        """Insert rows carrying ``(device_id, client_seq)`` keys at most once.
+        
+        A key that is already in ingest_keys belongs to an earlier upload of
+        the same row, whose id is returned instead of inserting it again;
+        repeats of a key within ``rows`` share one row. A concurrent upload
+        holding a key's lock makes the claim wait for its commit (or
+        rollback), so a key is never seen half-written. Keys are claimed in
+        sorted order so overlapping batches cannot deadlock. Rows without a
+        key are always inserted.
+        
+        Returns ``(ids, inserted)``: the row id per input row, and whether
+        this call stored it (False for replays and repeats).
+        """
+        owners = {}
+        for index, key in enumerate(keys):
+            if key is not None:
+                owners.setdefault(key, index)
+        ids = [None] * len(rows)
+        inserted = [False] * len(rows)
+        existing = {}
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            query = """
-                INSERT INTO locations 
-                (device_id, latitude, longitude, altitude, accuracy, speed, bearing)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            values = (
-                location.device_id,
-                location.latitude,
-                location.longitude,
-                location.altitude,
-                location.accuracy,
-                location.speed,
-                location.bearing
+            claims = sorted(owners)
+            cursor.executemany(
+                self.CLAIM_INGEST_KEY_QUERY,
+                [(device_id, kind, client_seq) for device_id, client_seq in claims]
             )
-            cursor.execute(query, values)
+            if cursor.rowcount != len(claims):
+                existing = self._stored_ingest_keys(cursor, kind, claims)
+            
+            fresh = [
+                index for index, key in enumerate(keys)
+                if key is None or (owners[key] == index and key not in existing)
+            ]
+            if fresh:
+                stored = self.backend.insert_rows(cursor, query, [rows[index] for index in fresh])
+                for index, row_id in zip(fresh, stored):
+                    ids[index] = row_id
+                    inserted[index] = True
+                claimed = [
+                    (ids[index], device_id, kind, client_seq)
+                    for (device_id, client_seq), index in owners.items()
+                    if (device_id, client_seq) not in existing
+                ]
+                if claimed:
+                    cursor.executemany(self.SET_INGEST_ROW_QUERY, claimed)
             conn.commit()
-            return cursor.lastrowid
+        for index, key in enumerate(keys):
+            if key is not None:
+                ids[index] = existing.get(key, ids[owners[key]])
+        return ids, inserted
+    
+    def _stored_ingest_keys(self, cursor, kind, keys):
+        """Row ids already recorded for ``keys``, skipping those claimed by
+        the current transaction (their row_id is still NULL)"""
+        by_device = {}
+        for device_id, client_seq in keys:
+            by_device.setdefault(device_id, []).append(client_seq)
+        stored = {}
+        for device_id, sequence_numbers in by_device.items():
+            placeholders = ', '.join(['%s'] * len(sequence_numbers))
+            cursor.execute(
+                f"""SELECT client_seq, row_id FROM ingest_keys
+                WHERE device_id = %s AND kind = %s AND client_seq IN ({placeholders})
+                AND row_id IS NOT NULL""",
+                [device_id, kind, *sequence_numbers]
+            )
+            stored.update(((device_id, client_seq), row_id) for client_seq, row_id in cursor.fetchall())
+        return stored
+    
+    def purge_ingest_keys(self, before):
+        """Forget upload keys recorded before ``before``; returns how many.
+        
+        Uploads retried after their key is purged are stored again, so keep
+        keys for longer than clients keep retrying.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM ingest_keys WHERE created_at < %s", (before,))
+            conn.commit()
+            return cursor.rowcount
+    
+    def insert_location(self, location):
+        return self._insert(
+            self.INSERT_LOCATION_QUERY, self._location_values(location),
+            'locations', self._ingest_key(location)
+        )
+    
+    def insert_locations(self, locations, report_inserted=False):
+        return self._insert_many(
+            self.INSERT_LOCATION_QUERY,
+            [self._location_values(location) for location in locations],
+            'locations', [self._ingest_key(location) for location in locations], report_inserted
+        )
     
     def insert_device(self, device):
+        return self._insert(self.INSERT_DEVICE_QUERY, self._device_values(device))
+    
+    def insert_devices(self, devices):
+        """Upsert many devices in one transaction; upserts have no per-row ids"""
+        if not devices:
+            return []
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            query = """
-                INSERT INTO devices 
-                (device_id, model, manufacturer, android_version, sdk_version, 
-                 battery_level, battery_status, storage_total, storage_available,
-                 ram_total, ram_available, screen_width, screen_height,
-                 imei, sim_serial, phone_number)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    model=VALUES(model),
-                    manufacturer=VALUES(manufacturer),
-                    android_version=VALUES(android_version),
-                    sdk_version=VALUES(sdk_version),
-                    battery_level=VALUES(battery_level),
-                    battery_status=VALUES(battery_status),
-                    storage_total=VALUES(storage_total),
-                    storage_available=VALUES(storage_available),
-                    ram_total=VALUES(ram_total),
-                    ram_available=VALUES(ram_available),
-                    screen_width=VALUES(screen_width),
-                    screen_height=VALUES(screen_height),
-                    imei=VALUES(imei),
-                    sim_serial=VALUES(sim_serial),
-                    phone_number=VALUES(phone_number)
-            """
-            values = (
-                device.device_id, device.model, device.manufacturer,
-                device.android_version, device.sdk_version, device.battery_level,
-                device.battery_status, device.storage_total, device.storage_available,
-                device.ram_total, device.ram_available, device.screen_width,
-                device.screen_height, device.imei, device.sim_serial, device.phone_number
+            cursor.executemany(
+                self.INSERT_DEVICE_QUERY,
+                [self._device_values(device) for device in devices]
             )
-            cursor.execute(query, values)
             conn.commit()
-            return cursor.lastrowid
+            return [None] * len(devices)
     
-    def insert_message(self, message):
+    def sync_devices(self, writes):
+        """Apply planned device writes in one transaction.
+        
+        ``writes`` holds ``(device, columns, row_version)`` tuples:
+        ``columns`` None means a full upsert, an empty tuple a heartbeat,
+        otherwise only those columns are updated. Narrowed writes are guarded
+        by the expected ``row_version``; when another writer got there first
+        the guard matches no row and the device falls back to a full upsert.
+        
+        Returns ``(row_id, row_version, kind)`` per write, where kind is
+        'upsert', 'update', 'heartbeat' or 'conflict' (upserted after a
+        failed guard). row_id is only known for newly inserted devices.
+        """
+        results = [None] * len(writes)
+        upserts = []
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            query = """
-                INSERT INTO messages 
-                (device_id, sender, recipient, message_body, message_type, timestamp, read_status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            values = (
-                message.device_id, message.sender, message.recipient,
-                message.message_body, message.message_type, message.timestamp,
-                message.read_status
-            )
-            cursor.execute(query, values)
+            for index, (device, columns, row_version) in enumerate(writes):
+                if columns is None:
+                    upserts.append((index, 'upsert'))
+                    continue
+                if columns:
+                    assignments = ', '.join(f'{column} = %s' for column in columns)
+                    cursor.execute(
+                        f"""UPDATE devices SET {assignments}, last_seen = NOW(),
+                            row_version = row_version + 1
+                        WHERE device_id = %s AND row_version = %s""",
+                        [getattr(device, column) for column in columns] + [device.device_id, row_version]
+                    )
+                    kind, row_version = 'update', row_version + 1
+                else:
+                    cursor.execute(self.TOUCH_DEVICE_QUERY, (device.device_id, row_version))
+                    kind = 'heartbeat'
+                if cursor.rowcount == 1:
+                    results[index] = (None, row_version, kind)
+                else:
+                    upserts.append((index, 'conflict'))
+            
+            if upserts:
+                for index, kind in upserts:
+                    cursor.execute(self.INSERT_DEVICE_QUERY, self._device_values(writes[index][0]))
+                device_ids = list({writes[index][0].device_id for index, _ in upserts})
+                placeholders = ', '.join(['%s'] * len(device_ids))
+                cursor.execute(
+                    f"SELECT device_id, id, row_version FROM devices WHERE device_id IN ({placeholders})",
+                    device_ids
+                )
+                stored = {device_id: (row_id, row_version) for device_id, row_id, row_version in cursor.fetchall()}
+                for index, kind in upserts:
+                    row_id, row_version = stored[writes[index][0].device_id]
+                    # The upsert bumps row_version on existing rows, so 0
+                    # means this transaction inserted the device
+                    results[index] = (row_id if row_version == 0 else None, row_version, kind)
+            self._record_telemetry(cursor, [device for device, _, _ in writes])
             conn.commit()
-            return cursor.lastrowid
+        return results
+    
+    def _record_telemetry(self, cursor, devices, recorded_at=None):
+        """Append telemetry samples and fold them into the hourly and daily
+        rollups, in the caller's transaction"""
+        recorded_at = (recorded_at or datetime.now()).replace(microsecond=0)
+        buckets = {
+            'hour': recorded_at.replace(minute=0, second=0),
+            'day': recorded_at.replace(hour=0, minute=0, second=0),
+        }
+        samples = []
+        rollups = []
+        for device in devices:
+            values = [getattr(device, metric) for metric in self.TELEMETRY_METRICS]
+            if all(value is None for value in values):
+                continue
+            samples.append((device.device_id, *values, recorded_at))
+            aggregates = []
+            for value in values:
+                aggregates.extend((value, value, value or 0, int(value is not None)))
+            for resolution in self.TELEMETRY_RESOLUTIONS:
+                rollups.append((device.device_id, resolution, buckets[resolution], *aggregates))
+        if samples:
+            cursor.executemany(self.INSERT_TELEMETRY_QUERY, samples)
+            cursor.executemany(self.UPSERT_ROLLUP_QUERY, rollups)
+    
+    def insert_message(self, message):
+        return self._insert(
+            self.INSERT_MESSAGE_QUERY, self._message_values(message),
+            'messages', self._ingest_key(message)
+        )
+    
+    def insert_messages(self, messages, report_inserted=False):
+        return self._insert_many(
+            self.INSERT_MESSAGE_QUERY,
+            [self._message_values(message) for message in messages],
+            'messages', [self._ingest_key(message) for message in messages], report_inserted
+        )
     
     def insert_notification(self, notification):
-        with self.get_connection() as conn:
+        return self._insert(
+            self.INSERT_NOTIFICATION_QUERY, self._notification_values(notification),
+            'notifications', self._ingest_key(notification)
+        )
+    
+    def insert_notifications(self, notifications, report_inserted=False):
+        return self._insert_many(
+            self.INSERT_NOTIFICATION_QUERY,
+            [self._notification_values(notification) for notification in notifications],
+            'notifications', [self._ingest_key(notification) for notification in notifications], report_inserted
+        )
+    
+    LOCATION_COLUMNS = (
+        'id, device_id, latitude, longitude, altitude, accuracy, speed, bearing, created_at, '
+        'timestamp'
+    )
+    
+    def get_locations(self, device_id, limit=100, since=None, until=None, before=None):
+        """Return one newest-first page of a device's locations.
+        
+        ``since``/``until`` bound ``created_at`` (inclusive/exclusive) and
+        ``before`` is the ``(created_at, id)`` key of the last row of the
+        previous page. Every predicate is a range on the
+        ``(device_id, created_at, id)`` index, so the cost is bounded by
+        ``limit`` rather than by the device's history.
+        """
+        conditions = ['device_id = %s']
+        params = [device_id]
+        if since is not None:
+            conditions.append('created_at >= %s')
+            params.append(since)
+        if until is not None:
+            conditions.append('created_at < %s')
+            params.append(until)
+        if before is not None:
+            created_at, location_id = before
+            conditions.append('(created_at < %s OR (created_at = %s AND id < %s))')
+            params.extend([created_at, created_at, location_id])
+        params.append(limit)
+        
+        with self.read_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            query = f"""
+                SELECT {self.LOCATION_COLUMNS} FROM locations 
+                WHERE {' AND '.join(conditions)} 
+                ORDER BY created_at DESC, id DESC 
+                LIMIT %s
+            """
+            cursor.execute(query, params)
+            return cursor.fetchall()
+    
+    def get_track(self, device_id, since=None, until=None, limit=200000):
+        """A device's fixes in a window as plain tuples, newest first.
+        
+        Rows come back in ``LOCATION_COLUMNS`` order without building a dict
+        per row, ready to be turned into NumPy column arrays.
+        """
+        conditions = ['device_id = %s']
+        params = [device_id]
+        if since is not None:
+            conditions.append('created_at >= %s')
+            params.append(since)
+        if until is not None:
+            conditions.append('created_at < %s')
+            params.append(until)
+        params.append(limit)
+        
+        with self.read_connection() as conn:
             cursor = conn.cursor()
-            query = """
-                INSERT INTO notifications 
-                (device_id, app_name, title, text, package_name, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s)
+            query = f"""
+                SELECT {self.LOCATION_COLUMNS} FROM locations 
+                WHERE {' AND '.join(conditions)} 
+                ORDER BY created_at DESC, id DESC 
+                LIMIT %s
             """
-            values = (
-                notification.device_id, notification.app_name, notification.title,
-                notification.text, notification.package_name, notification.timestamp
-            )
-            cursor.execute(query, values)
-            conn.commit()
-            return cursor.lastrowid
+            cursor.execute(query, params)
+            return cursor.fetchall()
     
-    def get_locations(self, device_id, limit=100):
-        with self.get_connection() as conn:
+    def iter_locations(self, device_id, since=None, until=None, batch_size=1000):
+        """Stream a device's fixes oldest first, ``batch_size`` tuples at a time.
+        
+        Uses an unbuffered cursor so rows are pulled from the server as the
+        caller consumes them; memory stays bounded by one batch however
+        large the history is. The connection is held until the generator is
+        exhausted or closed, and is discarded if it is abandoned part way.
+        """
+        conditions = ['device_id = %s']
+        params = [device_id]
+        if since is not None:
+            conditions.append('created_at >= %s')
+            params.append(since)
+        if until is not None:
+            conditions.append('created_at < %s')
+            params.append(until)
+        
+        with self.read_connection(discard_on_error=True) as conn:
+            cursor = conn.cursor(buffered=False)
+            query = f"""
+                SELECT {self.LOCATION_COLUMNS} FROM locations 
+                WHERE {' AND '.join(conditions)} 
+                ORDER BY created_at, id
+            """
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+    
+    def get_latest_locations(self, limit=100000):
+        """Newest fix of the ``limit`` most recently active devices.
+        
+        The inner GROUP BY is a loose index scan over
+        ``(device_id, created_at, id)``: one index dive per device.
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            query = f"""
+                SELECT {', '.join('l.' + c for c in self.LOCATION_COLUMNS.split(', '))}
+                FROM (
+                    SELECT device_id, MAX(created_at) AS created_at
+                    FROM locations GROUP BY device_id
+                    ORDER BY created_at DESC LIMIT %s
+                ) latest
+                JOIN locations l
+                    ON l.device_id = latest.device_id AND l.created_at = latest.created_at
+            """
+            cursor.execute(query, (limit,))
+            latest = {}
+            for row in cursor.fetchall():
+                # Several fixes can share the newest second; keep the last one
+                current = latest.get(row['device_id'])
+                if current is None or row['id'] > current['id']:
+                    latest[row['device_id']] = row
+            return list(latest.values())
+    
+    def get_locations_in_cells(self, cells, since=None, until=None, limit=1000):
+        """Fixes whose geohash starts with one of ``cells``, newest first.
+        
+        Each prefix is a range scan on ``(geohash, created_at)``; callers
+        filter the candidates down to the exact area.
+        """
+        if not cells:
+            return []
+        conditions = ['(' + ' OR '.join(['geohash LIKE %s'] * len(cells)) + ')']
+        params = [cell + '%' for cell in cells]
+        if since is not None:
+            conditions.append('created_at >= %s')
+            params.append(since)
+        if until is not None:
+            conditions.append('created_at < %s')
+            params.append(until)
+        params.append(limit)
+        
+        with self.read_connection() as conn:
             cursor = conn.cursor(dictionary=True)
-            query = """
-                SELECT * FROM locations 
-                WHERE device_id = %s 
+            query = f"""
+                SELECT {self.LOCATION_COLUMNS} FROM locations 
+                WHERE {' AND '.join(conditions)} 
                 ORDER BY created_at DESC 
                 LIMIT %s
             """
-            cursor.execute(query, (device_id, limit))
+            cursor.execute(query, params)
+            return cursor.fetchall()
+    
+    def get_telemetry(self, device_id, resolution='hour', since=None, until=None, limit=1000):
+        """Oldest-first telemetry of one device.
+        
+        ``resolution`` 'hour' or 'day' reads the rollups (one row per
+        bucket with min/max/avg per metric); 'raw' reads the samples.
+        """
+        if resolution == 'raw':
+            table, time_column = 'device_telemetry', 'created_at'
+            columns = f"{time_column}, {', '.join(self.TELEMETRY_METRICS)}"
+            conditions = ['device_id = %s']
+            params = [device_id]
+        elif resolution in self.TELEMETRY_RESOLUTIONS:
+            table, time_column = 'device_telemetry_rollups', 'bucket'
+            columns = 'bucket, samples, ' + ', '.join(
+                f'{m}_min, {m}_max, CAST({m}_sum AS DOUBLE) / NULLIF({m}_count, 0) AS {m}_avg'
+                for m in self.TELEMETRY_METRICS
+            )
+            conditions = ['device_id = %s', 'resolution = %s']
+            params = [device_id, resolution]
+        else:
+            raise ValueError(f'Unknown telemetry resolution: {resolution}')
+        if since is not None:
+            conditions.append(f'{time_column} >= %s')
+            params.append(since)
+        if until is not None:
+            conditions.append(f'{time_column} < %s')
+            params.append(until)
+        params.append(limit)
+        
+        with self.read_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            query = f"""
+                SELECT {columns} FROM {table}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {time_column}
+                LIMIT %s
+            """
+            cursor.execute(query, params)
             return cursor.fetchall()
     
+    # Device reads stay on the primary: device_cache validates entries
+    # against row_version, which a lagging replica would report stale
+    def get_device_version(self, device_id):
+        """Cheap staleness check: an index-only read of the device's row_version"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor(buffered=True)
+            query = "SELECT row_version FROM devices WHERE device_id = %s"
+            cursor.execute(query, (device_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
     def get_device_info(self, device_id):
         with self.get_connection() as conn:
-            cursor = conn.cursor(dictionary=True)
+            cursor = conn.cursor(dictionary=True, buffered=True)
             query = "SELECT * FROM devices WHERE device_id = %s"
             cursor.execute(query, (device_id,))
             return cursor.fetchone()
\ No newline at end of file
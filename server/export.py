@@ -0,0 +1,186 @@
+# server/export.py
+import csv
+import io
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Typed columns of a binary location export, keyed by LOCATION_COLUMNS name.
+# Missing optional values become NaN (-1 for the client timestamp);
+# created_at is epoch milliseconds.
+NUMERIC_COLUMNS = [
+    ('id', np.int64),
+    ('latitude', np.float64),
+    ('longitude', np.float64),
+    ('altitude', np.float64),
+    ('accuracy', np.float32),
+    ('speed', np.float32),
+    ('bearing', np.float32),
+    ('created_at', np.dtype('datetime64[ms]')),
+    ('timestamp', np.int64),
+]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def ndjson_chunks(columns, batches):
+    """One JSON object per line; yields one string per batch of rows"""
+    encoder = json.JSONEncoder(default=_json_default, separators=(',', ':'))
+    for rows in batches:
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+def csv_chunks(columns, batches):
+    """CSV with a header row; yields one string per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def column_arrays(columns, rows):
+    """Turn a batch of row tuples into one typed NumPy array per column"""
+    positions = {name: index for index, name in enumerate(columns)}
+    arrays = {}
+    for name, dtype in NUMERIC_COLUMNS:
+        index = positions[name]
+        if name == 'created_at':
+            values = (int(row[index].timestamp() * 1000) for row in rows)
+            arrays[name] = np.fromiter(values, dtype=np.int64, count=len(rows)).astype(dtype)
+        elif dtype is np.int64:
+            values = (-1 if row[index] is None else row[index] for row in rows)
+            arrays[name] = np.fromiter(values, dtype=dtype, count=len(rows))
+        else:
+            values = (np.nan if row[index] is None else row[index] for row in rows)
+            arrays[name] = np.fromiter(values, dtype=dtype, count=len(rows))
+    return arrays
+
+
+# Fixed .npy header size so the row count can be patched in after streaming
+NPY_HEADER_SIZE = 128
+
+
+def _npy_header(dtype, count):
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(np.dtype(dtype)), count
+    )
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def write_npy_columns(directory, columns, batches):
+    """Write one ``<column>.npy`` file per typed column, batch by batch.
+
+    Files are appended to as batches arrive and their headers are rewritten
+    with the final length at the end, so memory stays at one batch. The
+    result loads without parsing via ``np.load(path, mmap_mode='r')``.
+    Returns the number of rows written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = {
+        name: open(os.path.join(directory, f'{name}.npy'), 'wb')
+        for name, _ in NUMERIC_COLUMNS
+    }
+    count = 0
+    try:
+        for name, dtype in NUMERIC_COLUMNS:
+            files[name].write(_npy_header(dtype, 0))
+        for rows in batches:
+            for name, array in column_arrays(columns, rows).items():
+                files[name].write(array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes())
+            count += len(rows)
+        for name, dtype in NUMERIC_COLUMNS:
+            files[name].seek(0)
+            files[name].write(_npy_header(dtype, count))
+    finally:
+        for f in files.values():
+            f.close()
+    return count
+
+
+class _ChunkSink:
+    """Minimal writable file that collects what Arrow writes into chunks"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_schema():
+    return pa.schema([
+        (name, pa.timestamp('ms') if name == 'created_at' else pa.from_numpy_dtype(dtype))
+        for name, dtype in NUMERIC_COLUMNS
+    ])
+
+
+def _arrow_array(field, array):
+    # Sentinels used in the .npy columns become proper Arrow nulls
+    if field.name == 'timestamp':
+        return pa.array(array, type=field.type, mask=array == -1)
+    if array.dtype.kind == 'f':
+        return pa.array(array, type=field.type, from_pandas=True)
+    return pa.array(array, type=field.type)
+
+
+def arrow_chunks(columns, batches):
+    """Arrow IPC file format, one record batch per DB batch.
+
+    The file format (not the stream format) carries a footer, so a saved
+    export can be memory-mapped with ``pyarrow.ipc.open_file`` and read
+    without copying.
+    """
+    if pa is None:
+        raise RuntimeError('pyarrow is not installed')
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    with pa.ipc.new_file(sink, schema) as writer:
+        for rows in batches:
+            arrays = column_arrays(columns, rows)
+            writer.write_batch(pa.record_batch(
+                [_arrow_array(field, arrays[field.name]) for field in schema],
+                schema=schema
+            ))
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,44 @@
+# server/export_columns.py
+import argparse
+import os
+from datetime import datetime
+from config import db_config, pool_config, shard_configs
+from database import Database
+from sharding import open_database
+import export
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export a device track as memory-mappable columnar files'
+    )
+    parser.add_argument('device_id')
+    parser.add_argument('--out', required=True,
+                        help='Output directory (npy) or file (arrow)')
+    parser.add_argument('--format', choices=['npy', 'arrow'], default='npy')
+    parser.add_argument('--since', help='Start of the window (ISO 8601)')
+    parser.add_argument('--until', help='End of the window (ISO 8601)')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    since = datetime.fromisoformat(args.since) if args.since else None
+    until = datetime.fromisoformat(args.until) if args.until else None
+
+    db = open_database(db_config, pool_config, shard_configs)
+    columns = Database.LOCATION_COLUMNS.split(', ')
+    batches = db.iter_locations(args.device_id, since, until, args.batch_size)
+
+    if args.format == 'npy':
+        count = export.write_npy_columns(args.out, columns, batches)
+        print(f"Wrote {count} rows to {args.out}/<column>.npy "
+              f"(load with numpy.load(path, mmap_mode='r'))")
+    else:
+        if export.pa is None:
+            parser.error('pyarrow is required for --format arrow')
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'wb') as f:
+            for chunk in export.arrow_chunks(columns, batches):
+                f.write(chunk)
+        print(f"Wrote {args.out} (open with pyarrow.ipc.open_file(pyarrow.memory_map(path)))")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# server/geo.py
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_M = 6371008.8
+
+# Precision written to locations.geohash (about 3.7cm x 1.9cm cells)
+STORED_PRECISION = 12
+
+
+def encode(latitude, longitude, precision=STORED_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, precision):
+    """Geohash cells of ``precision`` that together cover the bounding box"""
+    height, width = cell_size(precision)
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+
+    row_start = math.floor((min_lat + 90.0) / height)
+    row_stop = math.floor((max_lat + 90.0) / height)
+    col_start = math.floor((min_lon + 180.0) / width)
+    col_stop = math.floor((max_lon + 180.0) / width)
+
+    cells = set()
+    for row in range(row_start, row_stop + 1):
+        lat = min(-90.0 + (row + 0.5) * height, 90.0)
+        for col in range(col_start, col_stop + 1):
+            lon = min(-180.0 + (col + 0.5) * width, 180.0)
+            cells.add(encode(lat, lon, precision))
+    return cells
+
+
+def cover_count(min_lat, min_lon, max_lat, max_lon, precision):
+    height, width = cell_size(precision)
+    rows = math.floor((min(max_lat, 90.0) + 90.0) / height) - math.floor((max(min_lat, -90.0) + 90.0) / height) + 1
+    cols = math.floor((min(max_lon, 180.0) + 180.0) / width) - math.floor((max(min_lon, -180.0) + 180.0) / width) + 1
+    return rows * cols
+
+
+def best_cover(min_lat, min_lon, max_lat, max_lon, precisions, max_cells=32):
+    """Cover the box with the finest precision that needs at most ``max_cells``"""
+    for precision in sorted(precisions, reverse=True):
+        if cover_count(min_lat, min_lon, max_lat, max_lon, precision) <= max_cells:
+            return cover(min_lat, min_lon, max_lat, max_lon, precision)
+    return cover(min_lat, min_lon, max_lat, max_lon, min(precisions))
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance in meters"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(latitude, longitude, radius_m):
+    """Bounding box (min_lat, min_lon, max_lat, max_lon) around a circle"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6 or latitude + dlat >= 90 or latitude - dlat <= -90:
+        return max(latitude - dlat, -90.0), -180.0, min(latitude + dlat, 90.0), 180.0
+    dlon = min(math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+    return latitude - dlat, longitude - dlon, latitude + dlat, longitude + dlon
+
+
+def split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+    """Split a box whose longitudes wrap past +/-180 into boxes that do not"""
+    if min_lon < -180.0:
+        return [(min_lat, min_lon + 360.0, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+    if max_lon > 180.0:
+        return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon - 360.0)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
@@ -0,0 +1,213 @@
+# server/ingest.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class BufferFullError(Exception):
+    """Raised when the write-behind buffer stays full past the put timeout"""
+
+
+class WriteBehindBuffer:
+    """Bounded in-process buffer that group-commits writes per table.
+
+    Handlers ``submit`` validated models and return immediately; a background
+    thread drains each table when it reaches ``flush_size`` items or its
+    oldest item is ``flush_interval`` seconds old, writing each drained batch
+    with one call to the table's writer (one transaction).
+
+    ``durability`` controls when ``submit`` returns:
+
+    * ``'none'``   - as soon as the item is buffered; a crash loses whatever
+                     is still queued.
+    * ``'commit'`` - after the batch containing the item has committed, with
+                     its row id. The flusher does not wait for
+                     ``flush_interval`` here; items that arrive while a
+                     flush is in progress share the next commit.
+
+    Tables listed in ``coalesce`` keep only the newest pending item per key,
+    e.g. repeated device upserts collapse into one row write.
+    """
+
+    def __init__(self, writers, max_items=10000, flush_size=500,
+                 flush_interval=0.2, durability='none', put_timeout=0.0,
+                 coalesce=None, max_retries=3):
+        if durability not in ('none', 'commit'):
+            raise ValueError(f'Unknown durability mode: {durability}')
+        self.writers = writers
+        self.max_items = max_items
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.put_timeout = put_timeout
+        self.coalesce = coalesce or {}
+        self.max_retries = max_retries
+
+        # table -> OrderedDict(key -> [item, futures, enqueued_at])
+        self._queues = {table: OrderedDict() for table in writers}
+        self._pending = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+
+        self._stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'flushes': 0,
+            'rows_written': 0,
+            'flush_errors': 0,
+            'dropped': 0,
+            'rejected': 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, table, item):
+        """Buffer one item; returns its id in 'commit' mode, else None"""
+        return self.submit_many(table, [item])[0]
+
+    def submit_many(self, table, items):
+        """Buffer items atomically; returns their ids in 'commit' mode"""
+        if table not in self._queues:
+            raise KeyError(f'No writer registered for table {table}')
+        if not items:
+            return []
+        key_func = self.coalesce.get(table)
+        futures = [Future() for _ in items] if self.durability == 'commit' else None
+
+        with self._cond:
+            if self._stopping:
+                raise BufferFullError('Write-behind buffer is shutting down')
+            deadline = time.monotonic() + self.put_timeout
+            while self._pending + len(items) > self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['rejected'] += len(items)
+                    raise BufferFullError(
+                        f'Write-behind buffer full ({self._pending} items pending)'
+                    )
+                self._cond.wait(remaining)
+
+            queue = self._queues[table]
+            was_empty = not queue
+            now = time.monotonic()
+            for index, item in enumerate(items):
+                future = futures[index] if futures else None
+                if key_func:
+                    key = key_func(item)
+                    entry = queue.get(key)
+                    if entry is not None:
+                        entry[0] = item
+                        if future:
+                            entry[1].append(future)
+                        self._stats['coalesced'] += 1
+                        continue
+                else:
+                    self._seq += 1
+                    key = self._seq
+                queue[key] = [item, [future] if future else [], now]
+                self._pending += 1
+
+            self._stats['submitted'] += len(items)
+            # Wake the flusher for a full batch or a new flush deadline
+            if was_empty or len(queue) >= self.flush_size:
+                self._cond.notify_all()
+
+        if futures is None:
+            return [None] * len(items)
+        return [future.result() for future in futures]
+
+    def _due_tables(self, now):
+        due = []
+        for table, queue in self._queues.items():
+            if not queue:
+                continue
+            oldest = next(iter(queue.values()))[2]
+            if (self._stopping or self.durability == 'commit'
+                    or len(queue) >= self.flush_size
+                    or now - oldest >= self.flush_interval):
+                due.append(table)
+        return due
+
+    def _next_deadline(self):
+        oldest = [
+            next(iter(queue.values()))[2]
+            for queue in self._queues.values() if queue
+        ]
+        if not oldest:
+            return None
+        return min(oldest) + self.flush_interval
+
+    def _take(self, table):
+        queue = self._queues[table]
+        batch = []
+        while queue and len(batch) < self.flush_size:
+            batch.append(queue.popitem(last=False)[1])
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = self._due_tables(now)
+                    if due or (self._stopping and not self._pending):
+                        break
+                    deadline = self._next_deadline()
+                    self._cond.wait(None if deadline is None else max(0, deadline - now))
+                if not due:
+                    return
+                batches = [(table, self._take(table)) for table in due]
+
+            for table, batch in batches:
+                self._flush(table, batch)
+
+    def _flush(self, table, batch):
+        items = [entry[0] for entry in batch]
+        error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                ids = self.writers[table](items)
+                break
+            except Exception as e:
+                error = e
+                self._stats['flush_errors'] += 1
+                print(f"Write-behind flush of {len(items)} {table} rows failed: {e}")
+                if not self._stopping:
+                    time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        else:
+            ids = None
+
+        with self._cond:
+            self._pending -= len(batch)
+            if ids is None:
+                self._stats['dropped'] += len(batch)
+            else:
+                self._stats['flushes'] += 1
+                self._stats['rows_written'] += len(items)
+            self._cond.notify_all()
+
+        for index, entry in enumerate(batch):
+            for future in entry[1]:
+                if ids is None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(ids[index])
+
+    def close(self, timeout=30):
+        """Flush everything still buffered and stop the flusher thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = self._pending
+            stats['pending_by_table'] = {
+                table: len(queue) for table, queue in self._queues.items()
+            }
+        return stats
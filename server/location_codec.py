@@ -0,0 +1,141 @@
+# server/location_codec.py
+"""Compact binary batch format for location uploads.
+
+Keep in sync with android_app/utils/location_codec.py.
+
+Layout (all integers are LEB128 varints, signed ones zigzag-encoded)::
+
+    magic    b'PTLB'
+    version  1 byte
+    device   varint length + UTF-8 device_id
+    count    varint number of fixes
+    fixes    count x (presence byte, fields...)
+
+Each fix stores fixed-point values as deltas from the previous fix that had
+the field: latitude/longitude in 1e-7 degrees, altitude/accuracy in cm,
+speed in cm/s, bearing in 1/100 degree and timestamp in ms. The presence
+byte flags which optional fields follow; latitude and longitude are always
+present. Version 2 added client_seq (consecutive fixes cost one byte);
+version 1 batches decode unchanged since they never set its bit.
+"""
+
+MAGIC = b'PTLB'
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+CONTENT_TYPE = 'application/x-location-batch'
+
+# (field, scale, presence bit); bit None means required
+FIELDS = (
+    ('latitude', 10 ** 7, None),
+    ('longitude', 10 ** 7, None),
+    ('timestamp', 1, 0x01),
+    ('altitude', 100, 0x02),
+    ('accuracy', 100, 0x04),
+    ('speed', 100, 0x08),
+    ('bearing', 100, 0x10),
+    ('client_seq', 1, 0x20),
+)
+
+
+class CodecError(ValueError):
+    """Raised for malformed location batches"""
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_signed(out, value):
+    _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise CodecError('Truncated location batch')
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 70:
+            raise CodecError('Varint too long')
+
+
+def _read_signed(data, pos):
+    value, pos = _read_varint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def encode(device_id, fixes):
+    """Encode fixes (dicts with the FIELDS keys) for one device"""
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    device = device_id.encode('utf-8')
+    _write_varint(out, len(device))
+    out += device
+    _write_varint(out, len(fixes))
+
+    previous = {name: 0 for name, _, _ in FIELDS}
+    for fix in fixes:
+        presence = 0
+        values = []
+        for name, scale, bit in FIELDS:
+            value = fix.get(name)
+            if value is None:
+                if bit is None:
+                    raise CodecError(f'{name} is required')
+                continue
+            if bit is not None:
+                presence |= bit
+            scaled = int(round(value * scale))
+            values.append(scaled - previous[name])
+            previous[name] = scaled
+        out.append(presence)
+        for delta in values:
+            _write_signed(out, delta)
+    return bytes(out)
+
+
+def decode(data):
+    """Decode a batch into ``(device_id, fixes)``"""
+    if data[:4] != MAGIC:
+        raise CodecError('Not a location batch')
+    if len(data) < 5 or data[4] not in SUPPORTED_VERSIONS:
+        raise CodecError('Unsupported location batch version')
+    pos = 5
+    length, pos = _read_varint(data, pos)
+    if pos + length > len(data):
+        raise CodecError('Truncated location batch')
+    try:
+        device_id = bytes(data[pos:pos + length]).decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise CodecError('Invalid device_id') from e
+    pos += length
+    count, pos = _read_varint(data, pos)
+
+    previous = {name: 0 for name, _, _ in FIELDS}
+    fixes = []
+    for _ in range(count):
+        if pos >= len(data):
+            raise CodecError('Truncated location batch')
+        presence = data[pos]
+        pos += 1
+        fix = {'device_id': device_id}
+        for name, scale, bit in FIELDS:
+            if bit is not None and not presence & bit:
+                fix[name] = None
+                continue
+            delta, pos = _read_signed(data, pos)
+            previous[name] += delta
+            fix[name] = previous[name] if scale == 1 else previous[name] / scale
+        fixes.append(fix)
+    if pos != len(data):
+        raise CodecError('Trailing bytes after location batch')
+    return device_id, fixes
@@ -0,0 +1,286 @@
+# server/metrics.py
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+DB_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram; ``observe`` is a bisect and three adds"""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", _number(bound))])} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class StatsCollector:
+    """Exposes a component's ``stats()`` dict as gauges at scrape time"""
+
+    def __init__(self, prefix, help, stats):
+        self.prefix = prefix
+        self.help = help
+        self.stats = stats
+
+    def render(self):
+        lines = []
+        try:
+            stats = self.stats()
+        except Exception as e:
+            print(f"Metrics collector {self.prefix} failed: {e}")
+            return lines
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'{self.prefix}_{key}'
+            lines.append(f'# HELP {name} {self.help}: {key}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_number(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def stats(self, prefix, help, stats):
+        return self.register(StatsCollector(prefix, help, stats))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+http_duration = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time to produce the response (first byte for streams)',
+    ('method', 'route'))
+http_request_size = REGISTRY.histogram(
+    'http_request_size_bytes', 'Request body size as sent on the wire', ('route',), SIZE_BUCKETS)
+http_response_size = REGISTRY.histogram(
+    'http_response_size_bytes', 'Response body size as sent on the wire (streams excluded)',
+    ('route',), SIZE_BUCKETS)
+app_errors = REGISTRY.counter(
+    'app_errors_total', 'Exceptions turned into error responses', ('route', 'type'))
+db_execute = REGISTRY.histogram(
+    'db_execute_seconds', 'Statement execution time per calling method', ('method', 'statement'),
+    DB_BUCKETS)
+db_commit = REGISTRY.histogram(
+    'db_commit_seconds', 'Commit time per calling method', ('method',), DB_BUCKETS)
+db_errors = REGISTRY.counter(
+    'db_errors_total', 'Statements that raised', ('method', 'statement'))
+db_rows_written = REGISTRY.counter(
+    'db_rows_written_total', 'Rows reported written by INSERT/UPDATE/DELETE', ('table', 'statement'))
+
+
+@lru_cache(maxsize=1024)
+def classify(query):
+    """(statement keyword, written table or None) for a SQL string"""
+    match = re.match(r'\s*(\w+)', query)
+    statement = match.group(1).upper() if match else 'UNKNOWN'
+    table = None
+    if statement in ('INSERT', 'REPLACE'):
+        found = re.search(r'\bINTO\s+(\w+)', query, re.IGNORECASE)
+        table = found and found.group(1)
+    elif statement == 'UPDATE':
+        found = re.match(r'\s*UPDATE\s+(\w+)', query, re.IGNORECASE)
+        table = found and found.group(1)
+    elif statement == 'DELETE':
+        found = re.search(r'\bFROM\s+(\w+)', query, re.IGNORECASE)
+        table = found and found.group(1)
+    return statement, table
+
+
+def _caller(depth=2):
+    """Qualified name of the function ``depth`` frames up, skipping private
+    helpers such as ``Database._insert`` and backend helpers such as
+    ``insert_rows`` in favour of the public method that called them"""
+    frame = sys._getframe(depth)
+    for _ in range(4):
+        helper = (frame.f_code.co_name.startswith('_')
+                  or frame.f_globals.get('__name__') == 'backends')
+        if not helper or frame.f_back is None:
+            break
+        frame = frame.f_back
+    code = frame.f_code
+    return getattr(code, 'co_qualname', code.co_name)
+
+
+class InstrumentedCursor:
+    """Times execute/executemany and counts written rows; everything else
+    is passed straight through to the driver's cursor"""
+
+    def __init__(self, cursor, method):
+        self._cursor = cursor
+        self._method = method
+
+    def _run(self, run, query, params):
+        statement, table = classify(query)
+        start = time.perf_counter()
+        try:
+            result = run(query) if params is None else run(query, params)
+        except Exception:
+            db_errors.inc((self._method, statement))
+            raise
+        db_execute.observe((self._method, statement), time.perf_counter() - start)
+        if table is not None and self._cursor.rowcount and self._cursor.rowcount > 0:
+            db_rows_written.inc((table, statement), self._cursor.rowcount)
+        return result
+
+    def execute(self, query, params=None):
+        return self._run(self._cursor.execute, query, params)
+
+    def executemany(self, query, rows):
+        return self._run(self._cursor.executemany, query, rows)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy labelling cursors with the method that opened them.
+
+    The label is the qualified name of the function calling ``cursor()``
+    (e.g. ``Database.get_locations``), found with one frame lookup per
+    cursor rather than per statement.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._method = 'unknown'
+
+    def cursor(self, *args, **kwargs):
+        self._method = _caller()
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._method)
+
+    def commit(self):
+        start = time.perf_counter()
+        self._conn.commit()
+        db_commit.observe((self._method,), time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def init_metrics(app, registry=REGISTRY):
+    """Per-route request metrics for a Flask app plus the /api/metrics page.
+
+    Register this before other after_request hooks (such as compression)
+    so sizes are measured as they go out on the wire.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        # Read before any hook replaces a compressed body with the inflated one
+        g.metrics_request_size = request.content_length
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_duration.observe((request.method, route), time.perf_counter() - started)
+        http_requests.inc((request.method, route, str(response.status_code)))
+        if g.get('metrics_request_size'):
+            http_request_size.observe((route,), g.metrics_request_size)
+        if not response.is_streamed:
+            http_response_size.observe((route,), response.calculate_content_length() or 0)
+        return response
+
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,41 @@
+# server/migrate.py
+import argparse
+from config import db_config, pool_config, shard_configs
+from migrations import MigrationRunner, LATEST_VERSION
+from sharding import open_database, members
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--target', type=int, default=None,
+                        help=f'Version to migrate to (default: latest, {LATEST_VERSION})')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the pending statements without applying them')
+    parser.add_argument('--status', action='store_true',
+                        help='Print the current schema version and exit')
+    args = parser.parse_args()
+
+    db = open_database(db_config, pool_config, shard_configs)
+    for name, shard in members(db):
+        if name is not None:
+            print(f"Shard {name}:")
+        migrate(MigrationRunner(shard), args)
+
+def migrate(runner, args):
+    if args.status:
+        print(f"Schema version {runner.current_version()} (latest {LATEST_VERSION})")
+        return
+
+    if args.dry_run:
+        if not runner.pending(args.target):
+            print("Schema is up to date")
+        runner.migrate(args.target, dry_run=True)
+        return
+
+    applied = runner.migrate(args.target)
+    if applied:
+        print(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        print("Schema is up to date")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,520 @@
+# server/migrations.py
+LOCK_NAME = 'phone_tracker_migrations'
+
+
+class SchemaVersionError(Exception):
+    """Raised when the database schema is older than the code expects"""
+
+
+class Step:
+    """One DDL/DML statement of a migration.
+
+    ``skip_if`` is an optional predicate ``(cursor, dialect) -> bool`` that
+    makes the step idempotent, e.g. for indexes that may already exist on
+    databases created before migrations were tracked. ``sqlite`` gives the
+    statement, or list of statements, to run instead on the SQLite backend
+    where the MySQL text does not work there.
+    """
+
+    def __init__(self, sql, skip_if=None, sqlite=None):
+        self.sql = ' '.join(sql.split())
+        self.skip_if = skip_if
+        if sqlite is None:
+            sqlite = [sql]
+        elif isinstance(sqlite, str):
+            sqlite = [sqlite]
+        self.sqlite = [' '.join(statement.split()) for statement in sqlite]
+
+    def statements(self, dialect):
+        return self.sqlite if dialect == 'sqlite' else [self.sql]
+
+    def apply(self, cursor, dialect='mysql'):
+        if self.skip_if and self.skip_if(cursor, dialect):
+            return False
+        for statement in self.statements(dialect):
+            cursor.execute(statement)
+        return True
+
+
+class BatchedStep(Step):
+    """A data backfill run in small committed chunks over ``table``'s ids.
+
+    ``sql`` takes the bounds of one chunk as ``id > %s AND id <= %s``
+    parameters. The step walks the primary key from the lowest id present
+    when it starts to the highest, ``batch_size`` ids at a time, so each
+    chunk holds locks briefly and reads only its own id range instead of
+    rescanning rows an earlier chunk already passed over.
+    """
+
+    def __init__(self, sql, table, batch_size=10000, skip_if=None, sqlite=None):
+        super().__init__(sql, skip_if=skip_if, sqlite=sqlite)
+        self.table = table
+        self.batch_size = batch_size
+
+    def apply(self, cursor, dialect='mysql'):
+        if self.skip_if and self.skip_if(cursor, dialect):
+            return False
+        statement, = self.statements(dialect)
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {self.table}')
+        first, last = cursor.fetchone()
+        if first is None:
+            return True
+        lower = first - 1
+        while lower < last:
+            upper = min(lower + self.batch_size, last)
+            cursor.execute(statement, (lower, upper))
+            cursor.execute('COMMIT')
+            lower = upper
+        return True
+
+
+class Migration:
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+def index_exists(table, index):
+    def check(cursor, dialect='mysql'):
+        if dialect == 'sqlite':
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                (table, index)
+            )
+        else:
+            cursor.execute(
+                """
+                SELECT 1 FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+                LIMIT 1
+                """,
+                (table, index)
+            )
+        return cursor.fetchone() is not None
+    return check
+
+
+def index_missing(table, index):
+    exists = index_exists(table, index)
+    return lambda cursor, dialect='mysql': not exists(cursor, dialect)
+
+
+def column_exists(table, column):
+    def check(cursor, dialect='mysql'):
+        if dialect == 'sqlite':
+            cursor.execute("SELECT 1 FROM pragma_table_info(%s) WHERE name = %s", (table, column))
+        else:
+            cursor.execute(
+                """
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+                LIMIT 1
+                """,
+                (table, column)
+            )
+        return cursor.fetchone() is not None
+    return check
+
+
+def add_column(table, column, definition):
+    """Instant metadata-only column add (MySQL 8.0.12+), no table rebuild"""
+    return Step(
+        f'ALTER TABLE {table} ADD COLUMN {column} {definition}, ALGORITHM=INSTANT',
+        skip_if=column_exists(table, column),
+        sqlite=f'ALTER TABLE {table} ADD COLUMN {column} {definition}'
+    )
+
+
+def add_index(table, index, columns, unique=False):
+    """Online index build: InnoDB builds it in place without blocking writes"""
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    return Step(
+        f'ALTER TABLE {table} ADD {kind} {index} ({columns}), ALGORITHM=INPLACE, LOCK=NONE',
+        skip_if=index_exists(table, index),
+        sqlite=f'CREATE {kind} {index} ON {table} ({columns})'
+    )
+
+
+def drop_index(table, index):
+    return Step(
+        f'ALTER TABLE {table} DROP INDEX {index}, ALGORITHM=INPLACE, LOCK=NONE',
+        skip_if=index_missing(table, index),
+        sqlite=f'DROP INDEX {index}'
+    )
+
+
+MIGRATIONS = [
+    Migration(1, 'Initial schema', [
+        Step("""
+            CREATE TABLE IF NOT EXISTS locations (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                latitude DOUBLE NOT NULL,
+                longitude DOUBLE NOT NULL,
+                altitude DOUBLE,
+                accuracy FLOAT,
+                speed FLOAT,
+                bearing FLOAT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_id (device_id),
+                INDEX idx_created_at (created_at)
+            )
+        """, sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS locations (
+                id INTEGER PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                latitude DOUBLE NOT NULL,
+                longitude DOUBLE NOT NULL,
+                altitude DOUBLE,
+                accuracy FLOAT,
+                speed FLOAT,
+                bearing FLOAT,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_device_id ON locations (device_id)",
+            "CREATE INDEX IF NOT EXISTS idx_created_at ON locations (created_at)",
+        ]),
+        Step("""
+            CREATE TABLE IF NOT EXISTS devices (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) UNIQUE NOT NULL,
+                model VARCHAR(255),
+                manufacturer VARCHAR(255),
+                android_version VARCHAR(50),
+                sdk_version INT,
+                battery_level INT,
+                battery_status VARCHAR(50),
+                storage_total BIGINT,
+                storage_available BIGINT,
+                ram_total BIGINT,
+                ram_available BIGINT,
+                screen_width INT,
+                screen_height INT,
+                imei VARCHAR(255),
+                sim_serial VARCHAR(255),
+                phone_number VARCHAR(50),
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """, sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS devices (
+                id INTEGER PRIMARY KEY,
+                device_id VARCHAR(255) UNIQUE NOT NULL,
+                model VARCHAR(255),
+                manufacturer VARCHAR(255),
+                android_version VARCHAR(50),
+                sdk_version INT,
+                battery_level INT,
+                battery_status VARCHAR(50),
+                storage_total BIGINT,
+                storage_available BIGINT,
+                ram_total BIGINT,
+                ram_available BIGINT,
+                screen_width INT,
+                screen_height INT,
+                imei VARCHAR(255),
+                sim_serial VARCHAR(255),
+                phone_number VARCHAR(50),
+                last_updated TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            )
+            """,
+            # Stands in for ON UPDATE CURRENT_TIMESTAMP; heartbeats only set
+            # last_seen and last_updated, which do not fire it
+            """
+            CREATE TRIGGER IF NOT EXISTS devices_last_updated
+            AFTER UPDATE OF model, manufacturer, android_version, sdk_version,
+                battery_level, battery_status, storage_total, storage_available,
+                ram_total, ram_available, screen_width, screen_height,
+                imei, sim_serial, phone_number
+            ON devices
+            BEGIN
+                UPDATE devices SET last_updated = datetime('now', 'localtime') WHERE id = NEW.id;
+            END
+            """,
+        ]),
+        Step("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                sender VARCHAR(255),
+                recipient VARCHAR(255),
+                message_body TEXT,
+                message_type VARCHAR(20),
+                timestamp BIGINT,
+                read_status BOOLEAN,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_id (device_id),
+                INDEX idx_timestamp (timestamp)
+            )
+        """, sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                sender VARCHAR(255),
+                recipient VARCHAR(255),
+                message_body TEXT,
+                message_type VARCHAR(20),
+                timestamp BIGINT,
+                read_status BOOLEAN,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            )
+            """,
+            # SQLite index names are per database, not per table
+            "CREATE INDEX IF NOT EXISTS idx_messages_device_id ON messages (device_id)",
+            "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)",
+        ]),
+        Step("""
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                app_name VARCHAR(255),
+                title VARCHAR(500),
+                text TEXT,
+                package_name VARCHAR(255),
+                timestamp BIGINT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_id (device_id),
+                INDEX idx_timestamp (timestamp)
+            )
+        """, sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                app_name VARCHAR(255),
+                title VARCHAR(500),
+                text TEXT,
+                package_name VARCHAR(255),
+                timestamp BIGINT,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            )
+            """,
+            # SQLite index names are per database, not per table
+            "CREATE INDEX IF NOT EXISTS idx_notifications_device_id ON notifications (device_id)",
+            "CREATE INDEX IF NOT EXISTS idx_notifications_timestamp ON notifications (timestamp)",
+        ]),
+    ]),
+    Migration(2, 'Composite (device_id, created_at, id) index for location history', [
+        add_index('locations', 'idx_device_created_id', 'device_id, created_at, id'),
+        drop_index('locations', 'idx_device_id'),
+    ]),
+    Migration(3, 'Device row version stamp for cache validation', [
+        add_column('devices', 'row_version', 'INT NOT NULL DEFAULT 0'),
+        add_index('devices', 'idx_device_version', 'device_id, row_version'),
+    ]),
+    Migration(4, 'Geohash column and index for spatial location queries', [
+        add_column('locations', 'geohash', 'CHAR(12)'),
+        BatchedStep(
+            'UPDATE locations SET geohash = ST_GeoHash(longitude, latitude, 12) '
+            'WHERE id > %s AND id <= %s AND geohash IS NULL '
+            'AND latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180',
+            'locations'
+        ),
+        add_index('locations', 'idx_geohash_created', 'geohash, created_at'),
+    ]),
+    Migration(5, 'Client fix time on locations', [
+        add_column('locations', 'timestamp', 'BIGINT'),
+    ]),
+    Migration(6, 'Device last-seen time for heartbeat-only updates', [
+        add_column('devices', 'last_seen', 'TIMESTAMP NULL'),
+    ]),
+    Migration(7, 'Device telemetry samples and hourly/daily rollups', [
+        Step("""
+            CREATE TABLE IF NOT EXISTS device_telemetry (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                battery_level INT,
+                storage_available BIGINT,
+                ram_available BIGINT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_created (device_id, created_at)
+            )
+        """, sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS device_telemetry (
+                id INTEGER PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                battery_level INT,
+                storage_available BIGINT,
+                ram_available BIGINT,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_device_created ON device_telemetry (device_id, created_at)",
+        ]),
+        Step("""
+            CREATE TABLE IF NOT EXISTS device_telemetry_rollups (
+                device_id VARCHAR(255) NOT NULL,
+                resolution ENUM('hour', 'day') NOT NULL,
+                bucket DATETIME NOT NULL,
+                samples INT NOT NULL DEFAULT 0,
+                battery_level_min INT,
+                battery_level_max INT,
+                battery_level_sum BIGINT NOT NULL DEFAULT 0,
+                battery_level_count INT NOT NULL DEFAULT 0,
+                storage_available_min BIGINT,
+                storage_available_max BIGINT,
+                storage_available_sum BIGINT NOT NULL DEFAULT 0,
+                storage_available_count INT NOT NULL DEFAULT 0,
+                ram_available_min BIGINT,
+                ram_available_max BIGINT,
+                ram_available_sum BIGINT NOT NULL DEFAULT 0,
+                ram_available_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (device_id, resolution, bucket)
+            )
+        """, sqlite="""
+            CREATE TABLE IF NOT EXISTS device_telemetry_rollups (
+                device_id VARCHAR(255) NOT NULL,
+                resolution TEXT NOT NULL CHECK (resolution IN ('hour', 'day')),
+                bucket DATETIME NOT NULL,
+                samples INT NOT NULL DEFAULT 0,
+                battery_level_min INT,
+                battery_level_max INT,
+                battery_level_sum BIGINT NOT NULL DEFAULT 0,
+                battery_level_count INT NOT NULL DEFAULT 0,
+                storage_available_min BIGINT,
+                storage_available_max BIGINT,
+                storage_available_sum BIGINT NOT NULL DEFAULT 0,
+                storage_available_count INT NOT NULL DEFAULT 0,
+                ram_available_min BIGINT,
+                ram_available_max BIGINT,
+                ram_available_sum BIGINT NOT NULL DEFAULT 0,
+                ram_available_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (device_id, resolution, bucket)
+            )
+        """),
+    ]),
+    Migration(8, 'Client sequence numbers of stored uploads for idempotent retries', [
+        Step("""
+            CREATE TABLE IF NOT EXISTS ingest_keys (
+                device_id VARCHAR(255) NOT NULL,
+                kind ENUM('locations', 'messages', 'notifications') NOT NULL,
+                client_seq BIGINT NOT NULL,
+                row_id BIGINT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (device_id, kind, client_seq),
+                INDEX idx_created_at (created_at)
+            )
+        """, sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS ingest_keys (
+                device_id VARCHAR(255) NOT NULL,
+                kind TEXT NOT NULL CHECK (kind IN ('locations', 'messages', 'notifications')),
+                client_seq BIGINT NOT NULL,
+                row_id BIGINT,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                PRIMARY KEY (device_id, kind, client_seq)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_ingest_keys_created_at ON ingest_keys (created_at)",
+        ]),
+    ]),
+    Migration(9, 'Move log making shard rebalancing restartable', [
+        Step("""
+            CREATE TABLE IF NOT EXISTS shard_moves (
+                source VARCHAR(64) NOT NULL,
+                table_name VARCHAR(64) NOT NULL,
+                device_id VARCHAR(255) NOT NULL,
+                row_key VARCHAR(64) NOT NULL,
+                PRIMARY KEY (source, table_name, device_id, row_key)
+            )
+        """),
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+class MigrationRunner:
+    """Applies numbered migrations and records them in schema_migrations.
+
+    MySQL commits DDL implicitly, so each migration's version row is written
+    right after its last step; steps are idempotent so a migration that was
+    interrupted half way can simply be re-run.
+    """
+
+    def __init__(self, db, migrations=MIGRATIONS):
+        self.db = db
+        self.dialect = db.backend.name
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+
+    def _ensure_version_table(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255),
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    def current_version(self):
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(buffered=True)
+            self._ensure_version_table(cursor)
+            cursor.execute("SELECT MAX(version) FROM schema_migrations")
+            row = cursor.fetchone()
+            return row[0] or 0
+
+    def pending(self, target=None):
+        current = self.current_version()
+        target = LATEST_VERSION if target is None else target
+        return [m for m in self.migrations if current < m.version <= target]
+
+    def plan(self, target=None):
+        """Return the pending migrations as printable lines"""
+        lines = []
+        for migration in self.pending(target):
+            lines.append(f'-- {migration.version}: {migration.description}')
+            for step in migration.steps:
+                lines.extend(f'{statement};' for statement in step.statements(self.dialect))
+        return lines
+
+    def migrate(self, target=None, dry_run=False):
+        """Apply pending migrations up to ``target``; returns versions applied"""
+        if dry_run:
+            for line in self.plan(target):
+                print(line)
+            return []
+
+        applied = []
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(buffered=True)
+            # Serialise concurrent runners, e.g. several workers booting at once
+            with self.db.backend.lock(cursor, LOCK_NAME, 60) as locked:
+                if not locked:
+                    raise SchemaVersionError('Timed out waiting for the migration lock')
+                self._ensure_version_table(cursor)
+                cursor.execute("SELECT MAX(version) FROM schema_migrations")
+                current = cursor.fetchone()[0] or 0
+                target = LATEST_VERSION if target is None else target
+
+                for migration in self.migrations:
+                    if not current < migration.version <= target:
+                        continue
+                    print(f"Applying migration {migration.version}: {migration.description}")
+                    for step in migration.steps:
+                        if not step.apply(cursor, self.dialect):
+                            print(f"  skipped (already applied): {step.sql[:80]}")
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (migration.version, migration.description)
+                    )
+                    conn.commit()
+                    applied.append(migration.version)
+        return applied
+
+    def verify(self):
+        """Raise SchemaVersionError unless the schema is fully migrated"""
+        current = self.current_version()
+        if current < LATEST_VERSION:
+            raise SchemaVersionError(
+                f'Database schema is at version {current}, expected {LATEST_VERSION}; '
+                f'run "python migrate.py" to upgrade'
+            )
+        return current
@@ -1,51 +1,184 @@
 # server/models.py
-from dataclasses import dataclass
-from typing import Optional
+import math
+from dataclasses import MISSING, dataclass, field, fields
+from typing import Optional, get_args
 
-@dataclass
+INT32 = (-2 ** 31, 2 ** 31 - 1)
+INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+
+class ValidationError(ValueError):
+    """Raised for a payload that does not fit its model; ``field`` names the
+    offending field (None when the payload itself is malformed)"""
+
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.field = field
+
+
+def spec(default=MISSING, *, bounds=None, max_length=None):
+    """Model field with validation limits, e.g. ``spec(bounds=(-90, 90))``"""
+    return field(default=default, metadata={'bounds': bounds, 'max_length': max_length})
+
+
+def _to_str(value, name):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValidationError(f'{name} must be a string', name)
+
+
+def _to_int(value, name):
+    if type(value) is int:
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    raise ValidationError(f'{name} must be an integer', name)
+
+
+def _to_float(value, name):
+    if type(value) is float or type(value) is int:
+        number = float(value)
+    elif isinstance(value, str):
+        try:
+            number = float(value.strip())
+        except ValueError:
+            raise ValidationError(f'{name} must be a number', name) from None
+    else:
+        raise ValidationError(f'{name} must be a number', name)
+    if not math.isfinite(number):
+        raise ValidationError(f'{name} must be a finite number', name)
+    return number
+
+
+def _to_bool(value, name):
+    if type(value) is bool:
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in ('true', 'false', '0', '1'):
+        return value.lower() in ('true', '1')
+    raise ValidationError(f'{name} must be a boolean', name)
+
+
+_COERCERS = {str: _to_str, int: _to_int, float: _to_float, bool: _to_bool}
+
+
+def _compile_decoder(cls):
+    """Build ``decode(data)`` for a model class.
+
+    Field types, requiredness and limits are resolved once here into a flat
+    tuple, so decoding a payload is a single loop of dict lookups and
+    coercions ending in one constructor call.
+    """
+    specs = []
+    for f in fields(cls):
+        kind = next((arg for arg in get_args(f.type) if arg is not type(None)), f.type)
+        bounds = f.metadata.get('bounds')
+        if kind is int and bounds is None:
+            bounds = INT64
+        specs.append((f.name, _COERCERS[kind], f.default is MISSING, bounds, f.metadata.get('max_length')))
+    specs = tuple(specs)
+    label = cls.__name__.removesuffix('Model').lower()
+
+    def decode(data):
+        if not isinstance(data, dict):
+            raise ValidationError(f'{label} must be an object')
+        get = data.get
+        values = []
+        for name, coerce, required, bounds, max_length in specs:
+            value = get(name)
+            if value is None or (required and value == ''):
+                if required:
+                    raise ValidationError(f'{name} is required', name)
+                values.append(None)
+                continue
+            value = coerce(value, name)
+            if bounds is not None and not bounds[0] <= value <= bounds[1]:
+                raise ValidationError(f'{name} out of range', name)
+            if max_length is not None and len(value) > max_length:
+                raise ValidationError(f'{name} longer than {max_length} characters', name)
+            values.append(value)
+        return cls(*values)
+
+    return decode
+
+
+def model(cls):
+    """Make ``cls`` a slotted dataclass with ``decode``/``decode_many``"""
+    cls = dataclass(slots=True)(cls)
+    decode = _compile_decoder(cls)
+
+    def decode_many(items):
+        """Decode a list of payloads; returns ``(valid, errors)`` as lists of
+        ``(index, model)`` and ``(index, ValidationError)``"""
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, decode(item)))
+            except ValidationError as e:
+                errors.append((index, e))
+        return valid, errors
+
+    cls.decode = staticmethod(decode)
+    cls.decode_many = staticmethod(decode_many)
+    return cls
+
+
+@model
 class LocationModel:
-    device_id: str
-    latitude: float
-    longitude: float
+    device_id: str = spec(max_length=255)
+    latitude: float = spec(bounds=(-90, 90))
+    longitude: float = spec(bounds=(-180, 180))
     altitude: Optional[float] = None
     accuracy: Optional[float] = None
     speed: Optional[float] = None
     bearing: Optional[float] = None
+    timestamp: Optional[int] = None
+    client_seq: Optional[int] = None
 
-@dataclass
+@model
 class DeviceModel:
-    device_id: str
-    model: Optional[str] = None
-    manufacturer: Optional[str] = None
-    android_version: Optional[str] = None
-    sdk_version: Optional[int] = None
-    battery_level: Optional[int] = None
-    battery_status: Optional[str] = None
+    device_id: str = spec(max_length=255)
+    model: Optional[str] = spec(None, max_length=255)
+    manufacturer: Optional[str] = spec(None, max_length=255)
+    android_version: Optional[str] = spec(None, max_length=50)
+    sdk_version: Optional[int] = spec(None, bounds=INT32)
+    battery_level: Optional[int] = spec(None, bounds=INT32)
+    battery_status: Optional[str] = spec(None, max_length=50)
     storage_total: Optional[int] = None
     storage_available: Optional[int] = None
     ram_total: Optional[int] = None
     ram_available: Optional[int] = None
-    screen_width: Optional[int] = None
-    screen_height: Optional[int] = None
-    imei: Optional[str] = None
-    sim_serial: Optional[str] = None
-    phone_number: Optional[str] = None
+    screen_width: Optional[int] = spec(None, bounds=INT32)
+    screen_height: Optional[int] = spec(None, bounds=INT32)
+    imei: Optional[str] = spec(None, max_length=255)
+    sim_serial: Optional[str] = spec(None, max_length=255)
+    phone_number: Optional[str] = spec(None, max_length=50)
 
-@dataclass
+@model
 class MessageModel:
-    device_id: str
-    sender: Optional[str] = None
-    recipient: Optional[str] = None
+    device_id: str = spec(max_length=255)
+    sender: Optional[str] = spec(None, max_length=255)
+    recipient: Optional[str] = spec(None, max_length=255)
     message_body: Optional[str] = None
-    message_type: Optional[str] = None
+    message_type: Optional[str] = spec(None, max_length=20)
     timestamp: Optional[int] = None
     read_status: Optional[bool] = None
+    client_seq: Optional[int] = None
 
-@dataclass
+@model
 class NotificationModel:
-    device_id: str
-    app_name: Optional[str] = None
-    title: Optional[str] = None
+    device_id: str = spec(max_length=255)
+    app_name: Optional[str] = spec(None, max_length=255)
+    title: Optional[str] = spec(None, max_length=500)
     text: Optional[str] = None
-    package_name: Optional[str] = None
-    timestamp: Optional[int] = None
\ No newline at end of file
+    package_name: Optional[str] = spec(None, max_length=255)
+    timestamp: Optional[int] = None
+    client_seq: Optional[int] = None
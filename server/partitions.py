@@ -0,0 +1,228 @@
+# server/partitions.py
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+
+LOCK_NAME = 'phone_tracker_partitions'
+MAX_PARTITION = 'pmax'
+
+
+class PartitionPolicy:
+    """Range-partitioning policy for one table, keyed on created_at.
+
+    ``retention_days`` of 0 keeps data forever; ``premake`` is the number of
+    future partitions kept ready so inserts never land in the catch-all.
+    """
+
+    def __init__(self, table, granularity='day', retention_days=0, premake=7):
+        if granularity not in ('day', 'month'):
+            raise ValueError(f'Unknown partition granularity: {granularity}')
+        self.table = table
+        self.granularity = granularity
+        self.retention_days = retention_days
+        self.premake = premake
+
+    @classmethod
+    def parse(cls, spec, premake=7):
+        """Build a policy from ``table[:granularity[:retention_days]]``"""
+        parts = spec.strip().split(':')
+        table = parts[0]
+        granularity = parts[1] if len(parts) > 1 and parts[1] else 'day'
+        retention_days = int(parts[2]) if len(parts) > 2 and parts[2] else 0
+        return cls(table, granularity, retention_days, premake)
+
+    def floor(self, moment):
+        moment = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.granularity == 'month':
+            moment = moment.replace(day=1)
+        return moment
+
+    def next_period(self, start):
+        if self.granularity == 'day':
+            return start + timedelta(days=1)
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+
+    def partition_name(self, start):
+        return 'p' + start.strftime('%Y%m%d' if self.granularity == 'day' else '%Y%m')
+
+
+def _boundary(moment):
+    # Matches UNIX_TIMESTAMP() for a session running in the server's time zone
+    return int(time.mktime(moment.timetuple()))
+
+
+class PartitionManager:
+    """Creates partitions ahead of time and drops expired ones.
+
+    Tables are partitioned with ``RANGE (UNIX_TIMESTAMP(created_at))`` so that
+    retention becomes ``DROP PARTITION`` (a metadata operation) instead of a
+    long-running DELETE, and history queries only touch the partitions in
+    their time window.
+    """
+
+    def __init__(self, db, policies):
+        if not db.backend.supports_partitioning:
+            raise ValueError(f'Partitioning is not supported on the {db.backend.name} backend')
+        self.db = db
+        self.policies = policies
+
+    def _partitions(self, cursor, table):
+        cursor.execute(
+            """
+            SELECT partition_name, partition_description
+            FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = %s
+              AND partition_name IS NOT NULL
+            ORDER BY partition_ordinal_position
+            """,
+            (table,)
+        )
+        return cursor.fetchall()
+
+    def _partition_defs(self, policy, start, stop):
+        defs = []
+        while start < stop:
+            upper = policy.next_period(start)
+            defs.append(
+                f'PARTITION {policy.partition_name(start)} VALUES LESS THAN ({_boundary(upper)})'
+            )
+            start = upper
+        return defs
+
+    def plan_enable(self, cursor, policy, now=None):
+        """Statements that convert an unpartitioned table in place.
+
+        The primary key must contain the partitioning column, so it becomes
+        ``(id, created_at)``. This rebuilds the table; run it in a
+        maintenance window.
+        """
+        if self._partitions(cursor, policy.table):
+            return []
+        now = now or datetime.now()
+        cursor.execute(f"SELECT MIN(created_at) FROM {policy.table}")
+        oldest = cursor.fetchone()[0] or now
+        start = policy.floor(min(oldest, now))
+        stop = policy.floor(now)
+        for _ in range(policy.premake + 1):
+            stop = policy.next_period(stop)
+
+        defs = self._partition_defs(policy, start, stop)
+        defs.append(f'PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE')
+        return [
+            f'ALTER TABLE {policy.table} '
+            f'MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, '
+            f'DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)',
+            f'ALTER TABLE {policy.table} PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) '
+            f'({", ".join(defs)})',
+        ]
+
+    def plan_maintenance(self, cursor, policy, now=None):
+        """Statements that pre-create future partitions and drop expired ones"""
+        partitions = self._partitions(cursor, policy.table)
+        if not partitions:
+            return []
+        now = now or datetime.now()
+        ranged = [(name, int(desc)) for name, desc in partitions if desc != 'MAXVALUE']
+        statements = []
+
+        if ranged:
+            start = datetime.fromtimestamp(ranged[-1][1])
+        else:
+            start = policy.floor(now)
+        stop = policy.floor(now)
+        for _ in range(policy.premake + 1):
+            stop = policy.next_period(stop)
+        defs = self._partition_defs(policy, start, stop)
+        if defs:
+            defs.append(f'PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE')
+            statements.append(
+                f'ALTER TABLE {policy.table} REORGANIZE PARTITION {MAX_PARTITION} '
+                f'INTO ({", ".join(defs)})'
+            )
+
+        if policy.retention_days:
+            cutoff = _boundary(policy.floor(now - timedelta(days=policy.retention_days)))
+            expired = [name for name, upper in ranged if upper <= cutoff]
+            if expired:
+                statements.append(
+                    f'ALTER TABLE {policy.table} DROP PARTITION {", ".join(expired)}'
+                )
+        return statements
+
+    def _run(self, planner, dry_run=False, wait=0):
+        executed = []
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(buffered=True)
+            # Only one worker maintains partitions at a time
+            with self.db.backend.lock(cursor, LOCK_NAME, wait) as locked:
+                if not locked:
+                    return executed
+                for policy in self.policies:
+                    for statement in planner(cursor, policy):
+                        if dry_run:
+                            print(f'{statement};')
+                        else:
+                            print(f"Partition maintenance: {statement[:120]}")
+                            cursor.execute(statement)
+                        executed.append(statement)
+        return executed
+
+    def enable(self, dry_run=False):
+        return self._run(self.plan_enable, dry_run, wait=60)
+
+    def maintain(self, dry_run=False):
+        return self._run(self.plan_maintenance, dry_run)
+
+    def status(self):
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(buffered=True)
+            return {
+                policy.table: [name for name, _ in self._partitions(cursor, policy.table)]
+                for policy in self.policies
+            }
+
+    def start_background(self, interval):
+        """Run ``maintain`` every ``interval`` seconds on a daemon thread"""
+        def loop():
+            while True:
+                try:
+                    self.maintain()
+                except Exception as e:
+                    print(f"Partition maintenance failed: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name='partition-maintenance', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    from config import db_config, pool_config, partition_policies, shard_configs
+    from sharding import open_database, members
+
+    parser = argparse.ArgumentParser(description='Manage time-partitioned tables')
+    parser.add_argument('command', choices=['enable', 'maintain', 'status'])
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the statements without executing them')
+    args = parser.parse_args()
+
+    if not partition_policies:
+        parser.error('PARTITION_TABLES is not configured')
+
+    for name, shard in members(open_database(db_config, pool_config, shard_configs)):
+        if name is not None:
+            print(f"Shard {name}:")
+        manager = PartitionManager(shard, partition_policies)
+        if args.command == 'status':
+            for table, names in manager.status().items():
+                print(f"{table}: {', '.join(names) if names else 'not partitioned'}")
+        elif args.command == 'enable':
+            manager.enable(dry_run=args.dry_run)
+        else:
+            manager.maintain(dry_run=args.dry_run)
+
+if __name__ == '__main__':
+    main()
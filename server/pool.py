@@ -0,0 +1,195 @@
+# server/pool.py
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the wait timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of reusable DB-API connections.
+
+    Keeps up to ``size`` idle connections around and allows ``max_overflow``
+    extra ones under load; overflow connections are closed on release.
+    Connections older than ``recycle`` seconds are replaced on checkout, and
+    ``pre_ping`` verifies a connection that sat idle for more than
+    ``ping_after`` seconds is still alive before handing it out.
+    """
+
+    def __init__(self, connect, ping=None, size=5, max_overflow=10,
+                 timeout=30.0, recycle=3600, pre_ping=True, ping_after=1.0):
+        self._connect = connect
+        self._ping = ping
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping and ping is not None
+        self.ping_after = ping_after
+
+        self._idle = deque()  # (conn, created_at, released_at)
+        self._born = {}  # id(conn) -> created_at for checked-out connections
+        self._total = 0
+        self._cond = threading.Condition()
+
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'recycled': 0,
+            'failed_pings': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    @property
+    def capacity(self):
+        return self.size + self.max_overflow
+
+    @property
+    def checked_out(self):
+        return len(self._born)
+
+    def _count(self, key):
+        """Bump a stat from outside the lock (connects, closes and pings)"""
+        with self._cond:
+            self._stats[key] += 1
+
+    def _open(self):
+        conn = self._connect()
+        self._count('connections_opened')
+        return conn, time.monotonic()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count('connections_closed')
+
+    def _is_usable(self, conn, created_at, released_at):
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            self._count('recycled')
+            return False
+        if self.pre_ping and now - released_at >= self.ping_after:
+            try:
+                self._ping(conn)
+            except Exception:
+                self._count('failed_pings')
+                return False
+        return True
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, created_at, released_at = self._idle.pop()
+                    break
+                if self._total < self.capacity:
+                    self._total += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f'No database connection available after {timeout:.1f}s '
+                        f'({self._total} in use)'
+                    )
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            self._stats['checkouts'] += 1
+
+        # Connecting and pinging happen outside the lock
+        try:
+            if conn is not None and not self._is_usable(conn, created_at, released_at):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn, created_at = self._open()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._born[id(conn)] = created_at
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            created_at = self._born.pop(id(conn), None)
+            keep = (
+                not discard
+                and created_at is not None
+                and len(self._idle) < self.size
+            )
+            if keep:
+                self._idle.append((conn, created_at, time.monotonic()))
+            else:
+                self._total -= 1
+            self._cond.notify()
+
+        if not keep:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self, timeout=None, discard_on_error=False):
+        """Check out a connection for the duration of the block.
+
+        ``discard_on_error`` closes the connection instead of resetting it
+        when the block exits early, e.g. a streaming read abandoned with
+        rows still unread, which would otherwise have to be drained first.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, discard=discard_on_error or not self._reset(conn))
+            raise
+        self.release(conn, discard=not self._reset(conn))
+
+    @staticmethod
+    def _reset(conn):
+        """End any open transaction so the next user gets a fresh snapshot"""
+        if getattr(conn, 'in_transaction', True) is False:
+            return True
+        try:
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def dispose(self):
+        """Close every idle connection; checked-out ones close on release"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'idle': len(self._idle),
+                'checked_out': len(self._born),
+                'total': self._total,
+                'overflow': max(0, self._total - self.size),
+            })
+        return stats
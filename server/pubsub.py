@@ -0,0 +1,163 @@
+# server/pubsub.py
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class Subscription:
+    """One subscriber's pending events, at most one per device.
+
+    A new fix for a device that is still waiting replaces the waiting one:
+    a live map only needs each device's newest position, so a slow
+    consumer falls behind by skipping intermediate fixes rather than by
+    queueing them. Past ``max_pending`` devices the oldest waiting event is
+    dropped. Replays after a reconnect are coalesced the same way.
+    """
+
+    def __init__(self, broker, device_ids, max_pending):
+        self.broker = broker
+        self.device_ids = device_ids
+        self.max_pending = max_pending
+        # Set when the requested Last-Event-ID could not be honoured, so the
+        # client should reload state instead of trusting the replay
+        self.gap = False
+        self._pending = OrderedDict()  # device_id -> (event_id, row)
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _offer(self, event_id, row):
+        """Queue an event; returns 'coalesced', 'dropped' or None"""
+        with self._cond:
+            outcome = None
+            device_id = row['device_id']
+            if device_id in self._pending:
+                del self._pending[device_id]
+                outcome = 'coalesced'
+            elif len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                outcome = 'dropped'
+            self._pending[device_id] = (event_id, row)
+            self._cond.notify()
+            return outcome
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds; returns all pending ``(event_id,
+        row)`` in event order (empty on timeout or close)"""
+        with self._cond:
+            if not self._pending and not self._closed:
+                self._cond.wait(timeout)
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.broker._unsubscribe(self)
+
+
+class LocationBroker:
+    """In-process publish/subscribe of location fixes.
+
+    ``publish`` is called after a fix is stored and hands it to every
+    subscriber of its device (or of all devices) without blocking on any of
+    them. The last ``history_size`` events are kept so a client that
+    reconnects with Last-Event-ID gets what it missed. Event ids carry this
+    process's start time, so an id from another worker or an earlier run
+    is recognised and answered with a gap instead of a wrong replay.
+    """
+
+    def __init__(self, history_size=10000, max_pending=1000, max_subscribers=1000):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self.epoch = format(time.time_ns() // 1000, 'x')
+        self._sequence = 0
+        self._subscribers = 0
+        self._history = deque(maxlen=history_size)  # (sequence, row)
+        self._by_device = {}  # device_id -> set of subscriptions
+        self._everything = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            'published': 0,
+            'delivered': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'rejected': 0,
+        }
+
+    def event_id(self, sequence):
+        return f'{self.epoch}-{sequence}'
+
+    def _parse_event_id(self, event_id):
+        epoch, _, sequence = (event_id or '').partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def publish(self, row):
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+            self._history.append((sequence, row))
+            subscribers = list(self._everything)
+            subscribers.extend(self._by_device.get(row['device_id'], ()))
+            self._stats['published'] += 1
+        event_id = self.event_id(sequence)
+        outcomes = [subscription._offer(event_id, row) for subscription in subscribers]
+        with self._lock:
+            self._stats['delivered'] += len(outcomes)
+            self._stats['coalesced'] += outcomes.count('coalesced')
+            self._stats['dropped'] += outcomes.count('dropped')
+
+    def subscribe(self, device_ids=None, last_event_id=None):
+        """Subscribe to ``device_ids`` (None for every device; an empty list
+        gets nothing), replaying the events after ``last_event_id`` when it
+        is still in the history. Raises OverflowError past
+        ``max_subscribers``."""
+        if device_ids is not None:
+            device_ids = set(device_ids)
+        subscription = Subscription(self, device_ids, self.max_pending)
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                self._stats['rejected'] += 1
+                raise OverflowError('Too many stream subscribers')
+            self._subscribers += 1
+            if subscription.device_ids is None:
+                self._everything.add(subscription)
+            else:
+                for device_id in subscription.device_ids:
+                    self._by_device.setdefault(device_id, set()).add(subscription)
+            # Registered and replayed under one lock: nothing published in
+            # between is missed or sent twice
+            if last_event_id:
+                after = self._parse_event_id(last_event_id)
+                oldest = self._history[0][0] if self._history else self._sequence + 1
+                if after is None or after < oldest - 1 or after > self._sequence:
+                    subscription.gap = True
+                else:
+                    for sequence, row in self._history:
+                        if sequence > after and (subscription.device_ids is None
+                                                 or row['device_id'] in subscription.device_ids):
+                            subscription._offer(self.event_id(sequence), row)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers -= 1
+            if subscription.device_ids is None:
+                self._everything.discard(subscription)
+                return
+            for device_id in subscription.device_ids:
+                subscriptions = self._by_device.get(device_id)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._by_device[device_id]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = self._subscribers
+            stats['history'] = len(self._history)
+        return stats
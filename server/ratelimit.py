@@ -0,0 +1,147 @@
+# server/ratelimit.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimitedError(Exception):
+    """Raised when an upload is over its device's or the global rate"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload costs more than a full bucket holds, so it
+    could never be let through"""
+
+
+class IngestLimiter:
+    """Token buckets for uploads: one per device plus one shared by all.
+
+    Each bucket holds up to ``burst`` tokens and refills at ``rate`` tokens
+    a second (0 disables it); an upload costs one token per row. Tokens are
+    only taken when every bucket involved has enough; an upload bigger than
+    a bucket is refused outright rather than told to wait.
+
+    Only the ``max_devices`` most recently seen devices keep a bucket; a
+    device that was evicted starts again with a full one. When ``load()``
+    (0.0-1.0, e.g. the share of pool connections in use) is above
+    ``saturation``, refill rates shrink linearly, down to ``min_factor`` of
+    normal at full load, so clients back off before requests start timing
+    out on the pool. The load is sampled at most every ``load_interval``
+    seconds.
+    """
+
+    def __init__(self, rate=5.0, burst=60, global_rate=2000.0, global_burst=4000,
+                 max_devices=100000, load=None, saturation=0.8, min_factor=0.1,
+                 load_interval=0.1):
+        self.rate = rate
+        self.burst = burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_devices = max_devices
+        self.saturation = saturation
+        self.min_factor = min_factor
+        self.load_interval = load_interval
+        self._load = load
+        self._factor = 1.0
+        self._load_checked_at = None
+        self._buckets = OrderedDict()  # device_id -> [tokens, updated_at]
+        self._global = [float(global_burst), time.monotonic()]
+        self._lock = threading.Lock()
+        self._stats = {
+            'allowed': 0,
+            'rejected_device': 0,
+            'rejected_global': 0,
+            'rejected_too_large': 0,
+            'evictions': 0,
+        }
+
+    def _rate_factor(self, now):
+        if self._load is None:
+            return 1.0
+        if self._load_checked_at is None or now - self._load_checked_at >= self.load_interval:
+            self._load_checked_at = now
+            try:
+                load = self._load()
+            except Exception as e:
+                print(f"Could not read load for rate limiting: {e}")
+                load = 0.0
+            if load <= self.saturation or self.saturation >= 1:
+                self._factor = 1.0
+            else:
+                excess = min(1.0, (load - self.saturation) / (1 - self.saturation))
+                self._factor = 1.0 - excess * (1.0 - self.min_factor)
+        return self._factor
+
+    @staticmethod
+    def _refill(bucket, rate, burst, now):
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+
+    def _device_bucket(self, device_id, now):
+        bucket = self._buckets.get(device_id)
+        if bucket is None:
+            bucket = self._buckets[device_id] = [float(self.burst), now]
+            if len(self._buckets) > self.max_devices:
+                self._buckets.popitem(last=False)
+                self._stats['evictions'] += 1
+        else:
+            self._buckets.move_to_end(device_id)
+        return bucket
+
+    def acquire(self, costs):
+        """Take tokens for ``costs`` (device_id -> rows uploaded).
+
+        Raises RateLimitedError, with the seconds until the upload would
+        fit, when any bucket is short, and UploadTooLargeError when it is
+        bigger than a bucket; nothing is taken in either case.
+        """
+        with self._lock:
+            if self.rate > 0 and max(costs.values(), default=0) > self.burst:
+                self._stats['rejected_too_large'] += 1
+                raise UploadTooLargeError(f'At most {self.burst} rows per device per upload')
+            if self.global_rate > 0 and sum(costs.values()) > self.global_burst:
+                self._stats['rejected_too_large'] += 1
+                raise UploadTooLargeError(f'At most {self.global_burst} rows per upload')
+
+            now = time.monotonic()
+            factor = self._rate_factor(now)
+            wait = 0.0
+            rejected = None
+
+            charges = []
+            if self.rate > 0:
+                rate = self.rate * factor
+                for device_id, cost in costs.items():
+                    bucket = self._device_bucket(device_id, now)
+                    self._refill(bucket, rate, self.burst, now)
+                    if bucket[0] < cost:
+                        wait = max(wait, (cost - bucket[0]) / rate)
+                        rejected = 'rejected_device'
+                    charges.append((bucket, cost))
+
+            if self.global_rate > 0:
+                rate = self.global_rate * factor
+                self._refill(self._global, rate, self.global_burst, now)
+                cost = sum(costs.values())
+                if self._global[0] < cost:
+                    wait = max(wait, (cost - self._global[0]) / rate)
+                    rejected = rejected or 'rejected_global'
+                charges.append((self._global, cost))
+
+            if rejected is not None:
+                self._stats[rejected] += 1
+                raise RateLimitedError('Upload rate limit exceeded, try again later', wait)
+            for bucket, cost in charges:
+                bucket[0] -= cost
+            self._stats['allowed'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['devices'] = len(self._buckets)
+            stats['rate_factor'] = self._factor
+        return stats
@@ -0,0 +1,294 @@
+# server/rebalance.py
+"""Move devices to the shard the hash ring assigns them to.
+
+After adding a shard to DB_SHARDS (and migrating it), restart the API so
+new writes follow the new ring, then run this to move each relocated
+device's history over::
+
+    python rebalance.py --dry-run     # devices to move per shard pair
+    python rebalance.py
+
+Rows are copied in batches, each committed on the target before the
+originals are deleted from the source, so a device's history is never
+missing, only briefly split between two shards. Copies get new ids on the
+target (ingest_keys are re-pointed to them).
+
+Each copy records the source rows it covers (ids, or rollup buckets) in
+the target's shard_moves table in the same transaction, and the entries
+are dropped once the source rows are deleted. If the tool is interrupted
+in between, the next run finds those entries and only deletes the
+already copied rows, so nothing is stored or added to rollups twice.
+Stop writes to the old shard (restart the API) before running it.
+"""
+import argparse
+from config import db_config, pool_config, shard_configs
+from database import Database
+from sharding import ShardedDatabase, open_database
+
+# Tables whose rows are copied one batch at a time, with the upload kind
+# their ids are recorded under in ingest_keys
+HISTORY_TABLES = (
+    ('locations', 'locations'),
+    ('messages', 'messages'),
+    ('notifications', 'notifications'),
+    ('device_telemetry', None),
+)
+
+ROLLUP_COLUMNS = ['samples'] + [
+    f'{metric}_{part}'
+    for metric in Database.TELEMETRY_METRICS for part in ('min', 'max', 'sum', 'count')
+]
+
+# Folds a whole rollup row from the source into the target's bucket
+MERGE_ROLLUP_QUERY = f"""
+    INSERT INTO device_telemetry_rollups
+    (device_id, resolution, bucket, {', '.join(ROLLUP_COLUMNS)})
+    VALUES (%s, %s, %s, {', '.join(['%s'] * len(ROLLUP_COLUMNS))})
+    ON DUPLICATE KEY UPDATE
+        samples = samples + VALUES(samples),
+        {', '.join(
+            f'{m}_min = LEAST(COALESCE({m}_min, VALUES({m}_min)), COALESCE(VALUES({m}_min), {m}_min)), '
+            f'{m}_max = GREATEST(COALESCE({m}_max, VALUES({m}_max)), COALESCE(VALUES({m}_max), {m}_max)), '
+            f'{m}_sum = {m}_sum + VALUES({m}_sum), '
+            f'{m}_count = {m}_count + VALUES({m}_count)'
+            for m in Database.TELEMETRY_METRICS
+        )}
+"""
+
+DEVICE_IDS_QUERY = """
+    SELECT device_id FROM devices
+    UNION SELECT DISTINCT device_id FROM locations
+    UNION SELECT DISTINCT device_id FROM messages
+    UNION SELECT DISTINCT device_id FROM notifications
+    UNION SELECT DISTINCT device_id FROM device_telemetry
+"""
+
+
+def misplaced_devices(sharded, name):
+    """Device ids stored on shard ``name`` that the ring places elsewhere,
+    grouped by their target shard"""
+    with sharded.shards[name].get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(DEVICE_IDS_QUERY)
+        device_ids = [row[0] for row in cursor.fetchall()]
+    moves = {}
+    for device_id in device_ids:
+        target = sharded.ring.shard_for(device_id)
+        if target != name:
+            moves.setdefault(target, []).append(device_id)
+    return moves
+
+
+def _insert_rows(backend, cursor, table, rows):
+    """Insert source rows under new ids; returns the ids"""
+    columns = [column for column in rows[0] if column != 'id']
+    return backend.insert_rows(
+        cursor,
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+        [[row[column] for column in columns] for row in rows]
+    )
+
+
+def _moved_keys(cursor, source_name, table, device_id, keys):
+    """Which of ``keys`` the move log on the target already records"""
+    if not keys:
+        return set()
+    cursor.execute(
+        f"""SELECT row_key FROM shard_moves
+        WHERE source = %s AND table_name = %s AND device_id = %s
+        AND row_key IN ({', '.join(['%s'] * len(keys))})""",
+        [source_name, table, device_id, *keys]
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _log_moves(cursor, source_name, table, device_id, keys):
+    cursor.executemany(
+        "INSERT INTO shard_moves (source, table_name, device_id, row_key) VALUES (%s, %s, %s, %s)",
+        [(source_name, table, device_id, key) for key in keys]
+    )
+
+
+def _forget_moves(target, source_name, table, device_id, keys=None):
+    """Drop move log entries once the source rows are gone (all of the
+    device's for ``table`` when ``keys`` is None)"""
+    query = "DELETE FROM shard_moves WHERE source = %s AND table_name = %s AND device_id = %s"
+    params = [source_name, table, device_id]
+    if keys is not None:
+        query += f" AND row_key IN ({', '.join(['%s'] * len(keys))})"
+        params.extend(keys)
+    with target.get_connection() as conn:
+        conn.cursor().execute(query, params)
+        conn.commit()
+
+
+def _move_history(source_name, source, target, device_id, table, kind, batch_size):
+    moved = 0
+    while True:
+        with source.get_connection() as source_conn:
+            cursor = source_conn.cursor(dictionary=True)
+            cursor.execute(
+                f"SELECT * FROM {table} WHERE device_id = %s ORDER BY id LIMIT %s",
+                (device_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return moved
+            old_ids = [row['id'] for row in rows]
+            row_keys = [str(row_id) for row_id in old_ids]
+
+            with target.get_connection() as target_conn:
+                target_cursor = target_conn.cursor()
+                # Rows already copied by an interrupted run are only deleted
+                done = _moved_keys(target_cursor, source_name, table, device_id, row_keys)
+                copy = [row for row, key in zip(rows, row_keys) if key not in done]
+                keys = []
+                if copy and kind is not None:
+                    copy_ids = [row['id'] for row in copy]
+                    cursor.execute(
+                        f"""SELECT client_seq, row_id FROM ingest_keys
+                        WHERE device_id = %s AND kind = %s AND row_id IN ({', '.join(['%s'] * len(copy_ids))})""",
+                        [device_id, kind, *copy_ids]
+                    )
+                    keys = cursor.fetchall()
+                if copy:
+                    new_ids = dict(zip(
+                        (row['id'] for row in copy),
+                        _insert_rows(target.backend, target_cursor, table, copy)
+                    ))
+                    if keys:
+                        target_cursor.executemany(
+                            "INSERT IGNORE INTO ingest_keys (device_id, kind, client_seq, row_id) VALUES (%s, %s, %s, %s)",
+                            [(device_id, kind, key['client_seq'], new_ids[key['row_id']]) for key in keys]
+                        )
+                    _log_moves(target_cursor, source_name, table, device_id,
+                               [str(row['id']) for row in copy])
+                target_conn.commit()
+
+            placeholders = ', '.join(['%s'] * len(old_ids))
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", old_ids)
+            if kind is not None:
+                cursor.execute(
+                    f"""DELETE FROM ingest_keys
+                    WHERE device_id = %s AND kind = %s AND row_id IN ({placeholders})""",
+                    [device_id, kind, *old_ids]
+                )
+            source_conn.commit()
+        _forget_moves(target, source_name, table, device_id, row_keys)
+        moved += len(copy)
+
+
+def _move_device_row(source, target, device_id):
+    """Copy the devices row unless the device already reported to its new
+    shard (that row is newer), then drop the source's"""
+    with source.get_connection() as source_conn:
+        cursor = source_conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM devices WHERE device_id = %s", (device_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        with target.get_connection() as target_conn:
+            target_cursor = target_conn.cursor()
+            target_cursor.execute("SELECT 1 FROM devices WHERE device_id = %s", (device_id,))
+            if target_cursor.fetchone() is None:
+                _insert_rows(target.backend, target_cursor, 'devices', [row])
+            target_conn.commit()
+        cursor.execute("DELETE FROM devices WHERE device_id = %s", (device_id,))
+        source_conn.commit()
+
+
+def _move_rollups(source_name, source, target, device_id):
+    table = 'device_telemetry_rollups'
+    with source.get_connection() as source_conn:
+        cursor = source_conn.cursor(dictionary=True)
+        cursor.execute(f"SELECT * FROM {table} WHERE device_id = %s", (device_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        row_keys = [f"{row['resolution']}/{row['bucket']}" for row in rows]
+        with target.get_connection() as target_conn:
+            target_cursor = target_conn.cursor()
+            # Buckets already merged by an interrupted run must not be
+            # added to the target's sums a second time
+            done = _moved_keys(target_cursor, source_name, table, device_id, row_keys)
+            merge = [(row, key) for row, key in zip(rows, row_keys) if key not in done]
+            if merge:
+                target_cursor.executemany(MERGE_ROLLUP_QUERY, [
+                    [row['device_id'], row['resolution'], row['bucket'], *(row[column] for column in ROLLUP_COLUMNS)]
+                    for row, _ in merge
+                ])
+                _log_moves(target_cursor, source_name, table, device_id, [key for _, key in merge])
+            target_conn.commit()
+        cursor.execute(f"DELETE FROM {table} WHERE device_id = %s", (device_id,))
+        source_conn.commit()
+    _forget_moves(target, source_name, table, device_id)
+
+
+def _forget_stale_moves(source_name, source, target, device_id, table):
+    with target.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT row_key FROM shard_moves WHERE source = %s AND table_name = %s AND device_id = %s",
+            (source_name, table, device_id)
+        )
+        logged = [row[0] for row in cursor.fetchall()]
+    if not logged:
+        return
+    with source.get_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        if table == 'device_telemetry_rollups':
+            cursor.execute(f"SELECT resolution, bucket FROM {table} WHERE device_id = %s", (device_id,))
+            present = {f"{row['resolution']}/{row['bucket']}" for row in cursor.fetchall()}
+        else:
+            cursor.execute(
+                f"SELECT id FROM {table} WHERE device_id = %s AND id IN ({', '.join(['%s'] * len(logged))})",
+                [device_id, *logged]
+            )
+            present = {str(row['id']) for row in cursor.fetchall()}
+    stale = [key for key in logged if key not in present]
+    if stale:
+        _forget_moves(target, source_name, table, device_id, stale)
+
+
+def move_device(source_name, source, target, device_id, batch_size=1000):
+    """Move everything stored for one device; returns rows moved per table.
+    
+    Safe to re-run after an interruption: see the module docstring.
+    """
+    # Entries left by a run stopped after the source delete refer to rows
+    # that no longer exist; drop them so they cannot hide new rows
+    for table, _ in HISTORY_TABLES:
+        _forget_stale_moves(source_name, source, target, device_id, table)
+    _forget_stale_moves(source_name, source, target, device_id, 'device_telemetry_rollups')
+    counts = {
+        table: _move_history(source_name, source, target, device_id, table, kind, batch_size)
+        for table, kind in HISTORY_TABLES
+    }
+    _move_rollups(source_name, source, target, device_id)
+    _move_device_row(source, target, device_id)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move devices to the shard the hash ring assigns them')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the devices to move')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows copied per transaction')
+    args = parser.parse_args()
+
+    db = open_database(db_config, pool_config, shard_configs)
+    if not isinstance(db, ShardedDatabase):
+        parser.error('DB_SHARDS is not configured')
+
+    for name, source in db.shards.items():
+        for target_name, device_ids in misplaced_devices(db, name).items():
+            print(f"{name} -> {target_name}: {len(device_ids)} devices")
+            if args.dry_run:
+                continue
+            target = db.shards[target_name]
+            for device_id in device_ids:
+                counts = move_device(name, source, target, device_id, args.batch_size)
+                print(f"  {device_id}: " + ', '.join(f'{table} {count}' for table, count in counts.items()))
+    db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# server/replicas.py
+import itertools
+import threading
+import time
+from backends import create_backend
+from metrics import InstrumentedConnection
+from pool import ConnectionPool
+
+
+class Replica:
+    """One read replica: its own backend and pool, plus health state"""
+
+    def __init__(self, config, pool_config=None):
+        self.name = config.get('host') if config.get('backend', 'mysql') == 'mysql' else config.get('path')
+        self.backend = create_backend(config)
+        self.pool = ConnectionPool(
+            connect=lambda: InstrumentedConnection(self.backend.connect()),
+            ping=self.backend.ping,
+            **(pool_config or {})
+        )
+        self.lag = None
+        self.checked_at = None  # monotonic time of the last lag check
+        self.down_until = 0.0
+        self.reads = 0
+        self.failures = 0
+        self._checking = threading.Lock()
+
+
+class ReplicaSet:
+    """Picks the replica for each lag-tolerant read.
+
+    ``strategy`` is 'round_robin' or 'least_loaded' (fewest checked-out
+    connections). A replica's replication lag is measured at most every
+    ``check_interval`` seconds, by whichever read comes along first, and
+    replicas more than ``max_lag`` seconds behind (or not replicating) are
+    skipped until they catch up. Replicas that fail are skipped for
+    ``retry_after`` seconds. ``choose`` returns None when no replica is
+    usable, and the read goes to the primary.
+    """
+
+    STRATEGIES = ('round_robin', 'least_loaded')
+
+    def __init__(self, configs, pool_config=None, strategy='round_robin',
+                 max_lag=5.0, check_interval=5.0, retry_after=30.0):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f'Unknown replica strategy: {strategy}')
+        self.replicas = [Replica(config, pool_config) for config in configs]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'failures': 0, 'lag_skips': 0}
+
+    def _check_lag(self, replica):
+        try:
+            with replica.pool.connection() as conn:
+                replica.lag = replica.backend.replication_lag(conn)
+        except Exception as e:
+            self.failed(replica, e)
+            return
+        replica.checked_at = time.monotonic()
+
+    def _usable(self, replica, now):
+        if now < replica.down_until:
+            return False
+        stale = replica.checked_at is None or now - replica.checked_at >= self.check_interval
+        # Only one thread measures; the others use the last known lag
+        if stale and replica._checking.acquire(blocking=False):
+            try:
+                self._check_lag(replica)
+            finally:
+                replica._checking.release()
+            # The check itself may have failed
+            if now < replica.down_until:
+                return False
+        if replica.lag is None or replica.lag > self.max_lag:
+            with self._lock:
+                self._stats['lag_skips'] += 1
+            return False
+        return True
+
+    def choose(self):
+        now = time.monotonic()
+        usable = [replica for replica in self.replicas if self._usable(replica, now)]
+        if not usable:
+            with self._lock:
+                self._stats['primary_fallbacks'] += 1
+            return None
+        # Rotate the starting point so least_loaded ties are spread too
+        start = next(self._turn) % len(usable)
+        usable = usable[start:] + usable[:start]
+        replica = usable[0]
+        if self.strategy == 'least_loaded':
+            replica = min(usable, key=lambda r: r.pool.checked_out)
+        with self._lock:
+            replica.reads += 1
+            self._stats['replica_reads'] += 1
+        return replica
+
+    def failed(self, replica, error):
+        """Take a replica out of rotation for ``retry_after`` seconds"""
+        print(f"Replica {replica.name} unavailable for {self.retry_after:.0f}s: {error}")
+        with self._lock:
+            replica.down_until = time.monotonic() + self.retry_after
+            replica.failures += 1
+            self._stats['failures'] += 1
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.pool.dispose()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+        stats['replicas'] = len(self.replicas)
+        stats['down'] = sum(1 for replica in self.replicas if now < replica.down_until)
+        return stats
+
+    def details(self):
+        """Per-replica state for /api/stats"""
+        now = time.monotonic()
+        return [{
+            'name': replica.name,
+            'lag': replica.lag,
+            'down': now < replica.down_until,
+            'reads': replica.reads,
+            'failures': replica.failures,
+            'pool': replica.pool.stats(),
+        } for replica in self.replicas]
@@ -0,0 +1,218 @@
+# server/sharding.py
+import hashlib
+import heapq
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
+from database import Database
+
+
+class HashRing:
+    """Consistent hashing of device ids onto shard names.
+
+    Each shard owns ``vnodes`` points on a 64-bit ring and a device belongs
+    to the first point at or after its own hash. Adding a shard only moves
+    the devices that land on the new shard's points (about 1/N of them);
+    points depend only on shard names, so every process agrees.
+    """
+
+    def __init__(self, names, vnodes=128):
+        points = sorted(
+            (self._hash(f'{name}#{index}'), name)
+            for name in names for index in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def shard_for(self, device_id):
+        index = bisect(self._hashes, self._hash(device_id)) % len(self._hashes)
+        return self._names[index]
+
+
+class ShardedDatabase:
+    """Database facade over several shards, split by device_id.
+
+    All of a device's rows live on its shard, so per-device reads and
+    writes go to exactly one shard; batches are split per shard and the
+    results put back in input order. Fleet-wide reads run on every shard in
+    parallel and are merged. Row ids come from each shard's own sequence,
+    so they are only unique together with the device_id.
+
+    The calling thread does one shard's part itself and hands the others
+    to a thread pool; reads and writes have separate pools, so slow
+    fan-out reads cannot hold up batch writes. Each pool has one worker per
+    pooled shard connection (``workers`` overrides that), since a task
+    beyond that would only wait for a connection.
+    """
+
+    def __init__(self, shards, vnodes=128, workers=None):
+        if not shards:
+            raise ValueError('At least one shard is required')
+        self.shards = shards
+        self.ring = HashRing(shards, vnodes)
+        # Shards share one backend kind; migrations and maintenance run per
+        # shard (see members)
+        self.backend = next(iter(shards.values())).backend
+        self.replicas = None
+        if workers is None:
+            workers = sum(shard.pool.capacity for shard in shards.values())
+        self._readers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard-read')
+        self._writers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard-write')
+
+    def shard_for(self, device_id):
+        return self.shards[self.ring.shard_for(device_id)]
+
+    @staticmethod
+    def _run_all(executor, calls):
+        """Run the ``calls`` (no-argument callables) in parallel: the first
+        on this thread, the rest on ``executor``; results in call order"""
+        futures = [executor.submit(call) for call in calls[1:]]
+        first = calls[0]()
+        return [first] + [future.result() for future in futures]
+
+    def _fan_out(self, call):
+        """``call(shard)`` on every shard in parallel; results in shard order"""
+        return self._run_all(self._readers, [
+            lambda shard=shard: call(shard) for shard in self.shards.values()
+        ])
+
+    def _split(self, items, device_id):
+        """Group item indexes by shard name"""
+        groups = {}
+        for index, item in enumerate(items):
+            groups.setdefault(self.ring.shard_for(device_id(item)), []).append(index)
+        return groups
+
+    def _write_split(self, items, write, device_id=lambda item: item.device_id):
+        """Run ``write(shard, items)`` per shard and return its per-item
+        results in input order"""
+        if not items:
+            return []
+        groups = self._split(items, device_id)
+        results = [None] * len(items)
+
+        def run(name, indexes):
+            return indexes, write(self.shards[name], [items[index] for index in indexes])
+
+        done = self._run_all(self._writers, [
+            lambda name=name, indexes=indexes: run(name, indexes) for name, indexes in groups.items()
+        ])
+        for indexes, shard_results in done:
+            for index, result in zip(indexes, shard_results):
+                results[index] = result
+        return results
+
+    # Writes
+
+    def insert_location(self, location):
+        return self.shard_for(location.device_id).insert_location(location)
+
+    def insert_locations(self, locations, report_inserted=False):
+        return self._write_split(locations, lambda shard, items: shard.insert_locations(items, report_inserted))
+
+    def insert_device(self, device):
+        return self.shard_for(device.device_id).insert_device(device)
+
+    def insert_devices(self, devices):
+        return self._write_split(devices, lambda shard, items: shard.insert_devices(items))
+
+    def sync_devices(self, writes):
+        return self._write_split(
+            writes, lambda shard, items: shard.sync_devices(items),
+            device_id=lambda write: write[0].device_id
+        )
+
+    def insert_message(self, message):
+        return self.shard_for(message.device_id).insert_message(message)
+
+    def insert_messages(self, messages, report_inserted=False):
+        return self._write_split(messages, lambda shard, items: shard.insert_messages(items, report_inserted))
+
+    def insert_notification(self, notification):
+        return self.shard_for(notification.device_id).insert_notification(notification)
+
+    def insert_notifications(self, notifications, report_inserted=False):
+        return self._write_split(notifications, lambda shard, items: shard.insert_notifications(items, report_inserted))
+
+    def purge_ingest_keys(self, before):
+        return sum(self._fan_out(lambda shard: shard.purge_ingest_keys(before)))
+
+    # Per-device reads
+
+    def get_locations(self, device_id, *args, **kwargs):
+        return self.shard_for(device_id).get_locations(device_id, *args, **kwargs)
+
+    def get_track(self, device_id, *args, **kwargs):
+        return self.shard_for(device_id).get_track(device_id, *args, **kwargs)
+
+    def iter_locations(self, device_id, *args, **kwargs):
+        return self.shard_for(device_id).iter_locations(device_id, *args, **kwargs)
+
+    def get_telemetry(self, device_id, *args, **kwargs):
+        return self.shard_for(device_id).get_telemetry(device_id, *args, **kwargs)
+
+    def get_device_version(self, device_id):
+        return self.shard_for(device_id).get_device_version(device_id)
+
+    def get_device_info(self, device_id):
+        return self.shard_for(device_id).get_device_info(device_id)
+
+    # Fleet-wide reads
+
+    def get_latest_locations(self, limit=100000):
+        """Newest fix of the ``limit`` most recently active devices overall"""
+        rows = [row for rows in self._fan_out(lambda shard: shard.get_latest_locations(limit)) for row in rows]
+        return heapq.nlargest(limit, rows, key=lambda row: (row['created_at'], row['id']))
+
+    def get_locations_in_cells(self, cells, since=None, until=None, limit=1000):
+        """Newest-first merge of every shard's candidates"""
+        pages = self._fan_out(lambda shard: shard.get_locations_in_cells(cells, since, until, limit))
+        return list(heapq.merge(*pages, key=lambda row: row['created_at'], reverse=True))[:limit]
+
+    # Routing and housekeeping
+
+    def read_from_primary(self, enabled=True):
+        for shard in self.shards.values():
+            shard.read_from_primary(enabled)
+
+    def pool_stats(self):
+        """Pool counters summed over the shards"""
+        totals = {}
+        for shard in self.shards.values():
+            for key, value in shard.pool_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        totals['shards'] = len(self.shards)
+        return totals
+
+    def replica_stats(self):
+        return {}
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+        self._readers.shutdown(wait=False)
+        self._writers.shutdown(wait=False)
+
+
+def open_database(db_config, pool_config=None, shard_configs=None, replica_configs=None,
+                  replica_options=None):
+    """A Database, or a ShardedDatabase when ``shard_configs`` (name ->
+    config) is given; replicas only apply to an unsharded database"""
+    if not shard_configs:
+        return Database(db_config, pool_config, replica_configs, replica_options)
+    if replica_configs:
+        print("DB_REPLICAS ignored: not supported together with DB_SHARDS")
+    return ShardedDatabase({
+        name: Database(config, pool_config) for name, config in shard_configs.items()
+    })
+
+
+def members(db):
+    """``(name, Database)`` for each shard of ``db``; one unnamed entry when
+    it is not sharded"""
+    if isinstance(db, ShardedDatabase):
+        return list(db.shards.items())
+    return [(None, db)]
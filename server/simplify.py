@@ -0,0 +1,57 @@
+# server/simplify.py
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project(latitudes, longitudes):
+    """Equirectangular projection to meters around the track's mean latitude.
+
+    Accurate to well under a percent over the extent of a single track,
+    which is plenty for choosing which points to drop.
+    """
+    lat = np.radians(latitudes)
+    lon = np.radians(longitudes)
+    lat0 = lat.mean()
+    x = EARTH_RADIUS_M * (lon - lon[0]) * np.cos(lat0)
+    y = EARTH_RADIUS_M * (lat - lat0)
+    return x, y
+
+
+def douglas_peucker(latitudes, longitudes, tolerance_m):
+    """Indices of the points kept by Douglas-Peucker simplification.
+
+    Works on NumPy arrays: each split computes the distance of every point in
+    the segment to its chord in one vectorized pass, and an explicit stack
+    replaces recursion so long tracks cannot hit the recursion limit.
+    """
+    n = len(latitudes)
+    if n <= 2 or tolerance_m <= 0:
+        return np.arange(n)
+
+    x, y = project(np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64))
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        px = x[start + 1:end]
+        py = y[start + 1:end]
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px - x[start], py - y[start])
+        else:
+            distances = np.abs(dy * (px - x[start]) - dx * (py - y[start])) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance_m:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return np.flatnonzero(keep)
@@ -0,0 +1,37 @@
+# server/tests/conftest.py
+import os
+import sys
+import tempfile
+import pytest
+
+# Server modules are imported flat, as when running from server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config reads the environment on first import, which may come from any
+# test module, so the app's settings are fixed before collection
+os.environ.update({
+    'DB_BACKEND': 'sqlite',
+    'DB_PATH': os.path.join(tempfile.mkdtemp(prefix='phone-tracker-tests-'), 'tracker.db'),
+    'DB_SHARDS': '',
+    'DB_REPLICAS': '',
+    'LATEST_CACHE_WARM': '0',
+})
+
+
+def sqlite_config(path):
+    """db_config for an embedded database file"""
+    return {'backend': 'sqlite', 'path': str(path), 'busy_timeout': 5.0, 'synchronous': 'NORMAL'}
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The Flask app on a migrated SQLite database of its own"""
+    import app
+    from migrations import MigrationRunner
+    MigrationRunner(app.db).migrate()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,59 @@
+# server/tests/test_backends.py
+import sqlite3
+import pytest
+from backends import SQLiteBackend
+from conftest import sqlite_config
+from database import Database
+from migrations import MigrationRunner
+
+
+def locked_error(path):
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute('CREATE TABLE IF NOT EXISTS t (x)')
+    holder.execute('BEGIN IMMEDIATE')
+    try:
+        sqlite3.connect(path, timeout=0).execute('BEGIN IMMEDIATE')
+    except sqlite3.OperationalError as e:
+        return e
+    finally:
+        holder.close()
+
+
+def test_lock_contention_is_not_a_disconnect(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'tracker.db'))
+    error = locked_error(backend.path)
+    assert 'locked' in str(error)
+    assert not backend.is_disconnect(error)
+    assert not backend.is_disconnect(sqlite3.OperationalError('database is locked'))
+    assert not backend.is_disconnect(sqlite3.OperationalError('no such table: locations'))
+
+
+def test_unreadable_file_is_a_disconnect(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'missing' / 'tracker.db'))
+    with pytest.raises(sqlite3.OperationalError) as error:
+        backend.connect()
+    assert backend.is_disconnect(error.value)
+    # Without a result code the message decides
+    assert backend.is_disconnect(sqlite3.OperationalError('disk I/O error'))
+    assert not backend.is_disconnect(ValueError('unable to open'))
+
+
+def test_locked_replica_stays_in_rotation(tmp_path):
+    for name in ('primary', 'replica'):
+        MigrationRunner(Database(sqlite_config(tmp_path / f'{name}.db'))).migrate()
+    db = Database(
+        sqlite_config(tmp_path / 'primary.db'),
+        replicas=[sqlite_config(tmp_path / 'replica.db')]
+    )
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            with db.read_connection():
+                raise sqlite3.OperationalError('database is locked')
+        assert db.replica_stats()['failures'] == 0
+
+        with pytest.raises(sqlite3.OperationalError):
+            with db.read_connection():
+                raise sqlite3.OperationalError('disk I/O error')
+        assert db.replica_stats()['failures'] == 1
+    finally:
+        db.close()
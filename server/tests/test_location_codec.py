@@ -0,0 +1,127 @@
+# server/tests/test_location_codec.py
+import itertools
+import os
+import random
+import pytest
+import location_codec
+from location_codec import CodecError, FIELDS, decode, encode
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANDROID_CODEC = os.path.join(SERVER_DIR, '..', 'android_app', 'utils', 'location_codec.py')
+
+OPTIONAL = [name for name, _, bit in FIELDS if bit is not None]
+SCALES = {name: scale for name, scale, _ in FIELDS}
+
+RANGES = {
+    'latitude': (-90.0, 90.0),
+    'longitude': (-180.0, 180.0),
+    'altitude': (-500.0, 9000.0),
+    'accuracy': (0.0, 5000.0),
+    'speed': (0.0, 350.0),
+    'bearing': (0.0, 360.0),
+}
+
+# Two fixes as encoded by the version 1 codec (before client_seq)
+V1_BATCH = (
+    b'PTLB\x01\x03dev\x02\x05\x80\xaa\xef\xf4\x03\xa0\xc3\xeb\x7f\x80\xa0\xab\xfe\xf9b'
+    b'\x84\x07\x1b\xd0\x0f\xd0\x0f\x90N\xff\x04\xfa\x01\xd0\x8c\x01'
+)
+
+
+def random_fix(rng, fields):
+    fix = {}
+    for name in ('latitude', 'longitude', *fields):
+        if name == 'timestamp':
+            fix[name] = rng.randrange(0, 2 ** 43)
+        elif name == 'client_seq':
+            fix[name] = rng.randrange(0, 2 ** 63)
+        else:
+            fix[name] = rng.uniform(*RANGES[name])
+    return fix
+
+
+def assert_round_trip(device_id, fixes):
+    decoded_id, decoded = decode(encode(device_id, fixes))
+    assert decoded_id == device_id
+    assert len(decoded) == len(fixes)
+    for fix, result in zip(fixes, decoded):
+        assert result['device_id'] == device_id
+        for name in SCALES:
+            if fix.get(name) is None:
+                assert result[name] is None
+            elif SCALES[name] == 1:
+                assert result[name] == fix[name]
+            else:
+                # Half a fixed-point unit, plus float noise
+                assert abs(result[name] - fix[name]) <= 0.5 / SCALES[name] + 1e-9
+
+
+def test_random_batches_round_trip():
+    rng = random.Random(1234)
+    for _ in range(300):
+        fixes = [
+            random_fix(rng, [name for name in OPTIONAL if rng.random() < 0.5])
+            for _ in range(rng.randrange(0, 40))
+        ]
+        assert_round_trip(f'device-{rng.randrange(10 ** 6)}', fixes)
+
+
+@pytest.mark.parametrize('size', range(len(OPTIONAL) + 1))
+def test_every_combination_of_optional_fields(size):
+    rng = random.Random(size)
+    for fields in itertools.combinations(OPTIONAL, size):
+        assert_round_trip('d', [random_fix(rng, fields) for _ in range(3)])
+
+
+def test_reencoding_decoded_batch_is_stable():
+    rng = random.Random(7)
+    data = encode('d', [random_fix(rng, OPTIONAL) for _ in range(20)])
+    device_id, fixes = decode(data)
+    assert encode(device_id, fixes) == data
+
+
+def test_version_1_batch_decodes():
+    device_id, fixes = decode(V1_BATCH)
+    assert device_id == 'dev'
+    assert fixes == [
+        {'device_id': 'dev', 'latitude': 52.52, 'longitude': 13.405, 'timestamp': 1700000000000,
+         'altitude': None, 'accuracy': 4.5, 'speed': None, 'bearing': None, 'client_seq': None},
+        {'device_id': 'dev', 'latitude': 52.5201, 'longitude': 13.4051, 'timestamp': 1700000005000,
+         'altitude': -3.2, 'accuracy': None, 'speed': 1.25, 'bearing': 90.0, 'client_seq': None},
+    ]
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(CodecError):
+        decode(V1_BATCH[:4] + bytes([location_codec.VERSION + 1]) + V1_BATCH[5:])
+
+
+def test_truncated_batches_are_rejected():
+    rng = random.Random(99)
+    data = encode('device', [random_fix(rng, OPTIONAL) for _ in range(5)])
+    for end in range(len(data)):
+        with pytest.raises(CodecError):
+            decode(data[:end])
+
+
+@pytest.mark.parametrize('extra', [b'\x00', b'\x01\x02', b'PTLB'])
+def test_trailing_bytes_are_rejected(extra):
+    data = encode('device', [{'latitude': 1.0, 'longitude': 2.0}])
+    with pytest.raises(CodecError):
+        decode(data + extra)
+
+
+def test_missing_coordinates_are_rejected():
+    with pytest.raises(CodecError):
+        encode('device', [{'latitude': 1.0}])
+
+
+def _codec_body(path):
+    """Source without the path comment and the pointer to the other copy"""
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    return [line for line in lines[1:] if not line.startswith('Keep in sync with')]
+
+
+def test_android_copy_matches_server_codec():
+    assert _codec_body(ANDROID_CODEC) == _codec_body(location_codec.__file__)
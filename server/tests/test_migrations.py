@@ -0,0 +1,56 @@
+# server/tests/test_migrations.py
+import geo
+from conftest import sqlite_config
+from database import Database
+from migrations import MIGRATIONS, BatchedStep, MigrationRunner
+
+
+def test_geohash_backfill_walks_every_id_range(tmp_path, monkeypatch):
+    db = Database(sqlite_config(tmp_path / 'tracker.db'))
+    runner = MigrationRunner(db)
+    runner.migrate(3)
+    rows = [('d', (i % 170) - 85.0, (i % 350) - 175.0) for i in range(250)]
+    # Out-of-range fixes are skipped but must not stop the walk
+    rows[10] = ('d', 91.0, 0.0)
+    rows[200] = ('d', 0.0, 181.0)
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            'INSERT INTO locations (device_id, latitude, longitude) VALUES (%s, %s, %s)', rows)
+        cursor.execute('DELETE FROM locations WHERE id BETWEEN 100 AND 149')
+        conn.commit()
+
+    backfill, = [step for step in MIGRATIONS[3].steps if isinstance(step, BatchedStep)]
+    monkeypatch.setattr(backfill, 'batch_size', 16)
+    chunks = []
+    monkeypatch.setattr(BatchedStep, 'apply', _recording(BatchedStep.apply, chunks))
+    runner.migrate()
+
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, latitude, longitude, geohash FROM locations ORDER BY id')
+        stored = cursor.fetchall()
+    assert len(stored) == 200
+    for row_id, latitude, longitude, geohash in stored:
+        if row_id in (11, 201):
+            assert geohash is None
+        else:
+            assert geohash == geo.encode(latitude, longitude, 12)
+    # Ids 1-250 in chunks of 16, each visited once
+    assert chunks == [(i, min(i + 16, 250)) for i in range(0, 250, 16)]
+
+
+def _recording(apply, chunks):
+    """BatchedStep.apply noting the id bounds of each chunk"""
+    def record(self, cursor, dialect='mysql'):
+        execute = cursor.execute
+        def chunk(statement, params=()):
+            if statement.startswith('UPDATE'):
+                chunks.append(params)
+            return execute(statement, params)
+        cursor.execute = chunk
+        try:
+            return apply(self, cursor, dialect)
+        finally:
+            cursor.execute = execute
+    return record
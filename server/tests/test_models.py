@@ -0,0 +1,104 @@
+# server/tests/test_models.py
+import pytest
+from models import DeviceModel, LocationModel, MessageModel, ValidationError
+
+FIX = {'device_id': 'd', 'latitude': 52.52, 'longitude': 13.405}
+
+
+def with_fields(**changes):
+    data = dict(FIX)
+    for name, value in changes.items():
+        if value is ...:
+            del data[name]
+        else:
+            data[name] = value
+    return data
+
+
+def test_location_decodes_and_coerces():
+    location = LocationModel.decode(with_fields(latitude='52.5', timestamp=1.7e12, speed=3))
+    assert location.latitude == 52.5
+    assert location.timestamp == 1700000000000 and type(location.timestamp) is int
+    assert location.speed == 3.0 and type(location.speed) is float
+    assert location.altitude is None
+
+
+@pytest.mark.parametrize('changes, field', [
+    ({'device_id': ...}, 'device_id'),
+    ({'device_id': ''}, 'device_id'),
+    ({'latitude': ...}, 'latitude'),
+    ({'longitude': None}, 'longitude'),
+])
+def test_missing_fields_are_rejected(changes, field):
+    with pytest.raises(ValidationError) as error:
+        LocationModel.decode(with_fields(**changes))
+    assert error.value.field == field
+
+
+@pytest.mark.parametrize('changes, field', [
+    ({'latitude': 'north'}, 'latitude'),
+    ({'latitude': True}, 'latitude'),
+    ({'longitude': [13.4]}, 'longitude'),
+    ({'altitude': 'nan'}, 'altitude'),
+    ({'speed': 'inf'}, 'speed'),
+    ({'timestamp': 1.5}, 'timestamp'),
+    ({'client_seq': 'next'}, 'client_seq'),
+    ({'device_id': {'id': 1}}, 'device_id'),
+])
+def test_mistyped_fields_are_rejected(changes, field):
+    with pytest.raises(ValidationError) as error:
+        LocationModel.decode(with_fields(**changes))
+    assert error.value.field == field
+
+
+@pytest.mark.parametrize('changes, field', [
+    ({'latitude': 90.5}, 'latitude'),
+    ({'longitude': -180.01}, 'longitude'),
+    ({'timestamp': 2 ** 63}, 'timestamp'),
+    ({'device_id': 'x' * 256}, 'device_id'),
+])
+def test_out_of_range_fields_are_rejected(changes, field):
+    with pytest.raises(ValidationError) as error:
+        LocationModel.decode(with_fields(**changes))
+    assert error.value.field == field
+
+
+def test_other_models_check_their_limits():
+    with pytest.raises(ValidationError) as error:
+        DeviceModel.decode({'device_id': 'd', 'sdk_version': 2 ** 31})
+    assert error.value.field == 'sdk_version'
+    with pytest.raises(ValidationError) as error:
+        MessageModel.decode({'device_id': 'd', 'read_status': 'maybe'})
+    assert error.value.field == 'read_status'
+    assert MessageModel.decode({'device_id': 'd', 'read_status': 'true'}).read_status is True
+
+
+def test_payload_must_be_an_object():
+    with pytest.raises(ValidationError) as error:
+        LocationModel.decode([FIX])
+    assert error.value.field is None
+
+
+def test_decode_many_keeps_going_past_errors():
+    valid, errors = LocationModel.decode_many([FIX, with_fields(latitude=91), FIX])
+    assert [index for index, _ in valid] == [0, 2]
+    assert [(index, error.field) for index, error in errors] == [(1, 'latitude')]
+
+
+@pytest.mark.parametrize('changes, field', [
+    ({'latitude': ...}, 'latitude'),
+    ({'latitude': 'north'}, 'latitude'),
+    ({'longitude': 200}, 'longitude'),
+])
+def test_invalid_location_gets_400(client, changes, field):
+    response = client.post('/api/location', json=with_fields(**changes))
+    assert response.status_code == 400
+    assert response.json['field'] == field
+
+
+def test_invalid_batch_entry_is_reported_per_index(client):
+    response = client.post('/api/locations/batch', json=[with_fields(latitude=91)])
+    assert response.status_code == 400
+    assert response.json['results'] == [
+        {'index': 0, 'error': 'latitude out of range', 'field': 'latitude'}
+    ]
@@ -0,0 +1,105 @@
+# server/tests/test_pool.py
+import threading
+import time
+import pytest
+from pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def rollback(self):
+        pass
+
+
+def ping(conn):
+    if not conn.alive:
+        raise ConnectionError('server has gone away')
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    return ConnectionPool(connect, ping=ping, **kwargs), opened
+
+
+def test_acquire_times_out_when_every_connection_is_out():
+    pool, _ = make_pool(size=1, max_overflow=1, timeout=0.05)
+    held = [pool.acquire(), pool.acquire()]
+    started = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+    # A release lets the next caller in
+    pool.release(held.pop())
+    pool.acquire()
+
+
+def test_dead_idle_connection_is_replaced():
+    pool, opened = make_pool(size=1, max_overflow=0, ping_after=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.alive = False
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert conn.closed
+    assert len(opened) == 2
+    stats = pool.stats()
+    assert stats['failed_pings'] == 1
+    assert stats['connections_closed'] == 1
+    assert stats['total'] == 1
+
+
+def test_old_connection_is_recycled():
+    pool, _ = make_pool(size=1, max_overflow=0, recycle=0.01, pre_ping=False)
+    conn = pool.acquire()
+    pool.release(conn)
+    time.sleep(0.02)
+    assert pool.acquire() is not conn
+    assert conn.closed
+    assert pool.stats()['recycled'] == 1
+
+
+def test_stats_add_up_under_concurrency():
+    # Overflow connections are opened and closed on every checkout
+    pool, opened = make_pool(size=0, max_overflow=8, timeout=5)
+
+    def work():
+        for _ in range(200):
+            with pool.connection():
+                pass
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert stats['checkouts'] == 1600
+    assert stats['connections_opened'] == len(opened) == 1600
+    assert stats['connections_closed'] == 1600
+
+
+def test_exhausted_pool_answers_503(app_module, client, monkeypatch):
+    pool = app_module.db.pool
+    monkeypatch.setattr(pool, 'timeout', 0.05)
+    held = [pool.acquire() for _ in range(pool.capacity)]
+    try:
+        response = client.get('/api/locations/some-device')
+    finally:
+        for conn in held:
+            pool.release(conn)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert client.get('/api/locations/some-device').status_code == 200
@@ -0,0 +1,49 @@
+# server/tests/test_pubsub.py
+from pubsub import LocationBroker
+
+
+def fix(device_id, fix_id):
+    return {'device_id': device_id, 'id': fix_id}
+
+
+def test_subscribers_get_only_their_devices():
+    broker = LocationBroker()
+    everything = broker.subscribe()
+    some = broker.subscribe(['a'])
+    nothing = broker.subscribe([])
+    broker.publish(fix('a', 1))
+    broker.publish(fix('b', 2))
+    assert [row['id'] for _, row in everything.get(0)] == [1, 2]
+    assert [row['id'] for _, row in some.get(0)] == [1]
+    assert nothing.get(0) == []
+
+
+def test_pending_fixes_coalesce_per_device():
+    broker = LocationBroker()
+    subscription = broker.subscribe()
+    for fix_id in range(5):
+        broker.publish(fix('a', fix_id))
+    broker.publish(fix('b', 10))
+    assert [row['id'] for _, row in subscription.get(0)] == [4, 10]
+    assert broker.stats()['coalesced'] == 4
+
+
+def test_reconnect_replays_missed_fixes():
+    broker = LocationBroker()
+    first = broker.subscribe(['a'])
+    broker.publish(fix('a', 1))
+    (last_event_id, _), = first.get(0)
+    first.close()
+    broker.publish(fix('a', 2))
+    broker.publish(fix('b', 3))
+    again = broker.subscribe(['a'], last_event_id)
+    assert not again.gap
+    assert [row['id'] for _, row in again.get(0)] == [2]
+    assert broker.subscribe(['a'], 'elsewhere-1').gap
+
+
+def test_stream_needs_at_least_one_device(client):
+    response = client.get('/api/stream/locations?device_ids=')
+    assert response.status_code == 400
+    response = client.get('/api/stream/locations?device_ids=,,')
+    assert response.status_code == 400
@@ -0,0 +1,56 @@
+# server/tests/test_ratelimit.py
+import pytest
+from ratelimit import IngestLimiter, RateLimitedError, UploadTooLargeError
+
+
+def limiter(**kwargs):
+    options = {'rate': 1.0, 'burst': 60, 'global_rate': 0, 'global_burst': 4000}
+    options.update(kwargs)
+    return IngestLimiter(**options)
+
+
+def test_batch_is_charged_one_token_per_row():
+    ingest = limiter()
+    ingest.acquire({'a': 60})
+    with pytest.raises(RateLimitedError) as error:
+        ingest.acquire({'a': 1})
+    # The bucket is empty: about a second until one more row fits
+    assert 0.5 < error.value.retry_after <= 1.0
+    # Other devices have their own bucket
+    ingest.acquire({'b': 60})
+
+
+def test_rows_drain_the_bucket_across_uploads():
+    ingest = limiter()
+    for _ in range(3):
+        ingest.acquire({'a': 20})
+    with pytest.raises(RateLimitedError):
+        ingest.acquire({'a': 20})
+    assert ingest.stats()['rejected_device'] == 1
+
+
+def test_global_bucket_is_charged_the_whole_upload():
+    ingest = limiter(rate=0, global_rate=1.0, global_burst=100)
+    ingest.acquire({'a': 40, 'b': 40})
+    with pytest.raises(RateLimitedError):
+        ingest.acquire({'c': 40})
+    assert ingest.stats()['rejected_global'] == 1
+
+
+def test_upload_bigger_than_a_bucket_is_refused():
+    ingest = limiter(global_rate=1.0, global_burst=100)
+    with pytest.raises(UploadTooLargeError):
+        ingest.acquire({'a': 61})
+    with pytest.raises(UploadTooLargeError):
+        ingest.acquire({'a': 60, 'b': 60})
+    # Nothing was taken
+    ingest.acquire({'a': 60})
+    assert ingest.stats()['rejected_too_large'] == 2
+
+
+def test_rejected_upload_takes_nothing():
+    ingest = limiter(global_rate=1.0, global_burst=100)
+    ingest.acquire({'a': 50})
+    with pytest.raises(RateLimitedError):
+        ingest.acquire({'a': 20, 'b': 20})
+    ingest.acquire({'b': 50})
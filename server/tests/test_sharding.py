@@ -0,0 +1,202 @@
+# server/tests/test_sharding.py
+from contextlib import contextmanager
+import pytest
+import geo
+import rebalance
+from conftest import sqlite_config
+from database import Database
+from migrations import MigrationRunner
+from models import DeviceModel, LocationModel
+from sharding import HashRing, ShardedDatabase
+
+
+def open_shards(tmp_path, names):
+    shards = {}
+    for name in names:
+        shards[name] = Database(sqlite_config(tmp_path / f'{name}.db'))
+        MigrationRunner(shards[name]).migrate()
+    return ShardedDatabase(shards)
+
+
+def fix(device_id, index, client_seq=None):
+    return LocationModel(device_id, 10 + index / 1000, 20 + index / 1000, client_seq=client_seq)
+
+
+def rows(shard, query, params=()):
+    with shard.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def test_ring_placement_is_stable_and_moves_little():
+    device_ids = [f'device-{i}' for i in range(3000)]
+    ring = HashRing(['a', 'b', 'c'])
+    placement = {device_id: ring.shard_for(device_id) for device_id in device_ids}
+    # Only names matter, not their order
+    assert placement == {device_id: HashRing(['c', 'a', 'b']).shard_for(device_id) for device_id in device_ids}
+    for name in 'abc':
+        assert 800 < list(placement.values()).count(name) < 1200
+
+    grown = HashRing(['a', 'b', 'c', 'd'])
+    moved = [device_id for device_id in device_ids if grown.shard_for(device_id) != placement[device_id]]
+    # Devices only move to the new shard, about a quarter of them
+    assert all(grown.shard_for(device_id) == 'd' for device_id in moved)
+    assert 500 < len(moved) < 1000
+
+
+def test_batches_are_split_by_shard_and_merged_back(tmp_path):
+    db = open_shards(tmp_path, ['a', 'b', 'c'])
+    try:
+        fixes = [fix(f'device-{i % 12}', i) for i in range(60)]
+        ids = db.insert_locations(fixes)
+        assert len(ids) == 60 and None not in ids
+        for device_number in range(12):
+            device_id = f'device-{device_number}'
+            home = db.shard_for(device_id)
+            for shard in db.shards.values():
+                count, = rows(shard, 'SELECT COUNT(*) FROM locations WHERE device_id = %s', (device_id,))[0]
+                assert count == (5 if shard is home else 0)
+            # Per-input ids come back from the device's own shard
+            stored = {row['id']: row['latitude'] for row in db.get_locations(device_id, limit=10)}
+            for index in range(device_number, 60, 12):
+                assert stored[ids[index]] == fixes[index].latitude
+
+        latest = db.get_latest_locations()
+        assert sorted(row['device_id'] for row in latest) == sorted(f'device-{i}' for i in range(12))
+        assert len(db.get_latest_locations(limit=5)) == 5
+
+        cells = sorted(geo.best_cover(9.9, 19.9, 10.1, 20.1, range(1, 9)))
+        found = db.get_locations_in_cells(cells, limit=20)
+        assert len(found) == 20
+        assert [row['created_at'] for row in found] == sorted((row['created_at'] for row in found), reverse=True)
+    finally:
+        db.close()
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after_commits(monkeypatch, shards, limit):
+    """Make the ``limit``-th commit on any of ``shards`` raise once it has
+    gone through, as if the process died right after it"""
+    commits = [0]
+
+    class Connection:
+        def __init__(self, conn):
+            self._conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+        def commit(self):
+            self._conn.commit()
+            commits[0] += 1
+            if commits[0] == limit:
+                raise Interrupted
+
+    for shard in shards:
+        get_connection = shard.get_connection
+
+        @contextmanager
+        def wrapped(discard_on_error=False, get_connection=get_connection):
+            with get_connection(discard_on_error) as conn:
+                yield Connection(conn)
+
+        monkeypatch.setattr(shard, 'get_connection', wrapped)
+    return commits
+
+
+def misplaced_device(db, source_name):
+    return next(
+        f'device-{i}' for i in range(1000) if db.ring.shard_for(f'device-{i}') != source_name
+    )
+
+
+def fill_source(db, source_name, device_id):
+    """History, upload keys and telemetry for ``device_id`` on the wrong
+    shard, plus a sample it already reported to its new shard"""
+    source = db.shards[source_name]
+    target = db.shard_for(device_id)
+    source.insert_locations([fix(device_id, i, client_seq=i) for i in range(25)])
+    for battery_level in (80, 70):
+        source.sync_devices([(DeviceModel(device_id, battery_level=battery_level), None, 0)])
+    target.sync_devices([(DeviceModel(device_id, battery_level=60), None, 0)])
+    return source, target
+
+
+def state(shard, device_id):
+    return {
+        'locations': sorted(rows(
+            shard, 'SELECT latitude, longitude FROM locations WHERE device_id = %s', (device_id,))),
+        'keys': sorted(rows(shard, """
+            SELECT k.client_seq, l.latitude FROM ingest_keys k
+            JOIN locations l ON l.id = k.row_id
+            WHERE k.device_id = %s AND k.kind = 'locations'""", (device_id,))),
+        'telemetry': sorted(rows(
+            shard, 'SELECT battery_level FROM device_telemetry WHERE device_id = %s', (device_id,))),
+        'rollups': sorted(rows(shard, """
+            SELECT resolution, samples, battery_level_min, battery_level_max,
+                   battery_level_sum, battery_level_count
+            FROM device_telemetry_rollups WHERE device_id = %s""", (device_id,))),
+        'devices': rows(shard, 'SELECT COUNT(*) FROM devices WHERE device_id = %s', (device_id,)),
+        'moves': rows(shard, 'SELECT COUNT(*) FROM shard_moves'),
+    }
+
+
+def test_move_device_moves_everything_once(tmp_path):
+    db = open_shards(tmp_path, ['a', 'b'])
+    try:
+        device_id = misplaced_device(db, 'a')
+        source, target = fill_source(db, 'a', device_id)
+        counts = rebalance.move_device('a', source, target, device_id, batch_size=10)
+        assert counts == {'locations': 25, 'messages': 0, 'notifications': 0, 'device_telemetry': 2}
+        moved = state(target, device_id)
+        assert moved['locations'] == sorted((10 + i / 1000, 20 + i / 1000) for i in range(25))
+        assert moved['keys'] == [(i, 10 + i / 1000) for i in range(25)]
+        assert moved['telemetry'] == [(60,), (70,), (80,)]
+        assert moved['rollups'] == [('day', 3, 60, 80, 210, 3), ('hour', 3, 60, 80, 210, 3)]
+        assert moved['devices'] == [(1,)] and moved['moves'] == [(0,)]
+        left = state(source, device_id)
+        assert not left['locations'] and not left['telemetry'] and not left['rollups']
+        assert left['devices'] == [(0,)]
+        assert rebalance.misplaced_devices(db, 'a') == {}
+    finally:
+        db.close()
+
+
+def commits_in_a_move(tmp_path, monkeypatch):
+    db = open_shards(tmp_path, ['a', 'b'])
+    try:
+        device_id = misplaced_device(db, 'a')
+        source, target = fill_source(db, 'a', device_id)
+        with monkeypatch.context() as patch:
+            commits = interrupt_after_commits(patch, [source, target], None)
+            rebalance.move_device('a', source, target, device_id, batch_size=10)
+        return commits[0], state(target, device_id)
+    finally:
+        db.close()
+
+
+def test_interrupted_move_can_be_rerun(tmp_path, monkeypatch):
+    (tmp_path / 'reference').mkdir()
+    total, expected = commits_in_a_move(tmp_path / 'reference', monkeypatch)
+    assert total > 10
+    for limit in range(1, total + 1):
+        directory = tmp_path / str(limit)
+        directory.mkdir()
+        db = open_shards(directory, ['a', 'b'])
+        try:
+            device_id = misplaced_device(db, 'a')
+            source, target = fill_source(db, 'a', device_id)
+            with monkeypatch.context() as patch:
+                interrupt_after_commits(patch, [source, target], limit)
+                with pytest.raises(Interrupted):
+                    rebalance.move_device('a', source, target, device_id, batch_size=10)
+            rebalance.move_device('a', source, target, device_id, batch_size=10)
+            assert state(target, device_id) == expected, f'interrupted after commit {limit}'
+            left = state(source, device_id)
+            assert not left['locations'] and not left['telemetry'] and not left['rollups']
+        finally:
+            db.close()
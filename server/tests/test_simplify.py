@@ -0,0 +1,40 @@
+# server/tests/test_simplify.py
+import numpy as np
+import pytest
+from simplify import douglas_peucker
+
+
+def test_straight_line_keeps_its_ends():
+    latitudes = np.linspace(52.0, 52.01, 50)
+    longitudes = np.full(50, 13.0)
+    assert douglas_peucker(latitudes, longitudes, 1.0).tolist() == [0, 49]
+
+
+def test_corner_is_kept():
+    latitudes = np.array([52.0, 52.005, 52.01, 52.01, 52.01])
+    longitudes = np.array([13.0, 13.0, 13.0, 13.01, 13.02])
+    assert douglas_peucker(latitudes, longitudes, 5.0).tolist() == [0, 2, 4]
+
+
+def test_nothing_is_dropped_below_the_tolerance():
+    rng = np.random.default_rng(3)
+    latitudes = 52.0 + rng.uniform(0, 0.01, 30)
+    longitudes = 13.0 + rng.uniform(0, 0.01, 30)
+    assert douglas_peucker(latitudes, longitudes, 0.001).tolist() == list(range(30))
+
+
+@pytest.mark.parametrize('simplify', ['0', '-5', 'nan', 'inf', '-inf', 'abc', ''])
+def test_invalid_tolerance_gets_400(client, simplify):
+    response = client.get(f'/api/locations/some-device?simplify={simplify}')
+    assert response.status_code == 400
+    assert 'simplify' in response.json['error']
+
+
+def test_simplified_track(client):
+    fixes = [{'device_id': 'simplified', 'latitude': 52.0 + i / 10000, 'longitude': 13.0} for i in range(20)]
+    assert client.post('/api/locations/batch', json=fixes).status_code == 201
+    response = client.get('/api/locations/simplified?simplify=5')
+    assert response.status_code == 200
+    # Newest first, like the unsimplified history
+    assert [row['latitude'] for row in response.json['data']] == [52.0019, 52.0]
+    assert response.json['raw_points'] == 20